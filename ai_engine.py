@@ -1 +1,178 @@
-# ai_engine.py - AI logic (if any)
+"""
+Colour Balls AI Engine Module
+Searches piece placements and plays the game headlessly or as a hint provider
+"""
+
+import logging
+from collections import namedtuple
+from bitboard import popcount
+
+logger = logging.getLogger(__name__)
+
+# Heuristic weights for a board after a placement has been resolved
+DEFAULT_WEIGHTS = {
+    'score': 1.0,              # Points earned by the placement (matches and chains)
+    'pairs': 2.0,              # Same-colored neighbours in any direction: matches waiting to happen
+    'aggregate_height': -0.5,  # Sum of column heights
+    'max_height': -1.0,        # Tallest column
+    'holes': -4.0,             # Empty cells with a ball somewhere above them
+    'bumpiness': -0.5,         # Sum of height differences between neighbouring columns
+}
+
+# Score given to placements after which the next piece can't spawn
+TOPPED_OUT_SCORE = -1e9
+
+# A candidate placement: where the piece lands, how to get it there, and how good it is
+Placement = namedtuple('Placement', ['x', 'y', 'orientation', 'actions', 'score'])
+
+
+class AIPlayer:
+    """Picks placements for the current piece by trying every reachable one.
+
+    Candidates are all positions reachable by rotating in place (with the same
+    wall kicks as GameState), sliding sideways and hard dropping. Each one is
+    tried directly on the GameState's bitboard and undone from a snapshot, so
+    no GameState is ever copied. Matches and chain reactions are resolved the
+    same way the game does before the resulting board is scored.
+    """
+
+    def __init__(self, weights=None, lookahead=False):
+        """
+        Args:
+            weights: Overrides for DEFAULT_WEIGHTS
+            lookahead: Also place the next piece (next_piece_colors) on every
+                       candidate board and score by the best pair of placements
+        """
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.lookahead = lookahead
+        self.evaluations = 0  # Boards scored so far, for benchmarking
+        self._plan = []
+        self._planned_piece = None
+
+    def find_placements(self, game_state):
+        """Returns every reachable placement of the current piece, best first."""
+        piece = game_state.current_piece
+        if not piece or game_state.game_over:
+            return []
+        colors = piece['colors']
+        next_colors = game_state.next_piece_colors if self.lookahead else None
+
+        placements = []
+        for x, y, orientation, actions in self._reachable(game_state, colors, piece['x'], piece['y'],
+                                                          piece['orientation']):
+            score = self._try_placement(game_state, colors, x, y, orientation, next_colors)
+            placements.append(Placement(x, y, orientation, actions, score))
+        placements.sort(key=lambda placement: placement.score, reverse=True)
+        return placements
+
+    def best_placement(self, game_state):
+        """Returns the highest scoring Placement, or None if there is no piece to place."""
+        placements = self.find_placements(game_state)
+        return placements[0] if placements else None
+
+    def next_action(self, game_state):
+        """Returns the next action towards the best placement (plans once per piece).
+
+        Fits the simulator's policy signature, so an AIPlayer can drive headless games.
+        """
+        piece = game_state.current_piece
+        if piece is None:
+            return 'move_down'
+        if piece is not self._planned_piece or not self._plan:
+            best = self.best_placement(game_state)
+            self._plan = list(best.actions) if best else ['hard_drop']
+            self._planned_piece = piece
+        return self._plan.pop(0)
+
+    def _reachable(self, game_state, colors, x, y, orientation):
+        """Yields (x, landing_y, orientation, actions) for each distinct reachable placement."""
+        seen = set()
+        rotations = 0
+        while rotations < 4:
+            for direction, action in ((0, None), (-1, 'move_left'), (1, 'move_right')):
+                slide_x = x
+                steps = 0
+                while True:
+                    if (slide_x, orientation) not in seen:
+                        seen.add((slide_x, orientation))
+                        actions = ['rotate'] * rotations + [action] * steps + ['hard_drop']
+                        yield slide_x, game_state._landing_row(colors, slide_x, y, orientation), orientation, actions
+                    if direction == 0 or game_state._is_collision(colors, slide_x + direction, y, orientation):
+                        break
+                    slide_x += direction
+                    steps += 1
+
+            target = game_state._rotation_target(colors, x, y, orientation)
+            if target is None:
+                break
+            x, orientation = target
+            rotations += 1
+
+    def _try_placement(self, game_state, colors, x, y, orientation, next_colors=None):
+        """Locks a piece on the board, scores the result and puts the board back."""
+        board = game_state._board
+        saved = board.snapshot()
+        try:
+            cells = []
+            for color, (row_offset, col_offset) in zip(colors, game_state._piece_offsets[orientation]):
+                row, col = y + row_offset, x + col_offset
+                board.set(row, col, color)
+                cells.append((row, col))
+            points = self._resolve(game_state, board, cells)
+
+            # Game over if the next piece couldn't spawn
+            if game_state._is_collision(game_state.next_piece_colors or colors, game_state._spawn_x, 0, 0):
+                return TOPPED_OUT_SCORE
+
+            if next_colors:
+                best_next = max((self._try_placement(game_state, next_colors, next_x, next_y, next_orientation)
+                                 for next_x, next_y, next_orientation, _ in
+                                 self._reachable(game_state, next_colors, game_state._spawn_x, 0, 0)),
+                                default=TOPPED_OUT_SCORE)
+                return points * self.weights['score'] + best_next
+            return points * self.weights['score'] + self._board_score(board)
+        finally:
+            board.restore(saved)
+
+    def _resolve(self, game_state, board, changed_positions):
+        """Clears matches and chain reactions the way the game does; returns points earned."""
+        matched, matches_found = board.find_match_mask(changed_positions)
+        if not matches_found:
+            return 0
+        chain_reactions = 0
+        while matched:
+            board.clear_mask(matched)
+            moved = [(to_row, col) for _, col, to_row in board.apply_gravity()]
+            matched, chain_matches = board.find_match_mask(moved)
+            if chain_matches:
+                chain_reactions += 1
+        return matches_found * game_state.MATCH_POINTS + chain_reactions * game_state.CHAIN_BONUS
+
+    def _board_score(self, board):
+        """Weighted sum of the board heuristics."""
+        self.evaluations += 1
+        heights = []
+        holes = 0
+        for column in board.column_masks:
+            balls = board.occupied & column
+            if not balls:
+                heights.append(0)
+                continue
+            top_row = ((balls & -balls).bit_length() - 1) // board.stride
+            height = board.height - top_row
+            heights.append(height)
+            holes += height - popcount(balls)
+
+        pairs = 0
+        for bits in board.colors:
+            if bits:
+                for shift in board.direction_shifts:
+                    pairs += popcount(bits & (bits >> shift))
+
+        bumpiness = sum(abs(heights[i] - heights[i + 1]) for i in range(len(heights) - 1))
+        weights = self.weights
+        return (weights['pairs'] * pairs +
+                weights['aggregate_height'] * sum(heights) +
+                weights['max_height'] * max(heights) +
+                weights['holes'] * holes +
+                weights['bumpiness'] * bumpiness)
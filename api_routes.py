@@ -3,129 +3,403 @@ Colour Balls API Routes Module
 Contains the Flask API endpoints for the game
 """
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, g, jsonify, request, stream_with_context
+import json
+import logging
 import time
+from ai_engine import AIPlayer
+from game_config import VARIANTS, get_variant
 from game_logic import GameState 
+from metrics import ACTION_SECONDS, REQUESTS, REQUEST_SECONDS, SERIALIZE_SECONDS, Gauge
+from replay import encode_log
+from state_token import InvalidStateToken
+from tick_scheduler import TickScheduler
+
+logger = logging.getLogger(__name__)
 
 # Create a Blueprint for the API routes
 api = Blueprint('api', __name__, url_prefix='/api')
 
-# Game state instance will be injected from app.py
-game_state = None
+# Cookie (or X-Session-ID header for non-browser clients) identifying a player's game
+SESSION_COOKIE = 'colour_balls_session'
+
+# Header carrying the state version the client holds; responses are deltas against it
+STATE_VERSION_HEADER = 'X-State-Version'
+
+# Stateless mode: cookie (or header) carrying the signed game state between requests
+STATE_TOKEN_COOKIE = 'colour_balls_state'
+STATE_TOKEN_HEADER = 'X-State-Token'
+
+# Upper bound on the number of actions accepted by /api/actions in one request
+MAX_BATCH_ACTIONS = 64
+
+# Seconds between keep-alive comments on an idle server-sent events stream
+STREAM_HEARTBEAT_INTERVAL = 15
+
+# Session registry will be injected from app.py
+sessions = None
+
+# Gravity clock for sessions with an open stream
+scheduler = None
+
+# StateSigner when running stateless (the game travels with each request), else None
+state_signer = None
+
+# Builds the GameStates this server plays (the registry's factory, e.g. InstrumentedGameState)
+state_factory = GameState
+
+def init_routes(session_registry, tick_scheduler=None, signer=None):
+    """Initialize the routes with the session registry and (optionally) the gravity scheduler.
+    
+    Passing a StateSigner switches to stateless mode: the registry is not used and
+    every response carries the signed game state for the client to send back.
+    """
+    global sessions, scheduler, state_signer, state_factory
+    sessions = session_registry
+    scheduler = tick_scheduler or TickScheduler(_gravity_tick)
+    state_signer = signer
+    state_factory = session_registry.state_factory if session_registry is not None else GameState
+    
+    # Read only when /metrics is scraped
+    Gauge('colour_balls_live_sessions', 'Games held in memory by the session registry',
+          lambda: len(sessions) if sessions is not None else 0)
+    Gauge('colour_balls_streaming_sessions', 'Sessions with an open /api/stream', lambda: len(scheduler))
+    Gauge('colour_balls_tick_lag_max_seconds', 'Worst lateness of a gravity tick so far', lambda: scheduler.max_lag)
+
+def _current_game_state():
+    """Return the GameState for the requesting player, creating a session if needed"""
+    if state_signer is not None:
+        return _token_game_state()
+    if sessions is None:
+        return None
+    session_id = request.cookies.get(SESSION_COOKIE) or request.headers.get('X-Session-ID')
+    session_id, game_state, _ = sessions.get_or_create(session_id)
+    g.session_id = session_id
+    return game_state
+
+def _token_game_state():
+    """Stateless mode: rebuild the game from the client's signed state token"""
+    if 'game_state' not in g:
+        token = request.headers.get(STATE_TOKEN_HEADER) or request.cookies.get(STATE_TOKEN_COOKIE)
+        # No token yet means a new player; a bad one raises InvalidStateToken (400)
+        g.game_state = state_signer.load(token, state_factory) if token else state_factory()
+    return g.game_state
+
+@api.errorhandler(InvalidStateToken)
+def reject_state_token(error):
+    """Tampered or foreign state tokens are refused outright"""
+    logger.warning("Rejected state token: %s", error)
+    response = jsonify({"error": "Invalid state token"})
+    response.delete_cookie(STATE_TOKEN_COOKIE)
+    return response, 400
+
+def _state_payload(game_state):
+    """State to send back: a delta when the client says which version it already has"""
+    since_version = request.headers.get(STATE_VERSION_HEADER, type=int)
+    return game_state.get_state_delta(since_version)
+
+def _state_response(game_state, extra=None):
+    """JSON response carrying _state_payload() (plus any extra keys), timing the encoding"""
+    payload = _state_payload(game_state)
+    if extra:
+        payload |= extra
+    start = time.perf_counter()
+    response = jsonify(payload)
+    SERIALIZE_SECONDS.observe(time.perf_counter() - start)
+    return response
 
-def init_routes(game_state_instance):
-    """Initialize the routes with the game state instance"""
-    global game_state
-    game_state = game_state_instance
+@api.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_request
+def record_request_metrics(response):
+    """Count the request and record how long it took, per endpoint"""
+    endpoint = request.endpoint.removeprefix('api.') if request.endpoint else 'unmatched'
+    REQUESTS.inc((endpoint, response.status_code))
+    started = g.get('request_started')
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, (endpoint,))
+    return response
+
+@api.after_request
+def set_session_cookie(response):
+    """Hand the session ID back to the client whenever it changed"""
+    session_id = g.get('session_id')
+    if session_id and request.cookies.get(SESSION_COOKIE) != session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+        response.headers['X-Session-ID'] = session_id
+    game_state = g.get('game_state')
+    if game_state is not None:
+        # Stateless mode: hand back the game as it is after this request
+        token = state_signer.sign(game_state)
+        response.set_cookie(STATE_TOKEN_COOKIE, token, httponly=True, samesite='Lax')
+        response.headers[STATE_TOKEN_HEADER] = token
+    return response
 
 @api.route('/state', methods=['GET'])
 def get_state():
     """Get the current game state"""
+    game_state = _current_game_state()
     if game_state:
-        return jsonify(game_state.get_state_dict())
+        with game_state.lock:
+            return _state_response(game_state)
     return jsonify({"error": "Game state not initialized"}), 500
 
 @api.route('/action', methods=['POST'])
 def handle_action():
     """Handle player actions (e.g., move, rotate, drop piece)"""
+    game_state = _current_game_state()
     if not game_state:
         return jsonify({"error": "Game state not initialized"}), 500
 
-    if game_state.game_over:
-        return jsonify({"error": "Game is over", "state": game_state.get_state_dict()}), 400
-    
     data = request.get_json()
     action_type = data.get('type', '')
     action_data = data.get('data', {})
     
+    # One action at a time per game; a gravity tick or another tab waits its turn
+    with game_state.lock:
+        if game_state.game_over:
+            return jsonify({"error": "Game is over", "state": game_state.get_state_dict()}), 400
+        
+        result, error = _apply_action(game_state, action_type, action_data)
+        if error:
+            return jsonify({'error': error}), 400
+        return _state_response(game_state)
+
+@api.route('/actions', methods=['POST'])
+def handle_actions():
+    """Apply an ordered batch of player actions in a single request.
+    
+    Actions are applied one by one, exactly as /api/action would, with the game
+    locked for the whole batch so no gravity tick lands in between. Processing
+    stops early when an action sets off a cascade or ends the game; the response
+    reports how many actions were applied.
+    """
+    game_state = _current_game_state()
+    if not game_state:
+        return jsonify({"error": "Game state not initialized"}), 500
+    
+    data = request.get_json(silent=True) or {}
+    actions = data.get('actions') if isinstance(data, dict) else None
+    if not isinstance(actions, list) or not actions:
+        return jsonify({'error': 'Missing actions'}), 400
+    if len(actions) > MAX_BATCH_ACTIONS:
+        return jsonify({'error': f'Too many actions (max {MAX_BATCH_ACTIONS})'}), 400
+    
+    for index, action in enumerate(actions):
+        if not isinstance(action, dict):
+            return jsonify({'error': f'Invalid action at index {index}'}), 400
+    
+    applied = 0
+    events = []  # Cascades resolved along the way, in the order they happened
+    with game_state.lock:
+        for index, action in enumerate(actions):
+            action_type = action.get('type', '')
+            
+            result, error = _apply_action(game_state, action_type, action.get('data', {}))
+            if error:
+                if applied == 0:
+                    return jsonify({'error': error, 'state': game_state.get_state_dict()}), 400
+                break
+            applied += 1
+            
+            if result.get('chainEvents'):
+                events.append({
+                    'index': index,
+                    'type': action_type,
+                    'chainEvents': result['chainEvents'],
+                    'score': result['score']
+                })
+                # The client plays the cascade before sending more
+                break
+            if result.get('gameOver'):
+                break
+        
+        return _state_response(game_state, {
+            'applied': applied,
+            'events': events
+        })
+
+def _apply_action(game_state, action_type, action_data):
+    """Validate and apply a single player action (caller holds game_state.lock).
+    
+    Returns:
+        Tuple of (state_dict, error_message); exactly one of them is None
+    """
     # Validate action_type
     if not action_type:
-        return jsonify({'error': 'Missing action type'}), 400
+        return None, 'Missing action type'
+    
+    if game_state.game_over:
+        return None, 'Game is over'
     
     # Special handling for start_game action
     if action_type == 'start_game':
         if game_state.game_started:
-            return jsonify({'error': 'Game already started'}), 400
+            return None, 'Game already started'
         
         # Start the game by generating the first pieces
         game_state.start_game()
-        return jsonify(game_state.get_state_dict())
+        return game_state.get_state_dict(), None
     
     # Ensure the game is started for gameplay actions
     if not game_state.game_started and action_type not in ['reset']:
-        return jsonify({'error': 'Game not started yet. Press S to start.'}), 400
+        return None, 'Game not started yet. Press S to start.'
     
-    # Special handling for actions that might create matches
-    if action_type in ['move_down', 'hard_drop']:
-        # First, perform the action to find matches
-        result = game_state.perform_action(action_type, action_data, delay_clear=True)
-        
-        # If there are matched positions, send them to the frontend first
-        if result.get('matchedPositions') and len(result['matchedPositions']) > 0:
-            print(f"Found {len(result['matchedPositions'])} matches, sending to frontend first")
-            
-            # Return the result with matched positions but don't clear them yet
-            return jsonify(result)
+    # Matches left pending by an older client's delay_clear action are finished first
+    if game_state.matched_positions:
+        game_state.clear_delayed_matches()
     
-    # For all other actions, or if no matches were found
+    # A lock resolves its matches and chain reactions right away; the frontend
+    # replays them from chainEvents
+    start = time.perf_counter()
     result = game_state.perform_action(action_type, action_data)
-    return jsonify(result)
+    # Unknown action types are no-ops; they share one label so clients can't add series
+    label = action_type if action_type in GameState.LOG_ACTIONS else 'other'
+    ACTION_SECONDS.observe(time.perf_counter() - start, (label,))
+    
+    if result.get('chainEvents'):
+        logger.debug("Resolved a cascade of %s steps, sending the timeline to the frontend", len(result['chainEvents']))
+    return result, None
 
 @api.route('/clear-matches', methods=['POST'])
 def clear_matches():
-    """Clear matches after animation completes."""
-    # This endpoint is called after the frontend animation completes
-    # We need to clear the matches that were found earlier
-    if not game_state.matched_positions:
-        # No matches to clear
-        return jsonify(game_state.get_state_dict())
-    
-    print(f"Clearing {len(game_state.matched_positions)} matches after animation")
-    
-    # Get the matched positions
-    matched_positions = set(tuple(pos) for pos in game_state.matched_positions)
-    
-    # Clear the matches
-    game_state._clear_matches(matched_positions)
+    """Clear matches after animation completes.
     
-    # Apply gravity
-    game_state._apply_gravity()
-    
-    # Check for chain reactions
-    chain_reaction_count = 0
-    chain_matched_positions, chain_matches = game_state._find_matches()
-    
-    # If we found chain matches, return them for animation and don't spawn a new piece yet
-    if chain_matches:
-        print(f"Found chain reaction with {len(chain_matched_positions)} matches, sending to frontend for animation")
-        game_state.matched_positions = list(chain_matched_positions)
-        return jsonify(game_state.get_state_dict())
-    
-    # Update score
-    base_score = len(matched_positions) * 10  # 10 points per match
-    chain_bonus = chain_reaction_count * 50  # 50 points per chain reaction
-    game_state.score += base_score + chain_bonus
-    
-    # Update level
-    game_state.level = max(1, game_state.score // 1000 + 1)
-    
-    print(f"Cleared matches with {chain_reaction_count} chain reactions")
-    print(f"Score: {game_state.score}, Level: {game_state.level}")
+    Only needed for games whose matches were left on the board by a delay_clear
+    action (older clients, replayed logs); the whole cascade is resolved in one call.
+    """
+    game_state = _current_game_state()
+    if not game_state:
+        return jsonify({"error": "Game state not initialized"}), 500
+
+    with game_state.lock:
+        game_state.clear_delayed_matches()
+        return _state_response(game_state)
+
+@api.route('/stream', methods=['GET'])
+def stream_state():
+    """Server-sent events channel that runs gravity for this session.
     
-    # Clear the matched positions list
-    game_state.matched_positions = []
+    While the stream is open the session is registered with the tick scheduler,
+    which moves the piece down at the speed for the current level; each
+    resulting state is pushed (as deltas after the first, full one). The client
+    only sends its own input. Closing the stream (e.g. when pausing) stops gravity.
+    """
+    if state_signer is not None:
+        # No instance holds the game between requests, so the client runs gravity itself
+        return jsonify({"error": "Streaming is unavailable in stateless mode"}), 503
+    game_state = _current_game_state()
+    if not game_state:
+        return jsonify({"error": "Game state not initialized"}), 500
+    session_id = g.session_id
     
-    # Spawn a new piece after all matches are cleared
-    game_state._spawn_new_piece()
+    def generate():
+        with game_state.lock:
+            first = game_state.get_state_delta(None)
+        yield _sse_event(first)
+        ticked = scheduler.subscribe(session_id, game_state)
+        try:
+            last_sent = time.monotonic()
+            while not game_state.game_over:
+                ticked.wait(STREAM_HEARTBEAT_INTERVAL)
+                ticked.clear()
+                
+                with game_state.lock:
+                    update = game_state.get_state_update()
+                if update is not None:
+                    yield _sse_event(update)
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= STREAM_HEARTBEAT_INTERVAL:
+                    yield ': heartbeat\n\n'  # Comment line keeps proxies from closing the connection
+                    last_sent = time.monotonic()
+            
+            # Let the client see the game over state before the stream ends
+            with game_state.lock:
+                update = game_state.get_state_update()
+            if update is not None:
+                yield _sse_event(update)
+        finally:
+            scheduler.unsubscribe(session_id, ticked)
     
-    return jsonify(game_state.get_state_dict())
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let reverse proxies buffer the stream
+    return response
+
+def _gravity_tick(game_state):
+    """One scheduler tick: move the piece down unless matches are still flashing"""
+    with game_state.lock:
+        if game_state.game_started and not game_state.game_over and not game_state.matched_positions:
+            _apply_action(game_state, 'move_down', {})
+
+def _sse_event(state):
+    """Formats a state dict as a server-sent event"""
+    return f"data: {json.dumps(state, separators=(',', ':'))}\n\n"
+
+@api.route('/hint', methods=['GET'])
+def get_hint():
+    """Suggest where to place the current piece and the actions that get it there"""
+    game_state = _current_game_state()
+    if not game_state:
+        return jsonify({"error": "Game state not initialized"}), 500
+    with game_state.lock:
+        if game_state.game_over or game_state.matched_positions:
+            return jsonify({"hint": None})
+        # The search places pieces on the board it is given, so it gets a copy and
+        # the player's game stays free for actions meanwhile
+        snapshot = game_state.snapshot(include_log=False)
+    position = GameState(config=game_state.config)
+    position.restore(snapshot)
+
+    best = AIPlayer().best_placement(position)
+    if best is None:
+        return jsonify({"hint": None})
+    return jsonify({"hint": {
+        "x": best.x,
+        "y": best.y,
+        "orientation": best.orientation,
+        "actions": best.actions,
+    }})
+
+@api.route('/replay-log', methods=['GET'])
+def get_replay_log():
+    """Download this session's game as a replay log (see replay.py)"""
+    game_state = _current_game_state()
+    if not game_state:
+        return jsonify({"error": "Game state not initialized"}), 500
+    with game_state.lock:
+        log = encode_log(game_state.seed, game_state.action_log, game_state.config, game_state.legacy_rng)
+    return Response(log, mimetype='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=colour_balls.replay'})
+
+@api.route('/variants', methods=['GET'])
+def get_variants():
+    """List the game variants /api/reset accepts, with their configs"""
+    return jsonify({name: config.to_dict() for name, config in VARIANTS.items()})
 
 @api.route('/reset', methods=['POST'])
 def reset_game_endpoint():
-    """Reset the game to its initial state"""
+    """Reset the game to its initial state, optionally switching to another variant
+    
+    Takes an optional JSON body {"variant": name} (see /api/variants); without
+    one the game keeps its current variant.
+    """
+    game_state = _current_game_state()
     if game_state:
-        game_state.reset()
-        return jsonify(game_state.get_state_dict() | {
-            "message": "Game reset."
-        })
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        config = None
+        if data.get('variant') is not None:
+            try:
+                config = get_variant(data['variant'])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        with game_state.lock:
+            game_state.reset(config=config)
+            return _state_response(game_state, {
+                "message": "Game reset."
+            })
     return jsonify({"error": "Game state not initialized"}), 500
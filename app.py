@@ -4,34 +4,76 @@ Main entry point for the Flask application
 """
 
 import os
-from flask import Flask, send_from_directory
-from game_logic import GameState  # To be created
+from flask import Flask, Response, abort, request
+from session_manager import SessionRegistry, DEFAULT_MAX_SESSIONS, DEFAULT_IDLE_TIMEOUT, DEFAULT_FLUSH_INTERVAL
+from session_store import open_store
 from api_routes import api, init_routes
+from state_token import StateSigner
+from log_config import configure_logging
+from metrics import InstrumentedGameState, render as render_metrics
+from static_assets import AssetCache, source_files
 
-def create_app():
-    """Create and configure the Flask application"""
-    # Initialize the Flask app
-    app = Flask(__name__, static_folder='public', static_url_path='')
+# Clients allowed to scrape /metrics
+METRICS_ADDRESSES = ('127.0.0.1', '::1')
+
+# Static files (index.html, style.css and the JS modules)
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public')
+
+def create_app(shard=None):
+    """Create and configure the Flask application
+    
+    Args:
+        shard: Optional (index, count) when running as one of several worker
+               processes (see cluster.py); only session IDs of this shard are issued
+    """
+    # Log through a background thread so requests never wait on log I/O
+    configure_logging()
+    
+    # Initialize the Flask app (public/ is served from the asset cache below, not Flask's static route)
+    app = Flask(__name__, static_folder=None)
     
-    # Initialize game state
-    game_state = GameState()
+    # Load, fingerprint and precompress the static files once, so requests never touch the disk
+    assets = AssetCache(PUBLIC_DIR)
     
-    # Initialize API routes with game state
-    init_routes(game_state)
+    # Initialize the session registry (one GameState per player)
+    sessions = SessionRegistry(
+        max_sessions=int(os.environ.get("COLOUR_BALLS_MAX_SESSIONS", DEFAULT_MAX_SESSIONS)),
+        idle_timeout=float(os.environ.get("COLOUR_BALLS_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT)),
+        # Optional persistence: memory, mmap:<path> or sqlite:<path>, written behind every flush interval
+        store=open_store(os.environ.get("COLOUR_BALLS_SESSION_STORE"), shard),
+        flush_interval=float(os.environ.get("COLOUR_BALLS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+        shard=shard,
+        state_factory=InstrumentedGameState,  # Records engine timings for /metrics
+    )
+    
+    # With a shared secret set, run stateless: each client carries its own signed game state,
+    # so any instance (e.g. a fresh serverless one) can serve any request
+    secret = os.environ.get("COLOUR_BALLS_STATE_SECRET")
+    signer = StateSigner(secret) if secret else None
+    
+    # Initialize API routes with the session registry
+    init_routes(sessions, signer=signer)
     
     # Register the API blueprint
     app.register_blueprint(api, url_prefix='/api')
     
+    @app.route('/metrics')
+    def serve_metrics():
+        """Prometheus scrape endpoint; only answered on the machine itself"""
+        if request.remote_addr not in METRICS_ADDRESSES:
+            abort(404)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+    
     # Define routes for serving static files
     @app.route('/')
     def serve_index():
         """Serve the main HTML page"""
-        return send_from_directory(app.static_folder, 'index.html')
+        return assets.response('index.html')
     
     @app.route('/<path:filename>')
     def serve_static_files(filename):
-        """Serve static files from the public folder"""
-        return send_from_directory(app.static_folder, filename)
+        """Serve static files from the asset cache (fingerprinted names are cached for good)"""
+        return assets.response(filename)
     
     return app
 
@@ -41,4 +83,5 @@ if __name__ == '__main__':
     app = create_app()
     # Use a default port if not set in environment (for local development)
     port = int(os.environ.get("PORT", 5001)) 
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Static files are cached in memory, so restart when one of them changes too
+    app.run(host='0.0.0.0', port=port, debug=True, extra_files=source_files(PUBLIC_DIR))
@@ -0,0 +1,156 @@
+"""
+Colour Balls Benchmark Module
+Measures GameState throughput and hot-path latency against stored baselines
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from game_logic import GameState
+from simulator import DEFAULT_MAX_ACTIONS, random_policy, run_simulation, simulate_game
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+# Allowed drift from the baseline before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Metrics where a bigger number is better; every other metric is better when smaller
+HIGHER_IS_BETTER = {'actions_per_sec', 'locks_per_sec'}
+
+
+def _percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _timed_state_factory(timings):
+    """Builds a GameState subclass that records _find_matches/_apply_gravity durations."""
+    class TimedGameState(GameState):
+        def _find_matches(self, changed_positions=None):
+            start = time.perf_counter()
+            result = super()._find_matches(changed_positions)
+            timings['find_matches'].append(time.perf_counter() - start)
+            return result
+
+        def _apply_gravity(self, cleared_positions=None):
+            start = time.perf_counter()
+            result = super()._apply_gravity(cleared_positions)
+            timings['apply_gravity'].append(time.perf_counter() - start)
+            return result
+    return TimedGameState
+
+
+def measure_throughput(num_games, seed):
+    """Plays num_games untimed games and returns (actions_per_sec, locks_per_sec)."""
+    start = time.perf_counter()
+    results = run_simulation(num_games, seed)
+    elapsed = time.perf_counter() - start
+    actions = sum(result['actions'] for result in results)
+    locks = sum(result['locks'] for result in results)
+    return actions / elapsed, locks / elapsed
+
+
+def measure_latency(num_games, seed):
+    """Returns p50/p95/p99 latency in microseconds for _find_matches and _apply_gravity."""
+    timings = {'find_matches': [], 'apply_gravity': []}
+    run_simulation(num_games, seed, state_factory=_timed_state_factory(timings))
+    metrics = {}
+    for name, samples in timings.items():
+        for label, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            metrics[f'{name}_{label}_us'] = _percentile(samples, fraction) * 1e6
+    return metrics
+
+
+def measure_allocations(num_games, seed):
+    """Returns the average peak bytes allocated while performing one action."""
+    peaks = []
+
+    class TracedGameState(GameState):
+        def perform_action(self, action_type, data=None, delay_clear=False):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = super().perform_action(action_type, data, delay_clear)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            return result
+
+    tracemalloc.start()
+    try:
+        for game_seed in range(seed, seed + num_games):
+            simulate_game(game_seed, random_policy(game_seed), DEFAULT_MAX_ACTIONS, TracedGameState)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) if peaks else 0.0
+
+
+def run_benchmarks(num_games=200, seed=0):
+    """Runs every benchmark and returns a flat dict of metrics."""
+    actions_per_sec, locks_per_sec = measure_throughput(num_games, seed)
+    metrics = {'actions_per_sec': actions_per_sec, 'locks_per_sec': locks_per_sec}
+    metrics.update(measure_latency(num_games, seed))
+    # tracemalloc slows everything down a lot, so use fewer games
+    metrics['peak_alloc_bytes_per_action'] = measure_allocations(max(1, num_games // 10), seed)
+    return metrics
+
+
+def compare_to_baseline(metrics, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns a list of human-readable regressions (empty if everything is within tolerance)."""
+    regressions = []
+    for name, expected in baseline.items():
+        actual = metrics.get(name)
+        if actual is None or not expected:
+            continue
+        if name in HIGHER_IS_BETTER:
+            if actual < expected * (1 - tolerance):
+                regressions.append(f"{name}: {actual:.1f} is more than {tolerance:.0%} below baseline {expected:.1f}")
+        elif actual > expected * (1 + tolerance):
+            regressions.append(f"{name}: {actual:.1f} is more than {tolerance:.0%} above baseline {expected:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Colour Balls game logic")
+    parser.add_argument('--games', type=int, default=200, help="Games to simulate per benchmark")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative drift before failing (default 0.25)")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    metrics = run_benchmarks(args.games, args.seed)
+    for name, value in metrics.items():
+        print(f"{name:32s} {value:12.1f}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({name: round(value, 1) for name, value in metrics.items()}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(metrics, baseline, args.tolerance)
+    if regressions:
+        print("PERFORMANCE REGRESSION")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("All metrics within tolerance of the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
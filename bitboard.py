@@ -0,0 +1,452 @@
+"""
+Colour Balls Bitboard Module
+Compact board representation with one bitboard (Python int) per ball color
+"""
+
+# Cell (row, col) lives at bit row * stride + col, where stride = width + 1.
+# The extra column in every row is always empty, so shifting a bitboard to the
+# next cell in any direction can never wrap from one row into the next.
+
+# Line keys for each match direction: cells with the same key lie on the same line
+_LINE_KEYS = (
+    lambda row, col: row,        # horizontal
+    lambda row, col: col,        # vertical
+    lambda row, col: col - row,  # diagonal (top-left to bottom-right)
+    lambda row, col: col + row,  # diagonal (top-right to bottom-left)
+)
+
+# Shortest run that counts as a match, unless a board is given another
+MIN_RUN = 3
+
+# Cell masks and line indexes are shared by every board of the same size and run length
+_geometry_cache = {}
+_line_index_cache = {}
+
+
+def popcount(value):
+    """Number of set bits in a bitboard."""
+    return bin(value).count('1')
+
+
+class BitBoard:
+    """Board of width x height cells, each either empty (0) or a color index.
+
+    Every color has its own bitboard plus a combined occupancy bitboard, so
+    collision checks, run detection and gravity are a handful of shifts and
+    masks over whole boards instead of per-cell loops. Python ints are
+    unbounded, so any board size works.
+    """
+
+    def __init__(self, width, height, num_colors, min_run=MIN_RUN):
+        self.width = width
+        self.height = height
+        self.stride = width + 1
+        self.num_colors = num_colors
+        self.colors = [0] * (num_colors + 1)  # Index 0 (empty) is unused
+        self.occupied = 0
+        self._rows = None  # Cached to_rows() result, dropped whenever a cell changes
+        self._column_tops = None  # Cached column_tops() result, same lifetime as _rows
+
+        self.min_run = min_run
+        # Masks of every real cell (guard column excluded) and of each column, and the
+        # shifts that build runs, are shared by every board of the same geometry
+        key = (width, height, min_run)
+        geometry = _geometry_cache.get(key)
+        if geometry is None:
+            geometry = _geometry_cache[key] = self._build_geometry()
+        self.cells_mask, self.column_masks, self.direction_shifts, self._run_steps = geometry
+
+    def _build_geometry(self):
+        """Returns (cells_mask, column_masks, direction_shifts, run_steps) for this board's size."""
+        row_mask = (1 << self.width) - 1
+        cells_mask = 0
+        for row in range(self.height):
+            cells_mask |= row_mask << (row * self.stride)
+
+        column_masks = []
+        for col in range(self.width):
+            column = 0
+            for row in range(self.height):
+                column |= 1 << (row * self.stride + col)
+            column_masks.append(column)
+
+        # Shift to the next cell along each match direction
+        direction_shifts = (1, self.stride, self.stride + 1, self.stride - 1)
+
+        # A run of min_run cells is found by repeatedly ANDing a bitboard with itself
+        # shifted along the line, doubling the run length each time (1, 2, 4, ...)
+        # until the last step tops it up to exactly min_run
+        run_steps = []
+        for shift in direction_shifts:
+            steps = []
+            length = 1
+            while length < self.min_run:
+                step = min(length, self.min_run - length)
+                steps.append(step * shift)
+                length += step
+            run_steps.append((shift, tuple(steps)))
+        return cells_mask, tuple(column_masks), direction_shifts, tuple(run_steps)
+
+    def bit_index(self, row, col):
+        """Returns the bit position of a cell."""
+        return row * self.stride + col
+
+    def bit(self, row, col):
+        """Returns the single-bit mask for a cell."""
+        return 1 << (row * self.stride + col)
+
+    def get(self, row, col):
+        """Returns the color index at (row, col), or 0 if the cell is empty."""
+        bit = 1 << (row * self.stride + col)
+        if not self.occupied & bit:
+            return 0
+        for color in range(1, self.num_colors + 1):
+            if self.colors[color] & bit:
+                return color
+        return 0
+
+    def set(self, row, col, color):
+        """Places a ball of the given color at (row, col). Color 0 empties the cell."""
+        bit = 1 << (row * self.stride + col)
+        if self.occupied & bit:
+            self.clear_mask(bit)
+        if color:
+            self.colors[color] |= bit
+            self.occupied |= bit
+            # Filling a cell can only raise its column, so the index stays valid
+            if self._column_tops is not None and row < self._column_tops[col]:
+                self._column_tops[col] = row
+        self._rows = None
+
+    def reset(self):
+        """Empties every cell."""
+        self.colors = [0] * (self.num_colors + 1)
+        self.occupied = 0
+        self._rows = None
+        self._column_tops = None
+
+    def positions_to_mask(self, positions):
+        """Converts an iterable of (row, col) cells into a bitmask."""
+        mask = 0
+        for row, col in positions:
+            mask |= 1 << (row * self.stride + col)
+        return mask
+
+    def mask_to_positions(self, mask):
+        """Converts a bitmask into a list of (row, col) cells, top to bottom."""
+        positions = []
+        while mask:
+            low_bit = mask & -mask
+            row, col = divmod(low_bit.bit_length() - 1, self.stride)
+            positions.append((row, col))
+            mask ^= low_bit
+        return positions
+
+    def clear_mask(self, mask):
+        """Empties every cell in mask."""
+        keep = ~mask
+        for color in range(1, self.num_colors + 1):
+            self.colors[color] &= keep
+        self.occupied &= keep
+        self._rows = None
+        self._column_tops = None
+
+    def column_tops(self):
+        """Returns the row of the highest ball in each column (height if the column is empty).
+
+        The result is cached and kept up to date by set(), so callers must not modify it.
+        """
+        if self._column_tops is None:
+            tops = []
+            for column in self.column_masks:
+                balls = self.occupied & column
+                tops.append(((balls & -balls).bit_length() - 1) // self.stride if balls else self.height)
+            self._column_tops = tops
+        return self._column_tops
+
+    def floor_below(self, row, col):
+        """Returns the row of the first ball below (row, col), or height if there is none."""
+        top = self.column_tops()[col]
+        if row < top:
+            return top  # Nothing between here and the top of the stack
+        # Under an overhang: look for the next ball further down this column
+        below = self.occupied & self.column_masks[col] & -(1 << ((row + 1) * self.stride))
+        if not below:
+            return self.height
+        return ((below & -below).bit_length() - 1) // self.stride
+
+    def to_rows(self):
+        """Returns the board as a list of rows of color indices.
+
+        The result is cached until the board changes, so callers must not modify it.
+        """
+        if self._rows is not None:
+            return self._rows
+        rows = [[0] * self.width for _ in range(self.height)]
+        for color in range(1, self.num_colors + 1):
+            bits = self.colors[color]
+            while bits:
+                low_bit = bits & -bits
+                row, col = divmod(low_bit.bit_length() - 1, self.stride)
+                rows[row][col] = color
+                bits ^= low_bit
+        self._rows = rows
+        return rows
+
+    def snapshot(self):
+        """Returns an immutable copy of the board contents for diff()."""
+        return tuple(self.colors)
+
+    def restore(self, snapshot):
+        """Puts the board back the way it was when snapshot() was taken."""
+        self.colors = list(snapshot)
+        occupied = 0
+        for bits in snapshot:
+            occupied |= bits
+        self.occupied = occupied
+        self._rows = None
+        self._column_tops = None
+
+    def pack(self):
+        """Packs the board into bytes at 3 bits per cell.
+
+        The cells are stored as three bit planes (bit 0, 1 and 2 of every cell's
+        color, row by row without the guard column), which only needs whole-board
+        shifts instead of a loop over cells.
+        """
+        if self.num_colors > 7:
+            raise ValueError("pack() supports at most 7 colors")
+        planes = [0, 0, 0]
+        for color in range(1, self.num_colors + 1):
+            for plane in range(3):
+                if color >> plane & 1:
+                    planes[plane] |= self.colors[color]
+        size = self.packed_size() // 3
+        row_mask = (1 << self.width) - 1
+        data = b''
+        for bits in planes:
+            packed = 0
+            for row in range(self.height):
+                packed |= ((bits >> (row * self.stride)) & row_mask) << (row * self.width)
+            data += packed.to_bytes(size, 'little')
+        return data
+
+    def unpack(self, data):
+        """Replaces the board contents with bytes from pack()."""
+        if len(data) != self.packed_size():
+            raise ValueError("Packed board has the wrong size")
+        size = len(data) // 3
+        row_mask = (1 << self.width) - 1
+        planes = []
+        for plane in range(3):
+            packed = int.from_bytes(data[plane * size:(plane + 1) * size], 'little')
+            bits = 0
+            for row in range(self.height):
+                bits |= ((packed >> (row * self.width)) & row_mask) << (row * self.stride)
+            planes.append(bits)
+
+        colors = [0] * (self.num_colors + 1)
+        for color in range(1, self.num_colors + 1):
+            bits = self.cells_mask
+            for plane in range(3):
+                bits &= planes[plane] if color >> plane & 1 else ~planes[plane]
+            colors[color] = bits
+        self.restore(colors)
+
+    def packed_size(self):
+        """Number of bytes pack() produces for this board size."""
+        return 3 * ((self.width * self.height + 7) // 8)
+
+    def diff(self, snapshot):
+        """Lists the cells that differ from an earlier snapshot().
+
+        Returns:
+            List of [row, col, color] for every changed cell (color 0 = now empty)
+        """
+        changes = []
+        old_occupied = 0
+        for color in range(1, self.num_colors + 1):
+            old_occupied |= snapshot[color]
+            changed = self.colors[color] & ~snapshot[color]
+            for row, col in self.mask_to_positions(changed):
+                changes.append([row, col, color])
+        for row, col in self.mask_to_positions(old_occupied & ~self.occupied):
+            changes.append([row, col, 0])
+        return changes
+
+    def line_index(self):
+        """Returns the precomputed index of match lines for this board size.
+
+        Returns:
+            Tuple of (lines, cell_lines). lines[direction] holds the mask of every
+            maximal line (whole row, column or diagonal) long enough for a match.
+            cell_lines maps a cell's bit index to the masks of its four lines, in
+            direction order (0 for a diagonal too short to match).
+        """
+        key = (self.width, self.height, self.min_run)
+        index = _line_index_cache.get(key)
+        if index is None:
+            lines = []
+            cell_lines = {}
+            for direction, line_key in enumerate(_LINE_KEYS):
+                masks = {}
+                for row in range(self.height):
+                    for col in range(self.width):
+                        line = line_key(row, col)
+                        masks[line] = masks.get(line, 0) | self.bit(row, col)
+                long_enough = {line: mask for line, mask in masks.items() if popcount(mask) >= self.min_run}
+                lines.append(tuple(long_enough.values()))
+                for row in range(self.height):
+                    for col in range(self.width):
+                        cell_lines.setdefault(self.bit_index(row, col), []).append(
+                            long_enough.get(line_key(row, col), 0))
+            index = _line_index_cache[key] = (tuple(lines), {cell: tuple(masks) for cell, masks in cell_lines.items()})
+        return index
+
+    def find_matches(self, changed_positions=None):
+        """Finds runs of min_run or more same-colored balls in all four directions.
+
+        Args:
+            changed_positions: Optional iterable of (row, col) cells. When given,
+                               only runs on lines through these cells are reported.
+
+        Returns:
+            Tuple of (matched_positions set, number_of_matches_found). Each
+            maximal run counts as one match, however long it is.
+        """
+        matched, matches_found = self.find_match_mask(changed_positions)
+        return set(self.mask_to_positions(matched)), matches_found
+
+    def find_match_mask(self, changed_positions=None):
+        """Same as find_matches(), but returns the matched cells as a bitmask."""
+        regions = None
+        if changed_positions is not None:
+            # Only the lines through the changed cells, looked up in the reverse map
+            cell_lines = self.line_index()[1]
+            stride = self.stride
+            horizontal = vertical = diagonal = anti_diagonal = 0
+            for row, col in changed_positions:
+                h, v, d, a = cell_lines[row * stride + col]
+                horizontal |= h
+                vertical |= v
+                diagonal |= d
+                anti_diagonal |= a
+            regions = (horizontal, vertical, diagonal, anti_diagonal)
+        if self.min_run != 3:
+            return self._find_run_mask(regions)
+
+        matches_found = 0
+        matched = 0
+        for color in range(1, self.num_colors + 1):
+            bits = self.colors[color]
+            if not bits:
+                continue
+            for direction, shift in enumerate(self.direction_shifts):
+                # Cells that start a run of three going in this direction
+                starts = bits & (bits >> shift) & (bits >> (shift * 2))
+                if regions is not None:
+                    starts &= regions[direction]
+                if starts:
+                    # Spread the starts over the whole run: each start covers itself and
+                    # the next two cells, and overlapping starts chain along the run
+                    run = starts | (starts << shift) | (starts << (shift * 2))
+                    matched |= run
+                    # A run's first cell has no same-colored predecessor on its line;
+                    # the guard column keeps diagonal predecessors from wrapping rows
+                    matches_found += popcount(starts & ~(bits << shift))
+
+        return matched, matches_found
+
+    def _find_run_mask(self, regions):
+        """find_match_mask() for any min_run; the standard three is unrolled there."""
+        matches_found = 0
+        matched = 0
+        for color in range(1, self.num_colors + 1):
+            bits = self.colors[color]
+            if not bits:
+                continue
+            for direction, (shift, steps) in enumerate(self._run_steps):
+                starts = bits
+                for step in steps:
+                    starts &= starts >> step
+                if regions is not None:
+                    starts &= regions[direction]
+                if starts:
+                    run = starts
+                    for step in steps:
+                        run |= run << step
+                    matched |= run
+                    matches_found += popcount(starts & ~(bits << shift))
+        return matched, matches_found
+
+    def apply_gravity(self, columns=None):
+        """Drops balls straight down until they rest on the floor or another ball.
+
+        Only the given columns are compacted, and each only from its lowest
+        gap upward; balls below that gap and every other column are left alone.
+
+        Args:
+            columns: Optional iterable of column indices to compact (default: all)
+
+        Returns:
+            List of (from_row, col, to_row) for every ball that moved, bottom first
+        """
+        stride = self.stride
+        columns = range(self.width) if columns is None else sorted(set(columns))
+
+        # Every cell of each listed column from its lowest gap upward
+        region = 0
+        gaps = []  # (col, lowest empty row) of each column that can move
+        for col in columns:
+            column = self.column_masks[col]
+            empty = column & ~self.occupied
+            if empty:
+                lowest_gap = (empty.bit_length() - 1) // stride
+                region |= column & ((1 << ((lowest_gap + 1) * stride)) - 1)
+                gaps.append((col, lowest_gap))
+        before = self.occupied & region
+        if not before:
+            return []
+
+        # Every ball above a column's lowest gap falls, and they keep their order,
+        # so they end up stacked upward from that gap: record the moves, grouping
+        # the balls by how far they drop
+        moves = []
+        drops = {}  # Rows dropped -> mask of the balls dropping that far
+        for col, to_row in gaps:
+            bits = before & self.column_masks[col]
+            while bits:
+                high_bit = bits.bit_length() - 1  # Lowest remaining ball in the column
+                bits ^= 1 << high_bit
+                from_row = high_bit // stride
+                moves.append((from_row, col, to_row))
+                drop = to_row - from_row
+                drops[drop] = drops.get(drop, 0) | (1 << high_bit)
+                to_row -= 1
+
+        # Then move each group in one shift, every color computed from its old bits
+        # so a group never lands on (and drags along) a ball that hasn't moved yet
+        shifts = [(drop * stride, mask) for drop, mask in drops.items()]
+        for color in range(1, self.num_colors + 1):
+            bits = self.colors[color]
+            if bits & before:
+                moved = bits & ~before
+                for shift, mask in shifts:
+                    moved |= (bits & mask) << shift
+                self.colors[color] = moved
+        occupied = self.occupied & ~before
+        for shift, mask in shifts:
+            occupied |= mask << shift
+        self.occupied = occupied
+        self._rows = None
+        self._column_tops = None
+        return moves
+
+    def hanging_columns(self):
+        """Returns the columns that have an empty cell below a ball."""
+        hanging = []
+        for col, column in enumerate(self.column_masks):
+            balls = self.occupied & column
+            if balls and popcount(balls) != self.height - ((balls & -balls).bit_length() - 1) // self.stride:
+                hanging.append(col)
+        return hanging
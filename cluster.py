@@ -0,0 +1,168 @@
+"""
+Colour Balls Cluster Module
+Serves the game from several worker processes with sessions pinned to one worker each
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from http.cookies import CookieError, SimpleCookie
+from api_routes import SESSION_COOKIE
+from log_config import configure_logging
+from session_manager import shard_for
+
+logger = logging.getLogger(__name__)
+
+# Most bytes of a request peeked at to find its session ID
+MAX_HEADER_BYTES = 16384
+
+# Seconds a client gets to send its request headers before the connection is dropped
+HEADER_TIMEOUT = 5.0
+
+
+def _session_id_from_headers(head):
+    """Finds the session cookie or X-Session-ID header in raw request headers."""
+    session_id = None
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'cookie':
+            try:
+                cookie = SimpleCookie(value.strip().decode('latin-1'))
+            except CookieError:
+                continue
+            if SESSION_COOKIE in cookie:
+                return cookie[SESSION_COOKIE].value  # Same precedence as api_routes
+        elif name == b'x-session-id':
+            session_id = value.strip().decode('latin-1')
+    return session_id
+
+
+def _peek_headers(conn):
+    """Waits for the request headers without consuming them, so the worker can read them again."""
+    deadline = time.monotonic() + HEADER_TIMEOUT
+    head = b''
+    while time.monotonic() < deadline:
+        head = conn.recv(MAX_HEADER_BYTES, socket.MSG_PEEK)
+        if not head or b'\r\n\r\n' in head or len(head) >= MAX_HEADER_BYTES:
+            return head
+        time.sleep(0.001)
+    return head
+
+
+def _run_worker(index, count, channel):
+    """Worker process: serves whatever connections the dispatcher hands it."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import create_app
+
+    class OneRequestHandler(WSGIRequestHandler):
+        # A threaded werkzeug server would keep connections alive (HTTP/1.1), and a kept-alive
+        # connection's later requests would skip the dispatcher, whatever session they belong to
+        protocol_version = 'HTTP/1.0'
+
+    app = create_app(shard=(index, count))
+    # The server's own socket is never used; connections arrive over the channel
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=OneRequestHandler)
+    logger.info("Worker %s/%s ready (pid %s)", index, count, os.getpid())
+    while True:
+        try:
+            _, fds, _, _ = socket.recv_fds(channel, 1, 1)
+        except (ConnectionError, OSError):
+            break  # Dispatcher is gone
+        if not fds:
+            break
+        conn = socket.socket(fileno=fds[0])
+        conn.setblocking(True)
+        try:
+            address = conn.getpeername()
+        except OSError:
+            conn.close()
+            continue
+        server.process_request(conn, address)
+
+
+class Dispatcher:
+    """Accepts connections and passes each to the worker that owns its session.
+
+    Each request's headers are peeked at (not read), the session ID is
+    hashed with shard_for(), and the socket itself is sent to that worker
+    over a Unix socket pair (SCM_RIGHTS). The worker then talks to the client
+    directly, so the dispatcher never copies request or response bodies
+    (server-sent event streams included). New players without a session go
+    to the workers round-robin; each worker only issues session IDs that
+    hash back to itself. The workers answer with HTTP/1.0 and close the
+    connection after each response (see OneRequestHandler in _run_worker),
+    so every request is routed on its own.
+    """
+
+    def __init__(self, host, port, num_workers):
+        self.host = host
+        self.port = port
+        self.num_workers = num_workers
+        self._channels = []
+        self._channel_locks = []
+        self._workers = []
+        self._next_worker = 0
+
+    def start_workers(self):
+        context = multiprocessing.get_context('fork')
+        for index in range(self.num_workers):
+            parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            process = context.Process(target=_run_worker, args=(index, self.num_workers, child_end),
+                                      name=f'colour-balls-worker-{index}', daemon=True)
+            process.start()
+            child_end.close()
+            self._channels.append(parent_end)
+            self._channel_locks.append(threading.Lock())
+            self._workers.append(process)
+
+    def serve_forever(self):
+        listener = socket.create_server((self.host, self.port), backlog=1024, reuse_port=False)
+        logger.info("Dispatching http://%s:%s to %s workers", self.host, self.port, self.num_workers)
+        try:
+            while True:
+                conn, _ = listener.accept()
+                threading.Thread(target=self._dispatch, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            for process in self._workers:
+                process.terminate()
+
+    def _dispatch(self, conn):
+        try:
+            conn.settimeout(HEADER_TIMEOUT)
+            session_id = _session_id_from_headers(_peek_headers(conn))
+            if session_id:
+                index = shard_for(session_id, self.num_workers)
+            else:
+                index = self._next_worker
+                self._next_worker = (index + 1) % self.num_workers
+            with self._channel_locks[index]:
+                socket.send_fds(self._channels[index], [b'c'], [conn.fileno()])
+        except OSError as e:
+            logger.debug("Dropping connection: %s", e)
+        finally:
+            conn.close()  # The worker holds its own copy of the socket
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Colour Balls from several worker processes")
+    parser.add_argument('--host', default='0.0.0.0', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=int(os.environ.get("PORT", 5001)), help="Port to listen on")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    dispatcher = Dispatcher(args.host, args.port, max(1, args.workers))
+    dispatcher.start_workers()
+    # After forking: the log writer thread wouldn't survive into the workers (they start their own)
+    configure_logging()
+    dispatcher.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
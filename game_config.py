@@ -0,0 +1,117 @@
+"""
+Colour Balls Game Config Module
+Immutable rule sets (board size, pieces, matching, scoring, gravity) that a game is played with
+"""
+
+import struct
+from dataclasses import dataclass
+
+# Packed form stored in snapshots and replay logs: board and piece sizes, scoring, gravity curve
+_PACKED = struct.Struct('<BBBBBIIIddd')
+
+# The board packs each cell into 3 bits (see BitBoard.pack), and the client has a palette of this many
+MAX_COLORS = 7
+
+# Largest board side; snapshots store the dimensions in one byte each
+MAX_BOARD_SIZE = 255
+
+
+@dataclass(frozen=True)
+class GameConfig:
+    """Rules a game is played with.
+
+    Configs are immutable and hashable, so every table derived from one (piece
+    offsets, match lines, spawn position) is built once and shared by all the
+    games that use an equal config. The defaults are the standard game.
+    """
+
+    width: int = 10
+    height: int = 20
+    piece_length: int = 3              # Balls per piece
+    num_colors: int = 6                # Colors 1..num_colors can appear
+    match_length: int = 3              # Shortest run of one color that clears
+    match_points: int = 10             # Points per match found when a piece locks
+    chain_bonus: int = 50              # Points per chain reaction (matches created by falling balls)
+    level_points: int = 1000           # Points per level
+    # Seconds per gravity tick at level 1, multiplier per level, and the fastest allowed tick
+    gravity_start_interval: float = 1.0
+    gravity_speedup_factor: float = 0.9
+    gravity_min_interval: float = 0.1
+
+    def __post_init__(self):
+        for name in ('width', 'height', 'piece_length', 'num_colors', 'match_length',
+                     'match_points', 'chain_bonus', 'level_points'):
+            if not isinstance(getattr(self, name), int) or isinstance(getattr(self, name), bool):
+                raise ValueError(f"{name} must be an integer")
+        if not 3 <= self.width <= MAX_BOARD_SIZE or not 3 <= self.height <= MAX_BOARD_SIZE:
+            raise ValueError(f"Board sides must be between 3 and {MAX_BOARD_SIZE}")
+        if not 1 <= self.piece_length <= min(self.width, self.height):
+            raise ValueError("piece_length must fit across and down the board")
+        if not 1 <= self.num_colors <= MAX_COLORS:
+            raise ValueError(f"num_colors must be between 1 and {MAX_COLORS}")
+        if not 2 <= self.match_length <= max(self.width, self.height):
+            raise ValueError("match_length must be at least 2 and fit on the board")
+        if self.match_points < 0 or self.chain_bonus < 0 or self.level_points < 1:
+            raise ValueError("Scores must not be negative and level_points must be positive")
+        if not 0 < self.gravity_min_interval <= self.gravity_start_interval:
+            raise ValueError("Gravity intervals must be positive, the minimum no larger than the start")
+        if not 0 < self.gravity_speedup_factor <= 1:
+            raise ValueError("gravity_speedup_factor must be in (0, 1]")
+
+    def pack(self):
+        """Returns the config as bytes for unpack()."""
+        return _PACKED.pack(self.width, self.height, self.piece_length, self.num_colors, self.match_length,
+                            self.match_points, self.chain_bonus, self.level_points,
+                            self.gravity_start_interval, self.gravity_speedup_factor, self.gravity_min_interval)
+
+    @classmethod
+    def unpack(cls, data, offset=0):
+        """Reads a config written by pack().
+
+        Raises:
+            ValueError: If the data is truncated or isn't a valid config
+        """
+        try:
+            return cls(*_PACKED.unpack_from(data, offset))
+        except struct.error:
+            raise ValueError("Truncated game config")
+
+    def to_dict(self):
+        """The config as the frontend's camelCase dict."""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'pieceLength': self.piece_length,
+            'numColors': self.num_colors,
+            'matchLength': self.match_length,
+            'matchPoints': self.match_points,
+            'chainBonus': self.chain_bonus,
+            'levelPoints': self.level_points,
+            'gravityStartInterval': self.gravity_start_interval,
+            'gravitySpeedupFactor': self.gravity_speedup_factor,
+            'gravityMinInterval': self.gravity_min_interval,
+        }
+
+
+PACKED_SIZE = _PACKED.size
+
+DEFAULT_CONFIG = GameConfig()
+
+# Variants a player can pick by name (see /api/variants)
+VARIANTS = {
+    'standard': DEFAULT_CONFIG,
+    'large': GameConfig(width=16, height=30, num_colors=7),
+    'long': GameConfig(width=12, height=24, piece_length=5, match_length=4),
+}
+
+
+def get_variant(name):
+    """Returns the config of a named variant.
+
+    Raises:
+        ValueError: If there is no variant with that name
+    """
+    config = VARIANTS.get(name) if isinstance(name, str) else None
+    if config is None:
+        raise ValueError(f"Unknown game variant '{name}' (expected one of {', '.join(VARIANTS)})")
+    return config
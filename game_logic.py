@@ -1,29 +1,188 @@
 # game_logic.py - Core game mechanics for Colour Balls
 
-# Constants for game dimensions (placeholders, to be matched with Tetris UI)
-BOARD_WIDTH = 10
-BOARD_HEIGHT = 20
-
+import logging
 import random
+import secrets
+import struct
+import sys
+import threading
+import time
+from array import array
+from bitboard import BitBoard
+from game_config import DEFAULT_CONFIG, PACKED_SIZE, GameConfig
+
+logger = logging.getLogger(__name__)
+
+# Binary snapshot layout (see GameState.snapshot): header, then fixed fields
+_SNAPSHOT_HEADER = struct.Struct('<4sBBBB')  # magic, format version, width, height, balls per piece
+_SNAPSHOT_FIELDS = struct.Struct('<QIQQIBhhB')  # seed, RNG draws, version, score, level, flags, piece x/y/orientation
+# Before format 4 level was 16 bits and the piece position 8 bits, too narrow for large boards
+_SNAPSHOT_FIELDS_V3 = struct.Struct('<QIQQHBbbB')
+SNAPSHOT_MAGIC = b'CBGS'
+
+# Snapshot flag bits
+_FLAG_GAME_OVER = 1
+_FLAG_GAME_STARTED = 2
+_FLAG_HAS_PIECE = 4
+_FLAG_HAS_NEXT = 8
+_FLAG_MATCHES_PENDING = 16  # matched_positions are still on the board (delayed clear)
+_FLAG_HAS_LOG = 32
+_FLAG_HAS_CONFIG = 64  # The GameConfig follows the fixed fields (absent for the standard game)
+_FLAG_LEGACY_RNG = 128  # Pieces come from the Mersenne Twister sequence of format 1 and 2 snapshots
+
+# Piece colors come from a counter-based generator (SplitMix64): the n-th value a game draws
+# depends only on its seed and n, so a snapshot's (seed, draws) resumes the sequence in O(1)
+_MASK64 = (1 << 64) - 1
+_GAMMA = 0x9E3779B97F4A7C15
+
+
+def _mix64(value):
+    """SplitMix64's finalizer: scrambles a 64-bit counter into a uniformly distributed 64-bit value."""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+# (row step, col step) from one ball of a piece to the next, per orientation
+ORIENTATION_STEPS = {
+    0: (0, 1),     # 0 degrees (horizontal →)
+    90: (1, 0),    # 90 degrees (vertical ↓)
+    180: (0, -1),  # 180 degrees (horizontal ←)
+    270: (-1, 0),  # 270 degrees (vertical ↑)
+}
+
+# Tables derived from a GameConfig, built once per config and shared by every game using it
+_config_tables = {}
 
 class GameState:
-    BOARD_WIDTH = 10
-    BOARD_HEIGHT = 20
-    NUM_BALL_COLORS = 3 # Number of distinct ball colors in a piece
-    AVAILABLE_COLORS = list(range(1, 7)) # Keep 6 different colors available [1, 2, 3, 4, 5, 6]
+    # Board size, piece length, colors, scoring and the gravity curve come from the
+    # game's GameConfig (see _apply_config); ui-controller.js reads the same curve from it
 
-    def __init__(self):
+    # Actions recorded in the replay log, by code (see action_log and replay.py)
+    LOG_ACTIONS = ('start_game', 'move_left', 'move_right', 'rotate', 'move_down', 'hard_drop', 'clear_matches')
+    LOG_DELAY_CLEAR = 0x80  # Flag added to a code when the action was performed with delay_clear
+    SNAPSHOT_FORMAT_VERSION = 4  # Bump when the snapshot() layout changes
+
+    def __init__(self, seed=None, config=None):
+        """
+        Args:
+            seed: Seeds this game's piece colors (a random seed is picked if None)
+            config: GameConfig to play with (default: the standard game)
+        """
         self.matched_positions = []  # List of positions that should flash before disappearing
-        self.reset()
+        self.version = 0  # Bumped on every change, never reset, so clients can detect missed updates
+        self._apply_config(config or DEFAULT_CONFIG)
+        self._log_codes = {action: code for code, action in enumerate(self.LOG_ACTIONS)}
+        # Held by whoever shares this game between threads (request handlers, the gravity
+        # scheduler, session flushes) around each action or read, so they apply atomically
+        self.lock = threading.RLock()
+        self.reset(seed)
+
+    def _apply_config(self, config, board=None):
+        """Switches this game to a GameConfig, with an empty board unless one is given.
+        
+        The config's values are copied onto the instance under the names the game
+        logic uses, so hot paths read them with a single attribute lookup.
+        """
+        if board is None:
+            board = BitBoard(config.width, config.height, config.num_colors, config.match_length)
+        tables = _config_tables.get(config)
+        if tables is None:
+            tables = _config_tables[config] = self._build_config_tables(config, board)
+        self.config = config
+        self.BOARD_WIDTH = config.width
+        self.BOARD_HEIGHT = config.height
+        self.NUM_BALL_COLORS = config.piece_length  # Balls (of distinct colors, if there are enough) per piece
+        self.MATCH_POINTS = config.match_points  # Points per match found when a piece locks
+        self.CHAIN_BONUS = config.chain_bonus  # Points per chain reaction (matches created by falling balls)
+        self.LEVEL_POINTS = config.level_points
+        (self.AVAILABLE_COLORS, self._piece_offsets, self._piece_shapes,
+         self._spawn_x, self._config_dict) = tables
+        # One bitboard per color; see bitboard.py
+        self._board = board
+        self._delta_base_version = None  # Version (and board) the last response described
+        self._delta_base_board = None
+
+    @staticmethod
+    def _build_config_tables(config, board):
+        """Precomputes the tables shared by every game with this config.
+        
+        _piece_offsets[orientation] is a tuple of (row, col) offsets from the piece
+        position. _piece_shapes[orientation] is (min_row, max_row, min_col, max_col,
+        mask), where mask has a bit for every ball relative to the (min_row, min_col)
+        corner, so a whole piece is checked against the board with one shift.
+        
+        Returns:
+            Tuple of (available colors, piece offsets, piece shapes, spawn column,
+            config dict for the frontend)
+        """
+        piece_offsets = {}
+        piece_shapes = {}
+        for orientation, (row_step, col_step) in ORIENTATION_STEPS.items():
+            offsets = tuple((row_step * i, col_step * i) for i in range(config.piece_length))
+            min_row = min(row for row, _ in offsets)
+            min_col = min(col for _, col in offsets)
+            mask = 0
+            for row, col in offsets:
+                mask |= board.bit(row - min_row, col - min_col)
+            piece_offsets[orientation] = offsets
+            piece_shapes[orientation] = (min_row, max(row for row, _ in offsets),
+                                         min_col, max(col for _, col in offsets), mask)
+        spawn_x = config.width // 2 - config.piece_length // 2  # Centered horizontally
+        return (tuple(range(1, config.num_colors + 1)), piece_offsets, piece_shapes, spawn_x,
+                config.to_dict())
+
+    @property
+    def board(self):
+        """The board as a list of rows of color indices (0 = empty)."""
+        return self._board.to_rows()
 
     def _generate_new_piece_colors(self):
-        """Generates a list of NUM_BALL_COLORS unique random color indices."""
-        # For Colour Balls, each piece has 6 *different* colored balls.
-        if self.NUM_BALL_COLORS > len(self.AVAILABLE_COLORS):
-            # This case should ideally not happen if NUM_BALL_COLORS is set correctly
+        """Generates a list of NUM_BALL_COLORS unique random color indices.
+        
+        Draw n uses the generator's values n * NUM_BALL_COLORS onwards, so the
+        sequence is resumed from the seed and the number of draws alone.
+        """
+        if self._rng is not None:
+            return self._generate_legacy_piece_colors()
+        colors = list(self.AVAILABLE_COLORS)
+        count = len(colors)
+        balls = self.NUM_BALL_COLORS
+        counter = self.seed + self._rng_draws * balls * _GAMMA
+        self._rng_draws += 1  # Lets snapshot() store the RNG state as seed + draws
+        # Each piece has *different* colored balls, as long as there are enough colors
+        if balls > count:
             # Fallback to allowing repeats if we ask for more unique colors than available
-            return random.choices(self.AVAILABLE_COLORS, k=self.NUM_BALL_COLORS)
-        return random.sample(self.AVAILABLE_COLORS, self.NUM_BALL_COLORS)
+            return [colors[(_mix64((counter + i * _GAMMA) & _MASK64) * count) >> 64] for i in range(1, balls + 1)]
+        for i in range(balls):  # Partial Fisher-Yates shuffle, one value per ball
+            counter += _GAMMA
+            pick = i + ((_mix64(counter & _MASK64) * (count - i)) >> 64)
+            colors[i], colors[pick] = colors[pick], colors[i]
+        return colors[:balls]
+
+    def _generate_legacy_piece_colors(self):
+        """Draws from the Mersenne Twister sequence games had before format 3 snapshots."""
+        self._rng_draws += 1
+        if self.NUM_BALL_COLORS > len(self.AVAILABLE_COLORS):
+            return self._rng.choices(self.AVAILABLE_COLORS, k=self.NUM_BALL_COLORS)
+        return self._rng.sample(self.AVAILABLE_COLORS, self.NUM_BALL_COLORS)
+
+    @property
+    def legacy_rng(self):
+        """True for games restored from format 1 or 2 snapshots, which keep their old piece sequence."""
+        return self._rng is not None
+
+    def use_legacy_rng(self):
+        """Switches to the piece sequence games had before format 3 snapshots.
+        
+        The Mersenne Twister can only be brought back to a point by replaying
+        its draws, so this costs O(pieces drawn); call it on a fresh game
+        (e.g. to replay an old log, see replay.py).
+        """
+        draws = self._rng_draws
+        self._rng = random.Random(self.seed)
+        self._rng_draws = 0
+        for _ in range(draws):
+            self._generate_legacy_piece_colors()
 
     def _is_collision(self, piece_colors, x, y, orientation):
         """Checks if a piece at the given position and orientation would collide with board boundaries or other pieces.
@@ -40,35 +199,68 @@ class GameState:
         if not piece_colors:
             return False  # No piece to check
             
-        for i in range(len(piece_colors)):
-            # Calculate the position of each ball in the piece based on orientation
-            check_x, check_y = x, y
-            
-            # Apply offsets based on orientation
-            if orientation == 0:  # 0 degrees (horizontal →)
-                check_x += i
-            elif orientation == 90:  # 90 degrees (vertical ↓)
-                check_y += i
-            elif orientation == 180:  # 180 degrees (horizontal ←)
-                check_x -= i
-            elif orientation == 270:  # 270 degrees (vertical ↑)
-                check_y -= i
-                
-            # Check board boundaries
-            if (check_x < 0 or check_x >= self.BOARD_WIDTH or 
-                check_y < 0 or check_y >= self.BOARD_HEIGHT):
-                return True  # Out of bounds
-                
-            # Check collision with existing pieces on the board
-            if self.board[check_y][check_x] != 0:  # 0 means empty
-                return True  # Collision with existing piece
-                
-        return False  # No collision detected
+        min_row, max_row, min_col, max_col, shape = self._piece_shapes[orientation]
+        
+        # Check board boundaries
+        if (x + min_col < 0 or x + max_col >= self.BOARD_WIDTH or
+            y + min_row < 0 or y + max_row >= self.BOARD_HEIGHT):
+            return True  # Out of bounds
+        
+        # Check collision with existing pieces on the board
+        return bool(self._board.occupied & (shape << self._board.bit_index(y + min_row, x + min_col)))
+
+    def _rotation_target(self, colors, x, y, orientation):
+        """Works out where a clockwise rotation would leave the piece, including wall kicks.
+        
+        Returns:
+            (x, new_orientation) after the rotation, or None if it is blocked
+        """
+        new_orientation = (orientation + 90) % 360
+        if not self._is_collision(colors, x, y, new_orientation):
+            return x, new_orientation
+        
+        # Try wall kicks - adjust position if rotation at current position causes collision
+        # For 180° (piece pointing left) try moving right, for 0° (pointing right) try moving left
+        if new_orientation == 180:
+            kick = 1
+        elif new_orientation == 0:
+            kick = -1
+        else:
+            return None
+        for offset in range(1, self.NUM_BALL_COLORS):
+            kicked_x = x + kick * offset
+            if not self._is_collision(colors, kicked_x, y, new_orientation):
+                return kicked_x, new_orientation
+        return None
+
+    def _landing_row(self, colors, x, y, orientation):
+        """Returns the row a piece at (x, y) comes to rest on if dropped straight down.
+        
+        Each ball can fall until the first ball below it in its column (from the
+        board's column height index), so this costs one lookup per ball instead of
+        a collision check per row.
+        """
+        drop = self.BOARD_HEIGHT
+        for row_offset, col_offset in self._piece_offsets[orientation]:
+            row = y + row_offset
+            drop = min(drop, self._board.floor_below(row, x + col_offset) - 1 - row)
+        return y + drop
+
+    def _ghost_piece(self):
+        """Where the current piece would land on a hard drop, for the preview."""
+        if not self.current_piece:
+            return None
+        piece = self.current_piece
+        return {
+            'x': piece['x'],
+            'y': self._landing_row(piece['colors'], piece['x'], piece['y'], piece['orientation']),
+            'orientation': piece['orientation']
+        }
 
     def _spawn_new_piece(self):
         """Moves the next_piece_colors to current_piece and generates new next_piece_colors."""
-        # Calculate initial position (centered horizontally)
-        spawn_x = self.BOARD_WIDTH // 2 - self.NUM_BALL_COLORS // 2
+        # Initial position (centered horizontally, see _build_config_tables)
+        spawn_x = self._spawn_x
         spawn_y = 0
         orientation = 0  # 0 degrees (horizontal)
         
@@ -82,22 +274,42 @@ class GameState:
         
         # Generate colors for the next piece
         self.next_piece_colors = self._generate_new_piece_colors()
+        self.version += 1
         
         # Check if the new piece collides immediately (game over condition)
         if self._is_collision(self.current_piece['colors'], spawn_x, spawn_y, orientation):
             self.game_over = True
-            print("Game over: New piece cannot be placed.")
+            logger.info("Game over: New piece cannot be placed.")
 
-    def reset(self):
-        self.board = [[0 for _ in range(self.BOARD_WIDTH)] for _ in range(self.BOARD_HEIGHT)]
+    def reset(self, seed=None, config=None):
+        """Starts a fresh game with its own RNG and an empty action log.
+        
+        Args:
+            seed: Seeds the piece colors (a random seed is picked if None)
+            config: GameConfig for the new game (default: keep the current one)
+        """
+        if config is not None and config != self.config:
+            self._apply_config(config)
+        self.seed = secrets.randbits(63) if seed is None else seed
+        self._rng = None  # Only set for games on the legacy sequence (see use_legacy_rng)
+        self._rng_draws = 0  # Pieces drawn; with the seed, the whole RNG state
+        # Append-only replay log: one (milliseconds since reset << 8 | action code) per action
+        self.action_log = array('Q')
+        self._log_start = time.monotonic()
+        self._board.reset()
         self.score = 0
         self.level = 1
         self.game_over = False
         self.current_piece = None
         self.next_piece_colors = None
         self.matched_positions = []
+        self._uncleared_matches = set()  # Matches found on the board but not cleared yet
+        self._hanging_columns = set()  # Columns where a lock left a ball above an empty cell
+        self.falling_balls = []  # [from_row, col, to_row] of the last gravity pass, for animation
+        self.chain_events = []  # Steps of the last cascade, for the frontend to replay (see _resolve_chain)
         self.game_started = False
-        print("Game state reset")
+        self.version += 1
+        logger.info("Game state reset")
         
     def start_game(self):
         """Start the game by generating the first pieces."""
@@ -105,17 +317,38 @@ class GameState:
             self.next_piece_colors = self._generate_new_piece_colors() # Generate first next piece
             self._spawn_new_piece() # Spawn the first current piece, and generate the subsequent next piece
             self.game_started = True
-            print("Game started")
+            self._record_action('start_game')
+            logger.info("Game started")
             return True
         return False
 
+    def _record_action(self, action_type, delay_clear=False):
+        """Appends an action to the replay log (actions the log can't encode are skipped)."""
+        code = self._log_codes.get(action_type)
+        if code is None:
+            return
+        if delay_clear:
+            code |= self.LOG_DELAY_CLEAR
+        tick = int((time.monotonic() - self._log_start) * 1000)
+        self.action_log.append(tick << 8 | code)
+
+    def tick_interval(self):
+        """Seconds between gravity ticks at the current level."""
+        config = self.config
+        interval = config.gravity_start_interval * config.gravity_speedup_factor ** (self.level - 1)
+        return max(interval, config.gravity_min_interval)
+
     def perform_action(self, action_type, data=None, delay_clear=False):
         if self.game_over and action_type != 'reset':
             return self.get_state_dict()
 
-        print(f"Performing action: {action_type} with data: {data}")
+        logger.debug("Performing action: %s with data: %s", action_type, data)
         if not self.current_piece:  # Should not happen if game is running
             return self.get_state_dict()
+        self.version += 1
+        self._record_action(action_type, delay_clear)
+        self.falling_balls = []
+        self.chain_events.clear()
 
         # Extract current piece data for easier access
         colors = self.current_piece['colors']
@@ -128,81 +361,52 @@ class GameState:
             new_x = current_x - 1
             if not self._is_collision(colors, new_x, current_y, current_orientation):
                 self.current_piece['x'] = new_x
-                print(f"Piece moved left to x={new_x}")
+                logger.debug("Piece moved left to x=%s", new_x)
             else:
-                print("Cannot move left: collision detected")
+                logger.debug("Cannot move left: collision detected")
                 
         elif action_type == 'move_right':
             # Check if moving right would cause a collision
             new_x = current_x + 1
             if not self._is_collision(colors, new_x, current_y, current_orientation):
                 self.current_piece['x'] = new_x
-                print(f"Piece moved right to x={new_x}")
+                logger.debug("Piece moved right to x=%s", new_x)
             else:
-                print("Cannot move right: collision detected")
+                logger.debug("Cannot move right: collision detected")
                 
         elif action_type == 'rotate':
             # Rotate 90 degrees clockwise (0 -> 90 -> 180 -> 270 -> 0)
-            new_orientation = (current_orientation + 90) % 360
+            logger.debug("Attempting rotation from %s° at (%s, %s)", current_orientation, current_x, current_y)
+            target = self._rotation_target(colors, current_x, current_y, current_orientation)
             
-            # Debug current state
-            print(f"Attempting rotation from {current_orientation}° to {new_orientation}°")
-            print(f"Current piece position: ({current_x}, {current_y})")
-            
-            # Check if the rotated piece would cause a collision
-            collision = self._is_collision(colors, current_x, current_y, new_orientation)
-            
-            if not collision:
-                # Update the orientation
+            if target:
+                new_x, new_orientation = target
+                self.current_piece['x'] = new_x
                 self.current_piece['orientation'] = new_orientation
-                print(f"Piece successfully rotated to {new_orientation} degrees")
+                logger.debug("Piece rotated to %s° with wall kick of %s", new_orientation, new_x - current_x)
             else:
-                # Try wall kicks - adjust position if rotation at current position causes collision
-                # For 180° rotation (piece pointing left), we might need to move right
-                if new_orientation == 180:
-                    # Try moving right to make space
-                    for offset in range(1, self.NUM_BALL_COLORS):
-                        if not self._is_collision(colors, current_x + offset, current_y, new_orientation):
-                            self.current_piece['x'] = current_x + offset
-                            self.current_piece['orientation'] = new_orientation
-                            print(f"Piece rotated to {new_orientation}° with right wall kick of {offset}")
-                            return self.get_state_dict()
-                
-                # For 0° rotation (piece pointing right), we might need to move left
-                elif new_orientation == 0:
-                    # Try moving left to make space
-                    for offset in range(1, self.NUM_BALL_COLORS):
-                        if not self._is_collision(colors, current_x - offset, current_y, new_orientation):
-                            self.current_piece['x'] = current_x - offset
-                            self.current_piece['orientation'] = new_orientation
-                            print(f"Piece rotated to {new_orientation}° with left wall kick of {offset}")
-                            return self.get_state_dict()
-                
-                print(f"Cannot rotate to {new_orientation} degrees: collision detected and wall kicks failed")
+                logger.debug("Cannot rotate: collision detected and wall kicks failed")
                 
         elif action_type == 'move_down':  # Soft drop
             # Check if moving down would cause a collision
             new_y = current_y + 1
             if not self._is_collision(colors, current_x, new_y, current_orientation):
                 self.current_piece['y'] = new_y
-                print(f"Piece moved down to y={new_y}")
+                logger.debug("Piece moved down to y=%s", new_y)
             else:
                 # Collision detected, lock the piece in its current position
-                print("Collision detected below, locking piece")
+                logger.debug("Collision detected below, locking piece")
+                # lock_piece spawns the next piece once matches are resolved
                 self.lock_piece(delay_clear)  # Pass the delay_clear parameter
-                self._spawn_new_piece()  # Spawn a new piece
-                # Game over check is done in _spawn_new_piece
                 
         elif action_type == 'hard_drop':
             # Move the piece down until it collides
-            drop_y = current_y
-            while not self._is_collision(colors, current_x, drop_y + 1, current_orientation):
-                drop_y += 1
+            drop_y = self._landing_row(colors, current_x, current_y, current_orientation)
             
             # Update position and lock
             if drop_y != current_y:  # Only update if it actually moved
                 self.current_piece['y'] = drop_y
-                print(f"Piece hard dropped to y={drop_y}")
+                logger.debug("Piece hard dropped to y=%s", drop_y)
             
             # Lock the piece but don't spawn a new one yet
             # The new piece will be spawned after matches are cleared
@@ -220,231 +424,390 @@ class GameState:
         if not self.current_piece:
             return
             
-        print(f"Locking piece: {self.current_piece}")
+        logger.debug("Locking piece: %s", self.current_piece)
         colors = self.current_piece['colors']
         px, py = self.current_piece['x'], self.current_piece['y']
         orientation = self.current_piece['orientation']
 
         # Place each ball of the piece onto the board
-        for i in range(len(colors)):
-            ball_color = colors[i]
-            board_x, board_y = px, py
-
-            # Apply offsets based on orientation
-            if orientation == 0:  # 0 degrees (horizontal →)
-                board_x += i
-            elif orientation == 90:  # 90 degrees (vertical ↓)
-                board_y += i
-            elif orientation == 180:  # 180 degrees (horizontal ←)
-                board_x -= i
-            elif orientation == 270:  # 270 degrees (vertical ↑)
-                board_y -= i
+        locked_positions = []
+        for ball_color, (row_offset, col_offset) in zip(colors, self._piece_offsets[orientation]):
+            board_x, board_y = px + col_offset, py + row_offset
 
             # Safety checks - these should never fail with proper collision detection
             if 0 <= board_x < self.BOARD_WIDTH and 0 <= board_y < self.BOARD_HEIGHT:
-                if self.board[board_y][board_x] == 0:  # Only lock if cell is empty
-                    self.board[board_y][board_x] = ball_color
+                if self._board.get(board_y, board_x) == 0:  # Only lock if cell is empty
+                    self._board.set(board_y, board_x, ball_color)
+                    locked_positions.append((board_y, board_x))
                 else:
                     # This should never happen with proper collision detection
-                    print(f"Warning: Collision during lock at ({board_x}, {board_y})")
+                    logger.warning("Collision during lock at (%s, %s)", board_x, board_y)
             else:
                 # This should never happen with proper collision detection
-                print(f"Warning: Piece out of bounds during lock at ({board_x}, {board_y})")
+                logger.warning("Piece out of bounds during lock at (%s, %s)", board_x, board_y)
+        
+        # Balls locked over a gap stay there until the next gravity pass; remember their columns
+        for board_y, board_x in locked_positions:
+            if board_y + 1 < self.BOARD_HEIGHT and not self._board.occupied & self._board.bit(board_y + 1, board_x):
+                self._hanging_columns.add(board_x)
         
         # After locking, check for matches and apply gravity
-        self.update_game_state(delay_clear)
+        self.update_game_state(delay_clear, locked_positions)
 
-    def update_game_state(self, delay_clear=False):
+    def update_game_state(self, delay_clear=False, changed_positions=None):
         """Updates the game state after a piece is locked.
         Checks for matches, clears them, makes balls fall, and updates score.
         
         Args:
             delay_clear (bool): If True, only find matches but don't clear them yet.
                                This allows the frontend to show the flashing animation.
+            changed_positions: (row, col) cells filled by the lock. When given, only
+                               the lines through these cells are checked for matches.
         """
-        # Check for 3+ alignments
-        matched_positions, matches_found = self._find_matches()
-        
-        # Store matched positions for frontend to animate
-        self.matched_positions = list(matched_positions) if matched_positions else []
+        # Check for runs of match_length (3 by default) or more
+        matched_positions, matches_found = self._find_matches(changed_positions)
         
         # If we're delaying the clear, just return after finding matches
         # Don't spawn a new piece yet - we'll do that after the matches are cleared
         if delay_clear and matches_found:
-            print(f"Found {len(matched_positions)} matches, delaying clear for animation")
+            logger.debug("Found %s matches, delaying clear for animation", len(matched_positions))
+            # Store matched positions for frontend to animate
+            self.matched_positions = list(matched_positions)
+            # The locked piece is part of the board now, so there is nothing left to move
+            self.current_piece = None
             return
         
+        self.matched_positions = []
         if matches_found:
-            # Clear the matched positions
+            self._resolve_chain(matched_positions, matches_found)
+        
+        # Spawn a new piece after all matches are cleared and gravity is applied
+        # This prevents extra pieces from appearing unexpectedly
+        self._spawn_new_piece()
+    
+    def clear_delayed_matches(self):
+        """Finishes a lock made with delay_clear once the frontend has flashed the matches.
+        
+        Clears the flashing matches and every chain reaction they set off in one
+        go (see _resolve_chain), then spawns the next piece.
+        
+        Returns:
+            True if there were matches to clear
+        """
+        if not self.matched_positions:
+            return False
+        self._record_action('clear_matches')
+        self.falling_balls = []
+        self.chain_events = []
+        logger.debug("Clearing %s matches after animation", len(self.matched_positions))
+        
+        # The flashing matches are the only ones on the board, so a full scan finds
+        # them again along with how many matches they count as
+        matched_positions, matches_found = self._find_matches()
+        self.matched_positions = []
+        if matches_found:
+            self._resolve_chain(matched_positions, matches_found)
+        
+        # Spawn a new piece after all matches are cleared
+        self._spawn_new_piece()
+        return True
+
+    def _resolve_chain(self, matched_positions, matches_found):
+        """Clears matches, applies gravity and repeats for every chain reaction.
+        
+        The whole cascade is resolved in one pass. Each step is appended to
+        chain_events as (cleared cells per color, falling balls, points) so the
+        frontend can replay it (flash, clear, drop) without asking the server
+        again; see _chain_timeline(). The first step earns MATCH_POINTS per
+        match, each chain reaction after it CHAIN_BONUS.
+        
+        Returns:
+            Number of chain reactions
+        """
+        chain_reaction_count = 0
+        points = matches_found * self.MATCH_POINTS  # 10 points per match
+        while True:
+            # Bitmasks are kept rather than cell lists; the timeline is only built if a client asks
+            mask = self._board.positions_to_mask(matched_positions)
+            cleared = tuple(bits & mask for bits in self._board.colors)
             self._clear_matches(matched_positions)
             
             # Make balls above empty spaces fall down
-            self._apply_gravity()
-            
-            # Check for chain reactions (matches created by falling balls)
-            chain_reaction_count = 0
-            while True:
-                chain_matched_positions, chain_matches = self._find_matches()
-                if not chain_matches:
-                    break
-                
-                # Add chain reaction matches to the matched positions list
-                self.matched_positions.extend(list(chain_matched_positions))
-                
-                # Clear the chain matches
-                self._clear_matches(chain_matched_positions)
-                
-                chain_reaction_count += 1
-                self._apply_gravity()
-            
-            # Update score based on matches and chain reactions
-            # More points for chain reactions
-            base_score = matches_found * 10  # 10 points per match
-            chain_bonus = chain_reaction_count * 50  # 50 points per chain reaction
-            self.score += base_score + chain_bonus
+            moved_positions = self._apply_gravity(matched_positions)
+            self.chain_events.append((cleared, self.falling_balls, points))
+            self.score += points
             
-            # Update level every 1000 points
-            self.level = max(1, self.score // 1000 + 1)
-            
-            print(f"Cleared {matches_found} matches with {chain_reaction_count} chain reactions")
-            print(f"Score: {self.score}, Level: {self.level}")
-        else:
-            # No matches found, clear the matched positions list
-            self.matched_positions = []
+            # Check for chain reactions (only lines through balls that fell can match)
+            matched_positions, chain_matches = self._find_matches(moved_positions)
+            if not chain_matches:
+                break
+            chain_reaction_count += 1
+            points = self.CHAIN_BONUS  # 50 points per chain reaction
         
-        # Spawn a new piece after all matches are cleared and gravity is applied
-        # This prevents extra pieces from appearing unexpectedly
-        if not delay_clear:
-            self._spawn_new_piece()
-    
-    def _find_matches(self):
-        """Checks for 3+ same-colored balls in a row.
-        Returns a tuple of (matched_positions, number_of_matches_found).
+        # Update level every LEVEL_POINTS (1000 by default) points
+        self.level = max(1, self.score // self.LEVEL_POINTS + 1)
+        
+        logger.debug("Cleared %s matches with %s chain reactions", matches_found, chain_reaction_count)
+        logger.debug("Score: %s, Level: %s", self.score, self.level)
+        return chain_reaction_count
+
+    def _chain_timeline(self):
+        """Returns chain_events as the frontend's chainEvents.
+        
+        Each step is {'matched': [[row, col, color], ...], 'falls':
+        [[from_row, col, to_row], ...], 'score': points}.
         """
-        matches_found = 0
-        matched_positions = set()  # Track positions to clear (avoid double counting)
-        
-        # Check horizontal matches
-        for row in range(self.BOARD_HEIGHT):
-            for col in range(self.BOARD_WIDTH - 2):  # Need at least 3 in a row
-                color = self.board[row][col]
-                if color == 0:  # Skip empty cells
-                    continue
-                    
-                # Check if we have 3+ same colors in a row
-                match_length = 1
-                for offset in range(1, self.BOARD_WIDTH - col):
-                    if self.board[row][col + offset] == color:
-                        match_length += 1
-                    else:
-                        break
-                        
-                if match_length >= 3:
-                    matches_found += 1
-                    # Mark these positions for clearing
-                    for offset in range(match_length):
-                        matched_positions.add((row, col + offset))
-        
-        # Check vertical matches
-        for col in range(self.BOARD_WIDTH):
-            for row in range(self.BOARD_HEIGHT - 2):  # Need at least 3 in a row
-                color = self.board[row][col]
-                if color == 0:  # Skip empty cells
-                    continue
-                    
-                # Check if we have 3+ same colors in a column
-                match_length = 1
-                for offset in range(1, self.BOARD_HEIGHT - row):
-                    if self.board[row + offset][col] == color:
-                        match_length += 1
-                    else:
-                        break
-                        
-                if match_length >= 3:
-                    matches_found += 1
-                    # Mark these positions for clearing
-                    for offset in range(match_length):
-                        matched_positions.add((row + offset, col))
-        
-        # Check diagonal matches (top-left to bottom-right)
-        for row in range(self.BOARD_HEIGHT - 2):
-            for col in range(self.BOARD_WIDTH - 2):
-                color = self.board[row][col]
-                if color == 0:  # Skip empty cells
-                    continue
-                    
-                # Check if we have 3+ same colors in a diagonal
-                match_length = 1
-                for offset in range(1, min(self.BOARD_HEIGHT - row, self.BOARD_WIDTH - col)):
-                    if self.board[row + offset][col + offset] == color:
-                        match_length += 1
-                    else:
-                        break
-                        
-                if match_length >= 3:
-                    matches_found += 1
-                    # Mark these positions for clearing
-                    for offset in range(match_length):
-                        matched_positions.add((row + offset, col + offset))
-        
-        # Check diagonal matches (top-right to bottom-left)
-        for row in range(self.BOARD_HEIGHT - 2):
-            for col in range(2, self.BOARD_WIDTH):
-                color = self.board[row][col]
-                if color == 0:  # Skip empty cells
-                    continue
-                    
-                # Check if we have 3+ same colors in a diagonal
-                match_length = 1
-                for offset in range(1, min(self.BOARD_HEIGHT - row, col + 1)):
-                    if self.board[row + offset][col - offset] == color:
-                        match_length += 1
-                    else:
-                        break
-                        
-                if match_length >= 3:
-                    matches_found += 1
-                    # Mark these positions for clearing
-                    for offset in range(match_length):
-                        matched_positions.add((row + offset, col - offset))
+        timeline = []
+        for cleared, falls, points in self.chain_events:
+            matched = sorted([row, col, color]
+                             for color, bits in enumerate(cleared) if bits
+                             for row, col in self._board.mask_to_positions(bits))
+            timeline.append({'matched': matched, 'falls': falls, 'score': points})
+        return timeline
+
+    def _find_matches(self, changed_positions=None):
+        """Checks for match_length or more same-colored balls in a row.
+        Returns a tuple of (matched_positions, number_of_matches_found).
         
+        Args:
+            changed_positions: Optional iterable of (row, col) cells that changed since
+                               the board last had no matches. Only the lines through
+                               these cells are scanned; the result is the same as a
+                               full scan. Falls back to a full scan while earlier
+                               matches are still waiting to be cleared.
+        """
+        if self._uncleared_matches:
+            changed_positions = None
+        matched_positions, matches_found = self._board.find_matches(changed_positions)
+        self._uncleared_matches = set(matched_positions)
         return matched_positions, matches_found
     
     def _clear_matches(self, matched_positions):
         """Clears all matched positions from the board."""
-        for row, col in matched_positions:
-            self.board[row][col] = 0  # Set to empty
+        self._board.clear_mask(self._board.positions_to_mask(matched_positions))
+        self._uncleared_matches.difference_update(matched_positions)
+        self.version += 1
     
-    def _apply_gravity(self):
-        """Makes balls fall down to fill empty spaces below them."""
-        # Process each column independently
-        for col in range(self.BOARD_WIDTH):
-            # First, collect all non-empty cells in this column (from bottom to top)
-            balls = []
-            for row in range(self.BOARD_HEIGHT - 1, -1, -1):
-                if self.board[row][col] != 0:
-                    balls.append(self.board[row][col])
-                    self.board[row][col] = 0  # Clear the cell
-            
-            # Then place them back starting from the bottom
-            row = self.BOARD_HEIGHT - 1
-            for ball in balls:
-                self.board[row][col] = ball
-                row -= 1
+    def _apply_gravity(self, cleared_positions=None):
+        """Makes balls fall down to fill empty spaces below them.
         
-        print("Applied gravity to make balls fall")
+        Only columns that had a cell cleared (or a ball left hanging by a lock)
+        are compacted, each from its lowest gap upward. The moves are kept in
+        falling_balls so the frontend can animate the fall.
+        
+        Args:
+            cleared_positions: (row, col) cells just cleared; None compacts every column
+        
+        Returns:
+            List of (row, col) cells that received a ball that moved
+        """
+        columns = None
+        if cleared_positions is not None:
+            columns = {col for _, col in cleared_positions} | self._hanging_columns
+        moves = self._board.apply_gravity(columns)
+        self._hanging_columns = set()
+        self.falling_balls = moves
+        self.version += 1
+        logger.debug("Applied gravity: %s balls fell", len(moves))
+        return [(to_row, col) for _, col, to_row in moves]
 
 
+    def snapshot(self, include_log=True):
+        """Serializes the whole game into a compact, versioned binary blob.
+        
+        The board is packed at 3 bits per cell (75 bytes for 10x20) and the RNG is
+        stored as its seed plus the number of pieces drawn, so a game without its
+        log fits in about 130 bytes. Games with another config than the standard
+        one also carry their GameConfig (41 bytes more).
+        
+        Args:
+            include_log: Also store the replay log (8 bytes per action)
+        
+        Returns:
+            bytes for restore()
+        """
+        piece = self.current_piece
+        flags = ((_FLAG_GAME_OVER if self.game_over else 0) |
+                 (_FLAG_GAME_STARTED if self.game_started else 0) |
+                 (_FLAG_HAS_PIECE if piece else 0) |
+                 (_FLAG_HAS_NEXT if self.next_piece_colors else 0) |
+                 (_FLAG_MATCHES_PENDING if self._uncleared_matches else 0) |
+                 (_FLAG_HAS_LOG if include_log else 0) |
+                 (_FLAG_HAS_CONFIG if self.config != DEFAULT_CONFIG else 0) |
+                 (_FLAG_LEGACY_RNG if self._rng is not None else 0))
+        parts = [
+            _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.SNAPSHOT_FORMAT_VERSION,
+                                  self.BOARD_WIDTH, self.BOARD_HEIGHT, self.NUM_BALL_COLORS),
+            _SNAPSHOT_FIELDS.pack(self.seed, self._rng_draws, self.version, self.score, self.level, flags,
+                                  piece['x'] if piece else 0, piece['y'] if piece else 0,
+                                  piece['orientation'] // 90 if piece else 0),
+            self.config.pack() if flags & _FLAG_HAS_CONFIG else b'',
+            bytes(piece['colors'] if piece else self.NUM_BALL_COLORS),
+            bytes(self.next_piece_colors or self.NUM_BALL_COLORS),
+            self._board.pack(),
+            struct.pack('<H', len(self.matched_positions)),
+            bytes(value for position in self.matched_positions for value in position),
+        ]
+        if include_log:
+            log = array('Q', self.action_log)
+            if sys.byteorder != 'little':
+                log.byteswap()
+            parts.append(struct.pack('<I', len(log)))
+            parts.append(log.tobytes())
+        return b''.join(parts)
+
+    def restore(self, data):
+        """Replaces this game with one from snapshot(), switching to its GameConfig.
+        
+        Raises:
+            ValueError: If data isn't a snapshot this version understands
+        """
+        if len(data) < _SNAPSHOT_HEADER.size:
+            raise ValueError("Truncated game snapshot")
+        magic, format_version, width, height, piece_length = _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a game snapshot")
+        # Version 1 is the same layout from before games had a config (always the standard one),
+        # both 1 and 2 are from before counter-based piece colors, and 1 to 3 have narrower fields
+        if format_version not in (1, 2, 3, self.SNAPSHOT_FORMAT_VERSION):
+            raise ValueError(f"Unsupported game snapshot version {format_version}")
+        fields = _SNAPSHOT_FIELDS if format_version >= 4 else _SNAPSHOT_FIELDS_V3
+        
+        try:
+            offset = _SNAPSHOT_HEADER.size
+            (seed, rng_draws, version, score, level, flags,
+             piece_x, piece_y, orientation) = fields.unpack_from(data, offset)
+            offset += fields.size
+            config = DEFAULT_CONFIG
+            if flags & _FLAG_HAS_CONFIG:
+                config = GameConfig.unpack(data, offset)
+                offset += PACKED_SIZE
+            if (width, height, piece_length) != (config.width, config.height, config.piece_length):
+                raise ValueError("Game snapshot's board dimensions don't match its config")
+            board = self._board
+            if config != self.config:
+                board = BitBoard(config.width, config.height, config.num_colors, config.match_length)
+            piece_colors = list(data[offset:offset + piece_length])
+            offset += piece_length
+            next_colors = list(data[offset:offset + piece_length])
+            offset += piece_length
+            board_size = board.packed_size()
+            board_data = data[offset:offset + board_size]
+            offset += board_size
+            (match_count,) = struct.unpack_from('<H', data, offset)
+            offset += 2
+            matched = data[offset:offset + match_count * 2]
+            offset += match_count * 2
+            if len(matched) != match_count * 2:
+                raise ValueError("Truncated game snapshot")
+            log = array('Q')
+            if flags & _FLAG_HAS_LOG:
+                (log_length,) = struct.unpack_from('<I', data, offset)
+                offset += 4
+                log_data = data[offset:offset + log_length * 8]
+                if len(log_data) != log_length * 8:
+                    raise ValueError("Truncated game snapshot")
+                log.frombytes(log_data)
+                if sys.byteorder != 'little':
+                    log.byteswap()
+        except struct.error:
+            raise ValueError("Truncated game snapshot")
+        
+        board.unpack(board_data)
+        if config != self.config:
+            self._apply_config(config, board)
+        
+        # The RNG state is the seed and the number of draws; older games keep their old sequence
+        self.seed = seed
+        self._rng = None
+        self._rng_draws = rng_draws
+        if format_version < 3 or flags & _FLAG_LEGACY_RNG:
+            self.use_legacy_rng()
+        
+        self.version = max(self.version, version) + 1  # Never go backwards for clients of this object
+        self.score = score
+        self.level = level
+        self.game_over = bool(flags & _FLAG_GAME_OVER)
+        self.game_started = bool(flags & _FLAG_GAME_STARTED)
+        self.current_piece = None
+        if flags & _FLAG_HAS_PIECE:
+            self.current_piece = {'colors': piece_colors, 'x': piece_x, 'y': piece_y, 'orientation': orientation * 90}
+        self.next_piece_colors = next_colors if flags & _FLAG_HAS_NEXT else None
+        self.matched_positions = [(matched[i], matched[i + 1]) for i in range(0, len(matched), 2)]
+        self._uncleared_matches = set(self.matched_positions) if flags & _FLAG_MATCHES_PENDING else set()
+        self._hanging_columns = set(self._board.hanging_columns())
+        self.falling_balls = []
+        self.chain_events = []
+        self.action_log = log
+        self._log_start = time.monotonic() - (log[-1] >> 8) / 1000 if log else time.monotonic()
+        self._delta_base_version = None  # The next client request gets a full state
+        self._delta_base_board = None
+
     def get_state_dict(self):
         # Ensure the keys match what the frontend expects
-        return {
+        state = {
             'board': self.board,
             'currentPiece': self.current_piece,    # Matches frontend: currentGameState.currentPiece
             'nextPieceColors': self.next_piece_colors, # Matches frontend: currentGameState.nextPieceColors
             'score': self.score,
             'level': self.level,
             'gameOver': self.game_over,
-            'matchedPositions': self.matched_positions  # For flashing animation
+            'matchedPositions': self.matched_positions,  # For flashing animation
+            'ghostPiece': self._ghost_piece(),  # Hard-drop landing preview
+            'fallingBalls': self.falling_balls,  # [fromRow, col, toRow] moved by the last gravity pass
+            'version': self.version
         }
+        if self.chain_events:
+            state['chainEvents'] = self._chain_timeline()  # Cascade timeline: matched cells, falls and points per step
+        return state
+
+    def get_state_delta(self, since_version):
+        """Returns only what changed since the state the client already has.
+        
+        The last state handed out (full or delta) is remembered as the base for the
+        next delta. If since_version isn't that base (the client missed an update or
+        asked for a resync), the full state is returned instead.
+        
+        Args:
+            since_version: Version the client currently holds, or None
+        
+        Returns:
+            get_state_dict() plus 'delta': False and the game's 'config' (board
+            size, piece length, colors etc.; see GameConfig.to_dict), or a dict
+            with 'delta': True, 'baseVersion' and 'cells' ([row, col, color] for
+            every changed cell) in place of 'board'
+        """
+        if since_version is not None and since_version == self._delta_base_version:
+            state = {
+                'delta': True,
+                'baseVersion': since_version,
+                'cells': self._board.diff(self._delta_base_board),
+                'currentPiece': self.current_piece,
+                'nextPieceColors': self.next_piece_colors,
+                'score': self.score,
+                'level': self.level,
+                'gameOver': self.game_over,
+                'matchedPositions': self.matched_positions,
+                'ghostPiece': self._ghost_piece(),
+                'fallingBalls': self.falling_balls,
+                'version': self.version
+            }
+            if self.chain_events:
+                state['chainEvents'] = self._chain_timeline()
+        else:
+            state = self.get_state_dict() | {'delta': False, 'config': self._config_dict}
+        
+        self._delta_base_version = self.version
+        self._delta_base_board = self._board.snapshot()
+        return state
+
+    def get_state_update(self):
+        """Returns a delta against the last state handed out, or None if nothing changed.
+        
+        Meant for push channels, where every update reaches the client in order.
+        """
+        if self.version == self._delta_base_version:
+            return None
+        return self.get_state_delta(self._delta_base_version)
 # Initialize with a default state when module is loaded for app.py
 # game_state_instance = GameState()
@@ -0,0 +1,54 @@
+"""
+Colour Balls Logging Module
+Sets up non-blocking logging for the server
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Level used when COLOUR_BALLS_LOG_LEVEL isn't set
+DEFAULT_LOG_LEVEL = 'INFO'
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Background listener that does the actual writing; None until configured
+_listener = None
+
+
+def configure_logging(level=None, stream=None):
+    """Routes log records through a queue to a background writer thread.
+
+    Request threads only format the record and put it on an in-memory queue;
+    the QueueListener thread does the blocking write. Records below the level
+    are dropped by the logger before any formatting happens, so disabled debug
+    output costs one level check.
+
+    Args:
+        level: Level name or number (defaults to COLOUR_BALLS_LOG_LEVEL, then INFO)
+        stream: Where the listener writes (defaults to stderr)
+
+    Returns:
+        The QueueListener (already started). Calling again only updates the level.
+    """
+    global _listener
+    level = level or os.environ.get('COLOUR_BALLS_LOG_LEVEL', DEFAULT_LOG_LEVEL)
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flush anything still queued on shutdown
+    return _listener
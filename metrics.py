@@ -0,0 +1,178 @@
+"""
+Colour Balls Metrics Module
+Request, engine and game counters for the server, rendered in the Prometheus text format
+"""
+
+import bisect
+import threading
+import time
+from game_logic import GameState
+
+# Every metric by name, in registration order
+REGISTRY = {}
+
+# Histogram buckets (upper bounds, in seconds unless noted)
+REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ENGINE_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+CHAIN_DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)  # Steps in a cascade, not seconds
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """Base class: a named metric with optional labels, registered on creation."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # Tuple of label values -> value
+        REGISTRY[name] = self
+
+    def _samples(self):
+        """Yields exposition lines for the current values."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Value that only goes up (requests served, games finished)."""
+
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(self.labels, labels)} {value}'
+
+
+class Gauge(_Metric):
+    """Value read from a function when the metrics are scraped, so it costs nothing in between."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, function):
+        """
+        Args:
+            function: Called without arguments at scrape time; returns the current value.
+                      Registering the same name again (e.g. from a new app) replaces it.
+        """
+        super().__init__(name, help_text)
+        self.function = function
+
+    def _samples(self):
+        yield f'{self.name} {self.function()}'
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        # Bucket counts aren't cumulative until rendering, so an observation touches one slot
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, labels)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}'
+
+
+def render():
+    """Returns every registered metric in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in list(REGISTRY.values())) + '\n'
+
+
+# Request metrics (recorded by api_routes)
+REQUESTS = Counter('colour_balls_requests_total', 'API requests served', ('endpoint', 'status'))
+REQUEST_SECONDS = Histogram('colour_balls_request_seconds', 'API request latency until the response is ready',
+                            REQUEST_BUCKETS, ('endpoint',))
+ACTION_SECONDS = Histogram('colour_balls_action_seconds', 'Time to apply one player action, by action type',
+                           REQUEST_BUCKETS, ('action',))
+SERIALIZE_SECONDS = Histogram('colour_balls_serialize_seconds', 'Time spent encoding game states as JSON',
+                              ENGINE_BUCKETS)
+
+# Engine and game metrics (recorded by InstrumentedGameState)
+FIND_MATCHES_SECONDS = Histogram('colour_balls_find_matches_seconds', 'Time spent in GameState._find_matches',
+                                 ENGINE_BUCKETS)
+GRAVITY_SECONDS = Histogram('colour_balls_gravity_seconds', 'Time spent in GameState._apply_gravity',
+                            ENGINE_BUCKETS)
+CHAIN_DEPTH = Histogram('colour_balls_chain_depth', 'Clear steps per cascade (1 means no chain reaction)',
+                        CHAIN_DEPTH_BUCKETS)
+GAMES_STARTED = Counter('colour_balls_games_started_total', 'Games started')
+GAMES_OVER = Counter('colour_balls_games_over_total', 'Games that ended with the board topped out')
+
+
+class InstrumentedGameState(GameState):
+    """GameState that records engine timings, cascade depths and game outcomes.
+
+    The server creates these instead of plain GameStates; the simulator and
+    benchmark keep using GameState, so they pay nothing for the metrics.
+    """
+
+    def start_game(self):
+        started = super().start_game()
+        if started:
+            GAMES_STARTED.inc()
+        return started
+
+    def _find_matches(self, changed_positions=None):
+        start = time.perf_counter()
+        result = super()._find_matches(changed_positions)
+        FIND_MATCHES_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+    def _apply_gravity(self, cleared_positions=None):
+        start = time.perf_counter()
+        result = super()._apply_gravity(cleared_positions)
+        GRAVITY_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+    def _resolve_chain(self, matched_positions, matches_found):
+        chain_reaction_count = super()._resolve_chain(matched_positions, matches_found)
+        CHAIN_DEPTH.observe(chain_reaction_count + 1)
+        return chain_reaction_count
+
+    def _spawn_new_piece(self):
+        super()._spawn_new_piece()
+        if self.game_over:
+            GAMES_OVER.inc()
@@ -25,10 +25,18 @@ const MAX_CONSECUTIVE_FAILURES = 3;
 let circuitBreakerActive = false;
 let circuitRecoveryTimeout = null;
 
+// State version the client currently holds; sent so the server can answer with a delta
+let stateVersion = null;
+
+// Actions queued during the current animation frame, sent together to /api/actions
+let queuedActions = [];
+let queuedResolvers = [];
+let queueFlushScheduled = false;
+
 /**
- * Safety function to reset animation lock if it gets stuck
+ * Releases the animation lock (also the safety net if it gets stuck)
  */
-function resetAnimationLock() {
+export function resetAnimationLock() {
     if (waitingForAnimation) {
         console.warn('Animation lock safety triggered - resetting stuck animation lock');
         waitingForAnimation = false;
@@ -89,8 +97,9 @@ export function globalReset() {
 
 /**
  * Sets up the animation lock with safety timeout
+ * @param {number} [maxWait=MAX_ANIMATION_WAIT] - Longest the animation may take (ms) before the lock is released anyway.
  */
-function setAnimationLock() {
+export function setAnimationLock(maxWait = MAX_ANIMATION_WAIT) {
     waitingForAnimation = true;
     
     // Clear any existing timeout
@@ -101,8 +110,8 @@ function setAnimationLock() {
     // Set a safety timeout to prevent permanently stuck animation
     animationTimeoutId = setTimeout(() => {
         resetAnimationLock();
-        console.warn('Animation lock timed out after ' + MAX_ANIMATION_WAIT + 'ms');
-    }, MAX_ANIMATION_WAIT);
+        console.warn('Animation lock timed out after ' + maxWait + 'ms');
+    }, maxWait);
     
     // Set up a global reset timeout as a last resort
     if (globalResetTimeoutId) {
@@ -111,7 +120,27 @@ function setAnimationLock() {
     
     globalResetTimeoutId = setTimeout(() => {
         globalReset();
-    }, GLOBAL_RESET_TIMEOUT);
+    }, Math.max(GLOBAL_RESET_TIMEOUT, maxWait + MAX_ANIMATION_WAIT));
+}
+
+/**
+ * Records the state version the client holds. Pass null to always get full states.
+ * @param {number|null} version - The version of the last applied state.
+ */
+export function setStateVersion(version) {
+    stateVersion = version;
+}
+
+/**
+ * Builds the headers for a JSON API request, including the held state version.
+ * @returns {object} The request headers.
+ */
+function requestHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    if (stateVersion !== null) {
+        headers['X-State-Version'] = String(stateVersion);
+    }
+    return headers;
 }
 
 /**
@@ -124,7 +153,7 @@ function resetCircuitBreaker() {
 }
 
 /**
- * Fetches the current game state from the server.
+ * Fetches the full current game state from the server (also used to resync).
  * @returns {Promise<Object>} The game state.
  */
 export async function getGameState() {
@@ -193,9 +222,7 @@ export async function sendAction(actionType, actionData = {}) {
         
         const response = await fetch(`${API_BASE_URL}/action`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: requestHeaders(),
             body: JSON.stringify({
                 type: actionType,
                 data: actionData,
@@ -226,26 +253,6 @@ export async function sendAction(actionType, actionData = {}) {
 
         const result = await response.json();
         
-        // Check if there are matched positions that need animation
-        if (result.matchedPositions && result.matchedPositions.length > 0) {
-            console.log('Received matched positions, will start animation');
-            // Use the safer animation lock mechanism
-            setAnimationLock();
-            
-            // After the animation completes (1.5 seconds), send a follow-up action to clear the matches
-            setTimeout(async () => {
-                console.log('Animation complete, clearing matches');
-                try {
-                    await sendClearMatches();
-                } catch (error) {
-                    console.error('Error during clear matches:', error);
-                } finally {
-                    // Always reset animation lock when done, even if there was an error
-                    resetAnimationLock();
-                }
-            }, 1500); // Animation takes about 1.2s, add a little buffer
-        }
-        
         return result;
     } catch (error) {
         // Increment failure counter and check if we should activate circuit breaker
@@ -288,26 +295,89 @@ export async function sendAction(actionType, actionData = {}) {
 }
 
 /**
- * Sends a request to clear matches after animation completes.
- * @returns {Promise<object>} The updated game state.
+ * Queues a player action and sends everything queued in the same animation frame
+ * as a single /api/actions request.
+ * @param {string} actionType - The type of action (e.g., 'move_left', 'rotate').
+ * @param {object} [actionData={}] - Additional data for the action (if any).
+ * @returns {Promise<object>} The game state after the whole batch was applied.
+ */
+export function queueAction(actionType, actionData = {}) {
+    return new Promise((resolve) => {
+        queuedActions.push({ type: actionType, data: actionData });
+        queuedResolvers.push(resolve);
+        if (!queueFlushScheduled) {
+            queueFlushScheduled = true;
+            requestAnimationFrame(flushActionQueue);
+        }
+    });
+}
+
+/**
+ * Sends the actions queued during this frame and resolves every waiting caller.
+ */
+async function flushActionQueue() {
+    const actions = queuedActions;
+    const resolvers = queuedResolvers;
+    queuedActions = [];
+    queuedResolvers = [];
+    queueFlushScheduled = false;
+
+    // A lone action doesn't need the batch envelope
+    const result = actions.length === 1
+        ? await sendAction(actions[0].type, actions[0].data)
+        : await sendActions(actions);
+    resolvers.forEach(resolve => resolve(result));
+}
+
+/**
+ * Sends an ordered list of player actions to the server in one request.
+ * @param {Array<{type: string, data: object}>} actions - Actions to apply in order.
+ * @returns {Promise<object>} The updated game state, plus 'applied' and 'events'.
  */
-async function sendClearMatches() {
-    // If circuit breaker is active, return a minimal response
+export async function sendActions(actions) {
+    // If circuit breaker is active, don't send API requests
     if (circuitBreakerActive) {
-        console.warn('Circuit breaker active - skipping clear-matches request');
+        console.warn('Circuit breaker active - local fallback for batched actions');
         return { success: false, circuitBreakerActive: true };
     }
 
+    // While an animation is running only a hard drop may interrupt it
+    if (waitingForAnimation) {
+        actions = actions.filter(action => action.type === 'hard_drop');
+    }
+
+    // Everything after a hard drop would apply to the next piece, which the player hasn't seen yet
+    const hardDropIndex = actions.findIndex(action => action.type === 'hard_drop');
+    if (hardDropIndex !== -1) {
+        actions = actions.slice(0, hardDropIndex + 1);
+        if (hardDropInProgress) {
+            console.warn('Hard drop already in progress, ignoring duplicate request');
+            actions = actions.slice(0, hardDropIndex);
+        }
+    }
+
+    if (actions.length === 0) {
+        console.log('No actions left to send in this batch');
+        return null;
+    }
+
+    const containsHardDrop = actions[actions.length - 1].type === 'hard_drop';
+    if (containsHardDrop) {
+        if (waitingForAnimation) {
+            resetAnimationLock();
+        }
+        hardDropInProgress = true;
+    }
+
     try {
         // Use fetch with timeout to prevent hanging requests
         const controller = new AbortController();
         const timeoutId = setTimeout(() => controller.abort(), 5000); // 5 second timeout
 
-        const response = await fetch(`${API_BASE_URL}/clear-matches`, {
+        const response = await fetch(`${API_BASE_URL}/actions`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: requestHeaders(),
+            body: JSON.stringify({ actions }),
             signal: controller.signal
         });
 
@@ -321,92 +391,82 @@ async function sendClearMatches() {
 
         // Reset consecutive failures on success
         consecutiveFailures = 0;
-        
-        // If circuit breaker was active and we got a successful response, reset it
         if (circuitBreakerActive) {
             resetCircuitBreaker();
         }
-        
-        // If this was a hard drop action, reset the flag
-        if (actionType === 'hard_drop') {
-            hardDropInProgress = false;
-        }
 
         const result = await response.json();
-        
-        // Check if there are more matched positions (chain reaction)
-        if (result.matchedPositions && result.matchedPositions.length > 0) {
-            console.log('Chain reaction detected! More matches to animate');
-            
-            // Use the safer animation lock mechanism
-            setAnimationLock();
-            
-            // Start another animation cycle for the chain reaction
-            setTimeout(async () => {
-                console.log('Chain reaction animation complete, clearing matches');
-                try {
-                    await sendClearMatches(); // Recursively call to handle multiple chain reactions
-                } catch (error) {
-                    console.error('Error during chain reaction clear:', error);
-                } finally {
-                    // Always reset animation lock when done, even if there was an error
-                    resetAnimationLock();
-                }
-            }, 1500); // Animation takes about 1.2s, add a little buffer
-            
-            return result;
-        }
-        
+
         return result;
     } catch (error) {
-        // Increment failure counter and check if we should activate circuit breaker
         consecutiveFailures++;
-        console.error(`Error clearing matches (failure #${consecutiveFailures}):`, error);
-        
-        // Reset hard drop flag in case it's still set
-        if (hardDropInProgress) {
-            hardDropInProgress = false;
-        }
-        
-        // Display user-friendly error message
-        const gameMessage = document.getElementById('game-message');
-        if (gameMessage) {
-            if (error.name === 'AbortError') {
-                gameMessage.textContent = 'Network request timed out. Game will continue.'; 
-            } else {
-                gameMessage.textContent = 'Connection issue. Game will continue in limited mode.';
-            }
-        }
-        
-        // If we've had too many consecutive failures, activate circuit breaker
+        console.error(`Error sending batched actions (failure #${consecutiveFailures}):`, error);
+
         if (consecutiveFailures >= MAX_CONSECUTIVE_FAILURES && !circuitBreakerActive) {
             console.warn('Too many consecutive API failures - activating circuit breaker');
             circuitBreakerActive = true;
-            
-            // Try to recover after 30 seconds
             if (circuitRecoveryTimeout) {
                 clearTimeout(circuitRecoveryTimeout);
             }
-            
             circuitRecoveryTimeout = setTimeout(() => {
                 resetCircuitBreaker();
             }, 30000); // 30 seconds recovery time
         }
-        
-        // Return a minimal response to keep the game running
-        resetAnimationLock(); // Make sure to reset the lock on error
+
         return { success: false, error: error.message };
+    } finally {
+        if (containsHardDrop) {
+            hardDropInProgress = false;
+        }
     }
 }
 
+/**
+ * Opens the server-sent events channel, which runs gravity on the server and
+ * pushes every state change.
+ * @param {function(object): void} onState - Called with each pushed state.
+ * @param {function(): void} onUnavailable - Called if the stream can't be opened at all
+ *                                           (e.g. serverless hosting); the caller should
+ *                                           fall back to client-driven ticks.
+ * @returns {EventSource|null} The stream, or null if the browser has no EventSource.
+ */
+export function openStateStream(onState, onUnavailable) {
+    if (typeof EventSource === 'undefined') {
+        onUnavailable();
+        return null;
+    }
+
+    let opened = false;
+    const stream = new EventSource(`${API_BASE_URL}/stream`);
+    stream.onopen = () => {
+        opened = true;
+        console.log('State stream connected');
+    };
+    stream.onmessage = (event) => {
+        onState(JSON.parse(event.data));
+    };
+    stream.onerror = () => {
+        // Once connected, EventSource reconnects by itself after drops
+        if (!opened) {
+            console.warn('State stream unavailable, falling back to polling');
+            stream.close();
+            onUnavailable();
+        }
+    };
+    return stream;
+}
+
 /**
  * Sends a request to reset the game on the server.
+ * @param {string|null} [variant=null] - Game variant to switch to (see /api/variants); null keeps the current one.
  * @returns {Promise<Object>} The initial game state after reset.
  */
-export async function resetGame() {
+export async function resetGame(variant = null) {
     try {
         const response = await fetch(`${API_BASE_URL}/reset`, {
             method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(variant ? { variant } : {}),
         });
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -1,8 +1,17 @@
 // public/js/board.js - Board rendering
+//
+// The draw functions only record a scene (board, flashing matches, falling balls,
+// current and ghost piece, next piece); one requestAnimationFrame callback paints
+// it. Every ball look is pre-rendered once per color to a sprite, and a frame
+// only repaints the cells whose sprite differs from what the canvas already
+// shows, so moving a piece touches a handful of cells instead of the whole board.
 
-export const COLS = 10;
-export const ROWS = 20;
-export const BLOCK_SIZE = 30; // pixels
+// Board geometry; the defaults are the standard game, configure() switches to the server's variant
+export let COLS = 10;
+export let ROWS = 20;
+export let BLOCK_SIZE = 30; // pixels
+let pieceLength = 3; // Balls per piece, and the width of the next-piece canvas
+const MAX_BOARD_HEIGHT = 600; // Pixels; taller boards get smaller balls instead of a bigger canvas
 
 // Define colors: first is empty, next 6 are for ball types
 const EMPTY_COLOR = '#000000'; // Black for empty cells or canvas background
@@ -14,14 +23,42 @@ const BALL_COLORS = [
     '#FFDC00', // Yellow
     '#B10DC9', // Purple
     '#FF851B', // Orange
-    // Add more if pieces can have more than 6 unique colors, or for special items
+    '#39CCCC', // Teal (variants with 7 colors)
 ];
 
+// Opacity of the hard-drop landing preview
+const GHOST_ALPHA = 0.25;
+
+// Sprite keys: what a cell shows. 0 is empty, 1..7 a ball, plus an offset for how it is drawn
+const HIGHLIGHTED = 8; // Flashing match in its 'on' phase
+const GHOST = 16; // Hard-drop landing preview
+const UNPAINTED = 255; // Canvas content unknown (a falling ball passed over it); always repainted
+
+let sprites = []; // Sprite key -> BLOCK_SIZE square canvas with that ball
+
+// Scene painted by the next frame
+let sceneBoard = null; // 2D array of color indices
+let scenePiece = null; // Current piece
+let sceneGhost = null; // Current piece moved to its landing spot
+let sceneNext = ''; // Next piece colors, comma separated
+let painted = new Uint8Array(0); // Sprite key on the canvas per cell (row * COLS + col)
+let target = new Uint8Array(0); // Sprite key the scene wants per cell (rebuilt every frame)
+let nextPainted = ''; // Next piece colors on the next-piece canvas
+let frameRequested = false;
+
+// Falling animation variables
+export const FALL_DURATION = 150; // Milliseconds for balls to drop into place after a clear
+let fallingBalls = []; // [fromRow, col, toRow] of balls currently animating
+let fallProgress = 1; // 0..1 through the current fall
+let fallStart = 0; // performance.now() when the fall started
+let fallenCells = []; // Cells the falling balls covered in the last frame
+
 // Flashing animation variables
-let flashingCells = []; // Array of cells that should flash
+export const FLASH_DURATION = 1200; // Milliseconds matched cells flash before they disappear (6 toggles)
+const FLASH_TOGGLES = 6;
+let flashingCells = new Set(); // row * COLS + col of the cells that flash
 let flashingOn = true; // Toggle for flash state
-let flashingInterval = null; // Interval ID for flashing animation
-let flashCount = 0; // Counter for flash cycles
+let flashStart = 0; // performance.now() when the flash started
 
 let mainCanvas, mainCtx;
 let nextCanvas, nextCtx;
@@ -34,19 +71,52 @@ let nextCanvas, nextCtx;
 export function init(canvasId = 'game-canvas', nextCanvasId = 'next-piece-canvas') {
     mainCanvas = document.getElementById(canvasId);
     mainCtx = mainCanvas.getContext('2d');
-    mainCanvas.width = COLS * BLOCK_SIZE;
-    mainCanvas.height = ROWS * BLOCK_SIZE;
-
     nextCanvas = document.getElementById(nextCanvasId);
     nextCtx = nextCanvas.getContext('2d');
-    // Piece is 3 balls long. Display horizontally with 1 block padding on each side vertically.
-    nextCanvas.width = 3 * BLOCK_SIZE;
-    nextCanvas.height = 1 * BLOCK_SIZE; // Height for one row of balls
+    resizeCanvases();
+    console.log('Board initialized. Main canvas:', mainCanvas.width, 'x', mainCanvas.height);
+    console.log('Next piece canvas:', nextCanvas.width, 'x', nextCanvas.height);
+}
+
+/**
+ * Sizes both canvases for the current geometry, clears them and renders the sprites at the new size.
+ */
+function resizeCanvases() {
+    mainCanvas.width = COLS * BLOCK_SIZE;
+    mainCanvas.height = ROWS * BLOCK_SIZE;
+    // The next piece is displayed horizontally, one row of balls
+    nextCanvas.width = pieceLength * BLOCK_SIZE;
+    nextCanvas.height = 1 * BLOCK_SIZE;
 
     clearCanvas(mainCtx, mainCanvas.width, mainCanvas.height);
     clearCanvas(nextCtx, nextCanvas.width, nextCanvas.height);
-    console.log('Board initialized. Main canvas:', mainCanvas.width, 'x', mainCanvas.height);
-    console.log('Next piece canvas:', nextCanvas.width, 'x', nextCanvas.height);
+    buildSprites();
+    painted = new Uint8Array(COLS * ROWS); // Both canvases now show nothing but empty cells
+    target = new Uint8Array(COLS * ROWS);
+    nextPainted = '';
+    fallenCells = [];
+    requestFrame();
+}
+
+/**
+ * Switches the board to the game variant the server plays.
+ * @param {object} config - The state's config ({ width, height, pieceLength, ... }, see GameConfig.to_dict).
+ */
+export function configure(config) {
+    if (!config || (config.width === COLS && config.height === ROWS && config.pieceLength === pieceLength)) {
+        return;
+    }
+    COLS = config.width;
+    ROWS = config.height;
+    pieceLength = config.pieceLength;
+    BLOCK_SIZE = Math.min(30, Math.floor(MAX_BOARD_HEIGHT / ROWS));
+    // Cell indices change with the width
+    stopFlashingAnimation();
+    fallProgress = 1;
+    if (mainCanvas) {
+        resizeCanvases();
+    }
+    console.log(`Board configured for ${COLS}x${ROWS}, pieces of ${pieceLength}, ${BLOCK_SIZE}px balls`);
 }
 
 /**
@@ -61,82 +131,217 @@ function clearCanvas(ctx, width, height) {
 }
 
 /**
- * Draws a single block (ball) at the specified grid position.
- * @param {CanvasRenderingContext2D} ctx - The drawing context.
- * @param {number} col - Grid column.
- * @param {number} row - Grid row.
+ * Renders every ball look (normal, highlighted, ghost) of every color at the current BLOCK_SIZE.
+ */
+function buildSprites() {
+    sprites = [];
+    for (let colorIndex = 1; colorIndex < BALL_COLORS.length; colorIndex++) {
+        sprites[colorIndex] = renderSprite(colorIndex, false, 1);
+        sprites[HIGHLIGHTED + colorIndex] = renderSprite(colorIndex, true, 1);
+        sprites[GHOST + colorIndex] = renderSprite(colorIndex, false, GHOST_ALPHA);
+    }
+}
+
+/**
+ * Draws one ball into a new offscreen canvas of one cell.
  * @param {number} colorIndex - Index into BALL_COLORS array.
- * @param {boolean} [highlighted=false] - Whether to draw the block in a highlighted state.
+ * @param {boolean} highlighted - Whether to draw the ball in its highlighted (flashing) state.
+ * @param {number} alpha - Opacity of the whole ball.
+ * @returns {HTMLCanvasElement} The sprite.
  */
-function drawBlock(ctx, col, row, colorIndex, highlighted = false) {
-    const x = col * BLOCK_SIZE;
-    const y = row * BLOCK_SIZE;
-    const color = BALL_COLORS[colorIndex] || EMPTY_COLOR;
+function renderSprite(colorIndex, highlighted, alpha) {
+    const sprite = document.createElement('canvas');
+    sprite.width = BLOCK_SIZE;
+    sprite.height = BLOCK_SIZE;
+    const ctx = sprite.getContext('2d');
+    const center = BLOCK_SIZE / 2;
+    ctx.globalAlpha = alpha;
 
-    // For highlighted state (flashing), we'll draw a brighter version
     if (highlighted) {
-        // Draw a white glow around the ball
+        // Draw a white glow around the ball; it stays inside the cell so repainting
+        // a cell never has to touch its neighbours
         ctx.fillStyle = 'white';
         ctx.beginPath();
-        ctx.arc(x + BLOCK_SIZE/2, y + BLOCK_SIZE/2, BLOCK_SIZE/2 + 2, 0, Math.PI * 2);
+        ctx.arc(center, center, center, 0, Math.PI * 2);
         ctx.fill();
     }
 
     // Draw the ball as a circle instead of a square
-    ctx.fillStyle = color;
+    ctx.fillStyle = BALL_COLORS[colorIndex];
     ctx.beginPath();
-    ctx.arc(x + BLOCK_SIZE/2, y + BLOCK_SIZE/2, BLOCK_SIZE/2 - 1, 0, Math.PI * 2);
+    ctx.arc(center, center, highlighted ? center - 2 : center - 1, 0, Math.PI * 2);
     ctx.fill();
 
     // Add a highlight to make the ball look more 3D
     ctx.fillStyle = 'rgba(255, 255, 255, 0.3)';
     ctx.beginPath();
-    ctx.arc(x + BLOCK_SIZE/2 - BLOCK_SIZE/6, y + BLOCK_SIZE/2 - BLOCK_SIZE/6, BLOCK_SIZE/6, 0, Math.PI * 2);
+    ctx.arc(center - BLOCK_SIZE/6, center - BLOCK_SIZE/6, BLOCK_SIZE/6, 0, Math.PI * 2);
     ctx.fill();
+    return sprite;
 }
 
 /**
- * Draws the entire game board based on the boardData.
- * @param {Array<Array<number>>} boardData - 2D array representing the board state.
- *                                            Each cell contains a colorIndex.
- * @param {Array<Array<number>>} matchedPositions - Array of [row, col] positions that should flash.
+ * Forgets what the board canvas shows, so the next frame repaints every cell.
+ * Call after drawing on the canvas outside this module (e.g. the pause overlay).
  */
-export function drawBoard(boardData, matchedPositions = []) {
-    clearCanvas(mainCtx, mainCanvas.width, mainCanvas.height);
-    if (!boardData || boardData.length === 0) return;
+export function invalidate() {
+    painted.fill(UNPAINTED);
+    fallenCells = [];
+    requestFrame();
+}
 
-    // Update the flashing cells if new matched positions are provided and not empty
-    if (matchedPositions && matchedPositions.length > 0) {
-        console.log('drawBoard received matchedPositions:', matchedPositions);
-        startFlashingAnimation(matchedPositions, boardData);
+/**
+ * Asks for a frame to paint the scene in, unless one is already coming.
+ */
+function requestFrame() {
+    if (!frameRequested) {
+        frameRequested = true;
+        requestAnimationFrame(renderFrame);
     }
+}
+
+/**
+ * Advances the animations and paints whatever changed in the scene since the last frame.
+ * @param {number} now - Frame timestamp from requestAnimationFrame.
+ */
+function renderFrame(now) {
+    frameRequested = false;
+    if (!mainCtx) return;
+    let animating = false;
 
-    // Draw the board cells
-    for (let row = 0; row < ROWS; row++) {
-        for (let col = 0; col < COLS; col++) {
-            if (boardData[row] && boardData[row][col] !== 0) { // 0 is empty
-                // Check if this cell should be flashing
-                const isFlashing = flashingCells.some(cell => 
-                    cell.row === row && cell.col === col);
-                
-                // If cell is flashing and we're in the 'off' state of the flash cycle, skip drawing
-                if (isFlashing && !flashingOn) {
+    if (flashingCells.size > 0) {
+        const toggles = Math.floor((now - flashStart) / (FLASH_DURATION / FLASH_TOGGLES));
+        // Flash 6 times (3 on, 3 off); the cells stay hidden afterwards until the next board replaces them
+        flashingOn = toggles < FLASH_TOGGLES ? toggles % 2 === 0 : false;
+        animating = toggles < FLASH_TOGGLES;
+    }
+    if (fallProgress < 1) {
+        // Ease in, like something accelerating under gravity
+        const t = Math.min(1, (now - fallStart) / FALL_DURATION);
+        fallProgress = t * t;
+        animating = animating || t < 1;
+    }
+
+    // What each cell should show
+    target.fill(0);
+    if (sceneBoard) {
+        for (let row = 0; row < ROWS; row++) {
+            const cells = sceneBoard[row];
+            if (!cells) continue;
+            for (let col = 0; col < COLS; col++) {
+                const colorIndex = cells[col];
+                if (!colorIndex) continue; // 0 is empty
+                const index = row * COLS + col;
+                if (flashingCells.has(index)) {
                     // Skip drawing this cell when flash is in 'off' state
-                    continue;
-                }
-                
-                // Draw the cell with its color (possibly highlighted if flashing)
-                const colorIndex = boardData[row][col];
-                if (isFlashing && flashingOn) {
-                    // Draw with a brighter version for the 'on' state
-                    drawBlock(mainCtx, col, row, colorIndex, true); // true = highlighted
+                    target[index] = flashingOn ? HIGHLIGHTED + colorIndex : 0;
                 } else {
-                    // Draw normally
-                    drawBlock(mainCtx, col, row, colorIndex, false);
+                    target[index] = colorIndex;
                 }
             }
         }
     }
+    // Balls still falling are drawn between their old and new rows instead of in their cell
+    if (fallProgress < 1) {
+        for (const [, col, toRow] of fallingBalls) {
+            target[toRow * COLS + col] = 0;
+        }
+    }
+    // The landing preview first so the falling piece stays on top of it
+    for (const [col, row, colorIndex] of pieceCells(sceneGhost)) {
+        target[row * COLS + col] = GHOST + colorIndex;
+    }
+    for (const [col, row, colorIndex] of pieceCells(scenePiece)) {
+        target[row * COLS + col] = colorIndex;
+    }
+
+    // Repaint the cells that differ from the canvas, including those the falling balls passed over
+    for (const index of fallenCells) {
+        painted[index] = UNPAINTED;
+    }
+    fallenCells = [];
+    for (let index = 0; index < target.length; index++) {
+        const key = target[index];
+        if (key !== painted[index]) {
+            paintCell(mainCtx, index % COLS, Math.floor(index / COLS), key);
+            painted[index] = key;
+        }
+    }
+
+    // Then the falling balls on top, remembering the cells they cover for the next frame
+    if (fallProgress < 1 && sceneBoard) {
+        for (const [fromRow, col, toRow] of fallingBalls) {
+            const sprite = sprites[sceneBoard[toRow] && sceneBoard[toRow][col]];
+            if (!sprite) continue;
+            const row = fromRow + (toRow - fromRow) * fallProgress;
+            mainCtx.drawImage(sprite, col * BLOCK_SIZE, Math.round(row * BLOCK_SIZE));
+            const top = Math.floor(row);
+            fallenCells.push(top * COLS + col);
+            if (row > top && top + 1 < ROWS) {
+                fallenCells.push((top + 1) * COLS + col);
+            }
+        }
+    }
+
+    if (sceneNext !== nextPainted) {
+        paintNextPiece();
+    }
+    if (animating) {
+        requestFrame();
+    }
+}
+
+/**
+ * Paints one cell: the background, then its sprite.
+ * @param {CanvasRenderingContext2D} ctx - The drawing context.
+ * @param {number} col - Grid column.
+ * @param {number} row - Grid row.
+ * @param {number} key - Sprite key (0 for an empty cell).
+ */
+function paintCell(ctx, col, row, key) {
+    const x = col * BLOCK_SIZE;
+    const y = row * BLOCK_SIZE;
+    ctx.fillStyle = EMPTY_COLOR;
+    ctx.fillRect(x, y, BLOCK_SIZE, BLOCK_SIZE);
+    const sprite = sprites[key];
+    if (sprite) {
+        ctx.drawImage(sprite, x, y);
+    }
+}
+
+/**
+ * Sets the board to draw on the next frame. The current and ghost piece are
+ * cleared; draw them again after the board if they should stay.
+ * @param {Array<Array<number>>} boardData - 2D array representing the board state.
+ *                                            Each cell contains a colorIndex.
+ * @param {Array<Array<number>>} matchedPositions - Array of [row, col] positions that should flash.
+ */
+export function drawBoard(boardData, matchedPositions = []) {
+    sceneBoard = boardData && boardData.length > 0 ? boardData : null;
+    scenePiece = null;
+    sceneGhost = null;
+
+    if (matchedPositions && matchedPositions.length > 0) {
+        // Update the flashing cells if new matched positions are provided and not empty
+        startFlashingAnimation(matchedPositions, boardData);
+    } else if (flashingCells.size > 0 && performance.now() - flashStart >= FLASH_DURATION) {
+        // The flash is over; a new board shows whatever is in those cells now
+        stopFlashingAnimation();
+    }
+    requestFrame();
+}
+
+/**
+ * Animates balls dropping into the gaps left by cleared matches.
+ * @param {Array<Array<number>>} balls - [fromRow, col, toRow] for each ball that fell (fallingBalls from the server).
+ * @param {function(): void} redraw - Sets the scene (board, pieces) the balls fall into.
+ */
+export function startFallingAnimation(balls, redraw) {
+    fallingBalls = balls || [];
+    fallStart = performance.now();
+    fallProgress = fallingBalls.length > 0 ? 0 : 1;
+    redraw();
+    requestFrame();
 }
 
 /**
@@ -150,142 +355,110 @@ function startFlashingAnimation(matchedPositions, boardData) {
     
     console.log('Starting flash animation for positions:', matchedPositions);
     
-    // Only proceed if we have valid matched positions
-    if (!matchedPositions || matchedPositions.length === 0) {
-        console.log('No matched positions to flash');
-        return;
-    }
-    
-    // Convert matched positions to an array of cell objects with their colors
-    flashingCells = [];
-    for (let i = 0; i < matchedPositions.length; i++) {
-        const pos = matchedPositions[i];
+    for (const pos of matchedPositions) {
         if (Array.isArray(pos) && pos.length === 2) {
-            const row = pos[0];
-            const col = pos[1];
+            const [row, col] = pos;
             if (boardData[row] && boardData[row][col] !== undefined) {
-                flashingCells.push({
-                    row: row,
-                    col: col,
-                    color: boardData[row][col]
-                });
+                flashingCells.add(row * COLS + col);
             }
         }
     }
-    
-    console.log('Converted to flashingCells:', flashingCells);
-    
-    // Only start animation if there are cells to flash
-    if (flashingCells.length > 0) {
-        flashCount = 0;
-        flashingOn = true;
-        
-        // Flash 6 times (3 on, 3 off) over 1.2 seconds (200ms each)
-        flashingInterval = setInterval(() => {
-            flashingOn = !flashingOn;
-            flashCount++;
-            
-            console.log(`Flash cycle ${flashCount}/6, flashingOn: ${flashingOn}`);
-            
-            // Redraw the board with the current flash state
-            // We need to pass an empty array here to avoid infinite recursion
-            drawBoard(boardData, []);
-            
-            // Stop after 6 flashes (3 complete cycles)
-            if (flashCount >= 6) {
-                stopFlashingAnimation();
-            }
-        }, 200);
-    }
+    flashStart = performance.now();
 }
 
 /**
  * Stops the flashing animation.
  */
 function stopFlashingAnimation() {
-    if (flashingInterval) {
-        clearInterval(flashingInterval);
-        flashingInterval = null;
-    }
-    flashingCells = [];
+    flashingCells = new Set();
     flashingOn = true;
 }
 
 /**
- * Draws a game piece (line of 6 balls) on a given context.
- * @param {CanvasRenderingContext2D} ctx - The drawing context.
- * @param {Object} piece - The piece object { colors: [c1,c2,...c6], x: col, y: row, orientation: 0/90/180/270 }.
- *                         'colors' is an array of 6 color indices.
+ * Lists the cells a piece covers on the board.
+ * @param {Object} piece - The piece object { colors: [c1,c2,...], x: col, y: row, orientation: 0/90/180/270 }.
  *                         'x', 'y' are the board coordinates of the reference point of the piece.
  *                         'orientation' is in degrees: 0, 90, 180, or 270.
+ * @returns {Array<Array<number>>} [col, row, colorIndex] for each ball inside the board.
  */
-export function drawPiece(ctx, piece) {
-    if (!piece || !piece.colors) return;
+function pieceCells(piece) {
+    const cells = [];
+    if (!piece || !piece.colors) return cells;
 
     const { colors, x, y, orientation } = piece;
-    
-    // Debug log for piece orientation
-    // console.log(`Drawing piece at (${x}, ${y}) with orientation: ${orientation}°, colors:`, colors);
-
     for (let i = 0; i < colors.length; i++) {
-        const ballColorIndex = colors[i];
         let drawX = x, drawY = y;
         
         // Calculate position based on orientation
         switch (orientation) {
             case 0: // 0 degrees (horizontal →)
                 drawX = x + i;
-                drawY = y;
                 break;
             case 90: // 90 degrees (vertical ↓)
-                drawX = x;
                 drawY = y + i;
                 break;
             case 180: // 180 degrees (horizontal ←)
                 drawX = x - i;
-                drawY = y;
                 break;
             case 270: // 270 degrees (vertical ↑)
-                drawX = x;
                 drawY = y - i;
                 break;
             default: // Fallback to horizontal if orientation is invalid
                 drawX = x + i;
-                drawY = y;
                 break;
         }
         
-        drawBlock(ctx, drawX, drawY, ballColorIndex);
+        if (drawX >= 0 && drawX < COLS && drawY >= 0 && drawY < ROWS && sprites[colors[i]]) {
+            cells.push([drawX, drawY, colors[i]]);
+        }
     }
+    return cells;
 }
 
 /**
- * Draws the current falling piece on the main game canvas.
+ * Sets the current falling piece to draw over the board on the next frame.
  * @param {Object} piece - The current piece object.
  */
 export function drawCurrentPiece(piece) {
-    // Note: drawBoard should be called first to clear and draw static blocks.
-    // Then drawCurrentPiece overlays the moving piece.
-    if (piece) {
-        drawPiece(mainCtx, piece);
-    }
+    // Note: drawBoard should be called first; it clears the piece from the scene.
+    scenePiece = piece || null;
+    requestFrame();
 }
 
+/**
+ * Shows a faded copy of the current piece where a hard drop would land it.
+ * @param {Object} piece - The current piece object.
+ * @param {Object} ghost - { x, y, orientation } of the landing spot (ghostPiece from the server).
+ */
+export function drawGhostPiece(piece, ghost) {
+    if (!piece || !ghost || ghost.y === piece.y) {
+        sceneGhost = null;
+        return;
+    }
+    sceneGhost = { ...piece, x: ghost.x, y: ghost.y, orientation: ghost.orientation };
+    requestFrame();
+}
 
 /**
- * Draws the next piece on the next-piece-canvas.
+ * Sets the next piece shown on the next-piece-canvas.
  * The piece is assumed to be horizontal for display here.
- * @param {Array<number>} pieceColors - Array of 3 color indices for the next piece.
+ * @param {Array<number>} pieceColors - Array of pieceLength color indices for the next piece.
  */
 export function drawNextPiece(pieceColors) {
-    clearCanvas(nextCtx, nextCanvas.width, nextCanvas.height);
-    if (!pieceColors || pieceColors.length !== 3) return;
+    sceneNext = pieceColors && pieceColors.length === pieceLength ? pieceColors.join(',') : '';
+    requestFrame();
+}
 
-    // Draw the 3 balls horizontally in the small canvas
-    // Centered vertically (since canvas height is 1 * BLOCK_SIZE)
-    for (let i = 0; i < pieceColors.length; i++) {
-        drawBlock(nextCtx, i, 0, pieceColors[i]);
+/**
+ * Paints the next piece's balls horizontally in the small canvas.
+ */
+function paintNextPiece() {
+    clearCanvas(nextCtx, nextCanvas.width, nextCanvas.height);
+    if (sceneNext) {
+        // Centered vertically (since canvas height is 1 * BLOCK_SIZE)
+        sceneNext.split(',').forEach((colorIndex, i) => paintCell(nextCtx, i, 0, Number(colorIndex)));
     }
+    nextPainted = sceneNext;
 }
 
 console.log('Board module loaded. COLS:', COLS, 'ROWS:', ROWS, 'BLOCK_SIZE:', BLOCK_SIZE);
@@ -1,18 +1,27 @@
 // public/js/game-state.js - Client-side game state management
-import { getGameState as apiGetGameState, sendAction as apiSendAction, resetGame as apiResetGame } from './api-client.js';
-import { drawBoard, drawCurrentPiece, drawNextPiece } from './board.js';
-import { stopGameLoop, setGameSpeed } from './ui-controller.js'; // Added setGameSpeed for level changes
+import { getGameState as apiGetGameState, sendAction as apiSendAction, queueAction as apiQueueAction, resetGame as apiResetGame, setStateVersion, setAnimationLock, resetAnimationLock } from './api-client.js';
+import { configure as configureBoard, drawBoard, drawCurrentPiece, drawGhostPiece, drawNextPiece, startFallingAnimation, FALL_DURATION, FLASH_DURATION } from './board.js';
+import { stopGameLoop, setGameSpeed, setGravityCurve } from './ui-controller.js'; // Added setGameSpeed for level changes
 
 let currentGameState = {
     board: [],          // 2D array representing the game grid
     currentPiece: null, // { colors: [c1..c3], x: col, y: row, orientation: 0/90/180/270 }
+    ghostPiece: null,   // { x, y, orientation } where currentPiece would land on a hard drop
+    fallingBalls: [],   // [fromRow, col, toRow] for balls that fell in the last update
     nextPieceColors: [],// Array of 3 color indices for the next piece
     score: 0,
     level: 1,
     gameOver: false,
-    matchedPositions: [] // Positions of matched cells for flashing animation
+    matchedPositions: [], // Positions of matched cells for flashing animation
+    config: null,       // Variant being played: board size, piece length, gravity curve (full states only)
+    version: null       // Server state version this copy corresponds to
 };
 
+// Board drawn instead of currentGameState.board while a cascade is being replayed
+let displayBoard = null;
+let cascadeId = 0; // Bumped to abandon a replay when a newer one starts
+let cascadeVersion = null; // State version whose cascade was replayed (later full states repeat it)
+
 /**
  * Fetches the initial game state from the server and updates the local state.
  */
@@ -39,18 +48,53 @@ function updateGameState(newState) {
         return;
     }
     
+    // Delta responses only carry the cells that changed since the version we hold
+    if (newState.delta) {
+        if (newState.version === currentGameState.version) {
+            return; // Already applied (batched callers share one response)
+        }
+        if (newState.baseVersion !== currentGameState.version) {
+            console.warn(`State delta is against version ${newState.baseVersion} but we hold ${currentGameState.version}, resyncing`);
+            resyncGameState();
+            return;
+        }
+        const board = currentGameState.board.map(row => row.slice());
+        for (const [row, col, color] of newState.cells) {
+            board[row][col] = color;
+        }
+        const { cells, delta, baseVersion, ...rest } = newState;
+        newState = { ...rest, board };
+    }
+
     // Log if we received matched positions
     if (newState.matchedPositions && newState.matchedPositions.length > 0) {
         console.log('Received matched positions from server:', newState.matchedPositions);
     }
     
+    // Full states say which variant is played; resize before drawing its board
+    if (newState.config) {
+        configureBoard(newState.config);
+        setGravityCurve(newState.config);
+    }
+    
     // Update the game state
     currentGameState = { ...currentGameState, ...newState };
+    setStateVersion(currentGameState.version);
     console.log('Game state updated:', currentGameState);
     
     // Render the game with the updated state
     renderGame();
     updateUIDisplays();
+    
+    // Replay the cascade the server resolved; otherwise let balls that fell drop into place rather than jump there
+    if (newState.chainEvents && newState.chainEvents.length > 0) {
+        if (currentGameState.version !== cascadeVersion) {
+            cascadeVersion = currentGameState.version;
+            playChainEvents(newState.chainEvents);
+        }
+    } else if (newState.fallingBalls && newState.fallingBalls.length > 0) {
+        startFallingAnimation(newState.fallingBalls, renderGame);
+    }
 
     if (currentGameState.gameOver) {
         console.log('Game over detected in updateGameState, stopping loop.');
@@ -64,15 +108,84 @@ function updateGameState(newState) {
     }
 }
 
+/**
+ * Applies a state pushed by the server (see ui-controller.js).
+ * @param {object} newState - Full or delta state from the server.
+ */
+export function applyServerState(newState) {
+    updateGameState(newState);
+}
+
+/**
+ * Throws away the local copy and fetches the full state from the server.
+ */
+async function resyncGameState() {
+    setStateVersion(null);
+    try {
+        updateGameState(await apiGetGameState());
+    } catch (error) {
+        console.error('Error resyncing game state:', error);
+    }
+}
+
+/**
+ * Replays a cascade the server resolved in one request: each step flashes its
+ * matches, removes them and drops the balls above, then the next step begins.
+ * @param {Array<object>} events - chainEvents from the server, each
+ *                                 { matched: [[row, col, color]], falls: [[fromRow, col, toRow]], score }.
+ */
+async function playChainEvents(events) {
+    const id = ++cascadeId;
+    
+    // The board we hold is the one after the whole cascade; undo the steps
+    // from the last to get the board as each step began
+    const boards = [currentGameState.board];
+    for (let i = events.length - 1; i >= 0; i--) {
+        const board = boards[0].map(row => row.slice());
+        const falls = events[i].falls;
+        for (let j = falls.length - 1; j >= 0; j--) { // Higher balls may have fallen into lower balls' old cells
+            const [fromRow, col, toRow] = falls[j];
+            board[fromRow][col] = board[toRow][col];
+            board[toRow][col] = 0;
+        }
+        for (const [row, col, color] of events[i].matched) {
+            board[row][col] = color;
+        }
+        boards.unshift(board);
+    }
+    
+    const wait = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+    setAnimationLock(events.length * (FLASH_DURATION + FALL_DURATION));
+    for (let i = 0; i < events.length; i++) {
+        displayBoard = boards[i];
+        drawBoard(displayBoard, events[i].matched.map(([row, col]) => [row, col]));
+        await wait(FLASH_DURATION);
+        if (id !== cascadeId) return;
+        
+        displayBoard = boards[i + 1];
+        startFallingAnimation(events[i].falls, renderGame);
+        await wait(FALL_DURATION);
+        if (id !== cascadeId) return;
+    }
+    displayBoard = null;
+    resetAnimationLock();
+    renderGame();
+}
+
 /**
  * Renders the game board, current piece, and next piece.
  */
 function renderGame() {
-    if (currentGameState.board) {
+    if (displayBoard) {
+        // A cascade is being replayed; the next piece appears once it's done
+        drawBoard(displayBoard);
+    } else if (currentGameState.board) {
         // Pass matched positions for flashing animation
         drawBoard(currentGameState.board, currentGameState.matchedPositions);
     }
-    if (currentGameState.currentPiece) {
+    if (currentGameState.currentPiece && !displayBoard) {
+        // Draw the landing preview first so the falling piece stays on top of it
+        drawGhostPiece(currentGameState.currentPiece, currentGameState.ghostPiece);
         // Draw the current falling piece on top of the board
         drawCurrentPiece(currentGameState.currentPiece);
     }
@@ -115,8 +228,11 @@ function updateUIDisplays() {
  */
 export async function handleAction(actionType, actionData = {}) {
     try {
-        // Send the action to the server
-        const response = await apiSendAction(actionType, actionData);
+        // Send the action to the server. Gameplay input is coalesced per animation
+        // frame so a burst of key presses and a gravity tick share one request.
+        const response = actionType === 'start_game'
+            ? await apiSendAction(actionType, actionData)
+            : await apiQueueAction(actionType, actionData);
         
         // If we got a response (might be null if animation is in progress)
         if (response) {
@@ -221,6 +337,7 @@ export async function handleAction(actionType, actionData = {}) {
                     
                     // Update only the piece position in our local state
                     currentGameState.currentPiece = piece;
+                    currentGameState.ghostPiece = null; // The server's landing preview no longer applies
                     renderGame();
                 }
                 
@@ -237,8 +354,7 @@ export async function handleAction(actionType, actionData = {}) {
             // Normal case - update the game state with the server response
             updateGameState(response);
             
-            // If there are matched positions, they will be shown with flashing animation
-            // The api-client.js will handle sending the clear-matches request after animation
+            // Any cascade set off by the action is replayed from its chainEvents
         }
         
         return response;
@@ -256,11 +372,12 @@ export async function handleAction(actionType, actionData = {}) {
 
 /**
  * Resets the game state on the server and updates the local state.
+ * @param {string|null} [variant=null] - Game variant to switch to; null keeps the current one.
  */
-export async function resetGame() {
+export async function resetGame(variant = null) {
     console.log('Resetting game...');
     try {
-        const resetState = await apiResetGame();
+        const resetState = await apiResetGame(variant);
         updateGameState(resetState);
         console.log('Game reset to state:', currentGameState);
         document.getElementById('game-message').textContent = 'Game reset. Good luck!';
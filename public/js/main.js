@@ -9,10 +9,18 @@ import { initializeGame, handleAction, resetGame, getCurrentState } from './game
 import { init as initBoard } from './board.js';
 import { startGameLoop, stopGameLoop, pauseGame, resumeGame, isGamePaused } from './ui-controller.js';
 
+// Game variant to play, picked with e.g. ?variant=large (see /api/variants); the board
+// resizes itself to whatever variant the server's state says is being played
+const VARIANT = new URLSearchParams(window.location.search).get('variant');
+
 document.addEventListener('DOMContentLoaded', () => {
     console.log('DOM fully loaded and parsed');
     initBoard(); // Initialize the canvas and drawing contexts
-    initializeGame(); // Fetch initial game state and render
+    initializeGame().then(() => { // Fetch initial game state and render
+        if (VARIANT) {
+            resetGame(VARIANT); // Start a fresh game of the requested variant
+        }
+    });
     
     // Import the globalReset function from api-client.js
     // This is a bit of a hack, but it allows us to access the function from another module
@@ -1,11 +1,17 @@
 // public/js/ui-controller.js - Manages game loop and active UI interactions
-import { handleAction } from './game-state.js';
+import { handleAction, applyServerState } from './game-state.js';
 import { getCurrentState } from './game-state.js'; // To check game over status
+import { openStateStream } from './api-client.js';
+import { invalidate as invalidateBoard } from './board.js';
 
 let gameLoopInterval = null;
-const GAME_SPEED_START = 1000; // Milliseconds per tick (1 second)
-const GAME_SPEED_INCREMENT_FACTOR = 0.9; // Speed increases by 10% each level (multiplier)
-let currentSpeed = GAME_SPEED_START;
+let stateStream = null; // Server-sent events channel; the server runs gravity while it is open
+let streamUnavailable = false; // Set once the stream failed, so we stay on client-driven ticks
+// Gravity curve; the defaults are the standard game's, setGravityCurve() takes the server's
+let gameSpeedStart = 1000; // Milliseconds per tick (1 second)
+let gameSpeedIncrementFactor = 0.9; // Speed increases by 10% each level (multiplier)
+let gameSpeedMin = 100; // Fastest tick in milliseconds
+let currentSpeed = gameSpeedStart;
 let isLoopRunning = false;
 let isPaused = false;
 let pausedSpeed = null; // Store the speed when paused
@@ -29,6 +35,45 @@ async function gameTick() {
     }
 }
 
+/**
+ * Starts gravity: over the server push stream when possible, otherwise by polling.
+ * @param {number} level - The current level, to adjust polling speed.
+ */
+function startGravity(level) {
+    if (!streamUnavailable) {
+        stateStream = openStateStream(applyServerState, () => {
+            // Stream failed to open: fall back to client-driven ticks
+            streamUnavailable = true;
+            stateStream = null;
+            if (isLoopRunning && !isPaused) {
+                startGameLoop(getCurrentState().level);
+            }
+        });
+        if (stateStream) {
+            console.log('Gravity is driven by the server stream.');
+            return;
+        }
+    }
+    currentSpeed = gameSpeedStart * Math.pow(gameSpeedIncrementFactor, level - 1);
+    currentSpeed = Math.max(currentSpeed, gameSpeedMin); // Ensure speed doesn't get too fast
+    gameLoopInterval = setInterval(gameTick, currentSpeed);
+    console.log(`Game loop started with speed: ${currentSpeed}ms`);
+}
+
+/**
+ * Stops gravity, whichever way it is driven.
+ */
+function stopGravity() {
+    if (stateStream) {
+        stateStream.close();
+        stateStream = null;
+    }
+    if (gameLoopInterval) {
+        clearInterval(gameLoopInterval);
+        gameLoopInterval = null;
+    }
+}
+
 /**
  * Starts the game loop.
  * @param {number} [level=1] - The starting level, to adjust speed.
@@ -40,20 +85,14 @@ export function startGameLoop(level = 1) {
     }
     console.log(`Starting game loop at level ${level}.`);
     isLoopRunning = true;
-    currentSpeed = GAME_SPEED_START * Math.pow(GAME_SPEED_INCREMENT_FACTOR, level - 1);
-    currentSpeed = Math.max(currentSpeed, 100); // Ensure speed doesn't get too fast (e.g., min 100ms)
-    gameLoopInterval = setInterval(gameTick, currentSpeed);
-    console.log(`Game loop started with speed: ${currentSpeed}ms`);
+    startGravity(level);
 }
 
 /**
  * Stops the game loop.
  */
 export function stopGameLoop() {
-    if (gameLoopInterval) {
-        clearInterval(gameLoopInterval);
-        gameLoopInterval = null;
-    }
+    stopGravity();
     isLoopRunning = false;
     console.log('Game loop stopped.');
 }
@@ -66,16 +105,30 @@ export function stopGameLoop() {
 export function setGameSpeed(level) {
     if (!isLoopRunning) {
         // If loop isn't running, just update speed for next start
-        currentSpeed = GAME_SPEED_START * Math.pow(GAME_SPEED_INCREMENT_FACTOR, level - 1);
-        currentSpeed = Math.max(currentSpeed, 100);
+        currentSpeed = gameSpeedStart * Math.pow(gameSpeedIncrementFactor, level - 1);
+        currentSpeed = Math.max(currentSpeed, gameSpeedMin);
         return;
     }
+    if (stateStream) {
+        return; // The server adjusts its own tick speed to the level
+    }
     // If loop is running, stop and restart it with the new speed
     console.log(`Adjusting game speed for level ${level}.`);
     stopGameLoop();
     startGameLoop(level);
 }
 
+/**
+ * Uses the gravity curve of the variant the server plays for client-driven ticks.
+ * @param {object} config - The state's config (gravityStartInterval etc. in seconds).
+ */
+export function setGravityCurve(config) {
+    if (!config) return;
+    gameSpeedStart = config.gravityStartInterval * 1000;
+    gameSpeedIncrementFactor = config.gravitySpeedupFactor;
+    gameSpeedMin = config.gravityMinInterval * 1000;
+}
+
 /**
  * Pauses the game.
  */
@@ -86,11 +139,8 @@ export function pauseGame() {
     isPaused = true;
     pausedSpeed = currentSpeed; // Store current speed
     
-    // Stop the game loop but remember we're paused
-    if (gameLoopInterval) {
-        clearInterval(gameLoopInterval);
-        gameLoopInterval = null;
-    }
+    // Stop the game loop but remember we're paused (closing the stream stops server gravity)
+    stopGravity();
     
     // Draw a pause overlay on the game canvas
     const canvas = document.getElementById('game-canvas');
@@ -118,11 +168,13 @@ export function resumeGame() {
     console.log('Game resumed');
     isPaused = false;
     
-    // Restart the game loop with the saved speed
+    // The board only repaints cells that changed, so wipe the pause overlay explicitly
+    invalidateBoard();
+    
+    // Restart gravity at the current level
     if (pausedSpeed) {
-        currentSpeed = pausedSpeed;
-        gameLoopInterval = setInterval(gameTick, currentSpeed);
         isLoopRunning = true;
+        startGravity(getCurrentState().level);
     }
 }
 
@@ -0,0 +1,123 @@
+"""
+Colour Balls Replay Module
+Encodes GameState action logs and re-executes them without the HTTP layer
+"""
+
+import struct
+import sys
+import time
+from array import array
+from game_config import DEFAULT_CONFIG, PACKED_SIZE, GameConfig
+from game_logic import GameState
+
+# Header: magic, format version, seed; then the packed GameConfig (since version 2).
+# Versions 1 and 2 were played with the legacy piece sequence (see GameState.use_legacy_rng)
+LOG_MAGIC = b'CBRL'
+LOG_FORMAT_VERSION = 3
+_HEADER = struct.Struct('<4sBQ')
+
+
+def encode_log(seed, action_log, config=DEFAULT_CONFIG, legacy_rng=False):
+    """Packs a seed, the game's GameConfig and GameState.action_log into bytes (8 bytes per action).
+
+    Games on the legacy piece sequence (GameState.legacy_rng) are written as
+    version 2 logs, which have the same layout.
+    """
+    records = array('Q', action_log)
+    if sys.byteorder != 'little':
+        records.byteswap()
+    version = 2 if legacy_rng else LOG_FORMAT_VERSION
+    return _HEADER.pack(LOG_MAGIC, version, seed) + config.pack() + records.tobytes()
+
+
+def decode_log(data):
+    """Unpacks bytes from encode_log().
+
+    Returns:
+        Tuple of (seed, array of packed records, GameConfig, whether the game used the legacy piece sequence)
+
+    Raises:
+        ValueError: If the data isn't a replay log this version understands
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated replay log")
+    magic, version, seed = _HEADER.unpack_from(data)
+    if magic != LOG_MAGIC:
+        raise ValueError("Not a replay log")
+    # Version 1 logs have no config: they were all standard games
+    if version == 1:
+        start, config = _HEADER.size, DEFAULT_CONFIG
+    elif version in (2, LOG_FORMAT_VERSION):
+        start, config = _HEADER.size + PACKED_SIZE, GameConfig.unpack(data, _HEADER.size)
+    else:
+        raise ValueError(f"Unsupported replay log version {version}")
+    if (len(data) - start) % 8:
+        raise ValueError("Truncated replay log")
+    records = array('Q')
+    records.frombytes(data[start:])
+    if sys.byteorder != 'little':
+        records.byteswap()
+    return seed, records, config, version < 3
+
+
+def iter_records(action_log):
+    """Yields (tick_ms, action_type, delay_clear) for each packed log record."""
+    actions = GameState.LOG_ACTIONS
+    for record in action_log:
+        code = record & 0xFF
+        yield record >> 8, actions[code & ~GameState.LOG_DELAY_CLEAR], bool(code & GameState.LOG_DELAY_CLEAR)
+
+
+def replay(seed, action_log, state_factory=GameState, realtime=False, config=DEFAULT_CONFIG, legacy_rng=False):
+    """Re-executes a logged game and returns the resulting GameState.
+
+    Args:
+        seed: The logged game's GameState.seed
+        action_log: The logged game's GameState.action_log
+        state_factory: GameState class (or factory taking seed and config) to replay into
+        realtime: Wait between actions as long as the player did (for load generation);
+                  by default actions run back to back
+        config: The logged game's GameConfig
+        legacy_rng: The game used the legacy piece sequence (logs before version 3)
+
+    Returns:
+        The GameState after the last action
+    """
+    game_state = state_factory(seed=seed, config=config)
+    if legacy_rng:
+        game_state.use_legacy_rng()
+    started = time.monotonic()
+    for tick, action_type, delay_clear in iter_records(action_log):
+        if realtime:
+            wait = tick / 1000 - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+        if action_type == 'start_game':
+            game_state.start_game()
+        elif action_type == 'clear_matches':
+            game_state.clear_delayed_matches()
+        else:
+            game_state.perform_action(action_type, delay_clear=delay_clear)
+    return game_state
+
+
+def verify_score(seed, action_log, claimed_score, config=DEFAULT_CONFIG, legacy_rng=False):
+    """Returns True if replaying the log really produces claimed_score."""
+    return replay(seed, action_log, config=config, legacy_rng=legacy_rng).score == claimed_score
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a recorded Colour Balls game")
+    parser.add_argument('log', help="File written from encode_log()")
+    parser.add_argument('--realtime', action='store_true', help="Replay at the original pace")
+    args = parser.parse_args()
+
+    with open(args.log, 'rb') as f:
+        seed, action_log, config, legacy_rng = decode_log(f.read())
+    start = time.perf_counter()
+    final_state = replay(seed, action_log, realtime=args.realtime, config=config, legacy_rng=legacy_rng)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(action_log)} actions in {elapsed:.3f}s: score {final_state.score}, "
+          f"level {final_state.level}, game over {final_state.game_over}")
@@ -0,0 +1,336 @@
+"""
+Colour Balls Self-Play Module
+Plays large numbers of headless games across every core for balancing and AI training data
+"""
+
+import argparse
+import collections
+import dataclasses
+import json
+import logging
+import math
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+from ai_engine import AIPlayer
+from game_config import DEFAULT_CONFIG, VARIANTS, GameConfig
+from game_logic import GameState
+from simulator import DEFAULT_MAX_ACTIONS, random_policy
+
+logger = logging.getLogger(__name__)
+
+# GameConfig fields a run can override from the command line, and their types
+TUNABLE = {field.name: field.type for field in dataclasses.fields(GameConfig)}
+
+# Games played per task handed to a worker (and per chunk of the results file)
+DEFAULT_CHUNK_GAMES = 256
+
+# Cascades are counted by clear steps (1 = no chain reaction); the last bucket holds every deeper one
+CHAIN_DEPTH_BUCKETS = 8
+
+# Per-game columns of the results file and their array typecodes
+COLUMNS = (
+    ('seed', 'q'),
+    ('actions', 'q'),
+    ('pieces', 'q'),       # Pieces locked; the survival length of a game that topped out
+    ('score', 'q'),
+    ('level', 'q'),
+    ('game_over', 'b'),    # 1 if the board topped out, 0 if the game hit the action limit
+    ('max_chain', 'q'),    # Deepest cascade in clear steps (0 if nothing was ever cleared)
+) + tuple((f'cascades_{depth}', 'q') for depth in range(1, CHAIN_DEPTH_BUCKETS + 1))
+
+# Results file layout: header, JSON run description, then chunks of
+# (game count, every column's values back to back)
+RESULTS_MAGIC = b'CBSP'
+RESULTS_FORMAT_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sBI')  # magic, format version, description length
+_CHUNK_HEADER = struct.Struct('<I')  # games in the chunk
+
+
+class SelfPlayGameState(GameState):
+    """GameState that also counts locked pieces and cascades by depth."""
+
+    def reset(self, seed=None, config=None):
+        super().reset(seed, config)
+        self.pieces_locked = 0
+        self.cascade_depths = array('q', bytes(8 * CHAIN_DEPTH_BUCKETS))
+
+    def lock_piece(self, delay_clear=False):
+        if self.current_piece:
+            self.pieces_locked += 1
+        super().lock_piece(delay_clear)
+
+    def _resolve_chain(self, matched_positions, matches_found):
+        chain_reaction_count = super()._resolve_chain(matched_positions, matches_found)
+        self.cascade_depths[min(chain_reaction_count, CHAIN_DEPTH_BUCKETS - 1)] += 1
+        return chain_reaction_count
+
+
+def _make_policy(policy, seed):
+    if policy == 'random':
+        return random_policy(seed)
+    if policy == 'ai':
+        return AIPlayer().next_action
+    raise ValueError(f"Unknown policy '{policy}' (expected random or ai)")
+
+
+# Per worker process: the config of the run it is playing
+_worker_config = None
+
+
+def _init_worker(config):
+    global _worker_config
+    _worker_config = config
+
+
+def _play_chunk(task):
+    """Worker: plays the games of one chunk and returns their stats as column arrays.
+
+    Args:
+        task: Tuple of (first seed, number of games, policy name, max actions)
+    """
+    first_seed, num_games, policy, max_actions = task
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    game_state = SelfPlayGameState(seed=first_seed, config=_worker_config)
+    for seed in range(first_seed, first_seed + num_games):
+        # Every game has its own seeded RNGs, so results don't depend on which worker played it
+        game_state.reset(seed)
+        choose = _make_policy(policy, seed)
+        game_state.start_game()
+        actions = 0
+        while not game_state.game_over and actions < max_actions:
+            game_state.perform_action(choose(game_state))
+            actions += 1
+
+        depths = game_state.cascade_depths
+        deepest = max((depth + 1 for depth, count in enumerate(depths) if count), default=0)
+        for name, value in (('seed', seed), ('actions', actions), ('pieces', game_state.pieces_locked),
+                            ('score', game_state.score), ('level', game_state.level),
+                            ('game_over', int(game_state.game_over)), ('max_chain', deepest)):
+            columns[name].append(value)
+        for depth, count in enumerate(depths, 1):
+            columns[f'cascades_{depth}'].append(count)
+    return columns
+
+
+class SelfPlaySummary:
+    """Running totals over any number of games, in constant memory."""
+
+    def __init__(self):
+        self.games = 0
+        self.actions = 0
+        self.pieces = 0
+        self.topped_out = 0
+        self.score_total = 0
+        self.score_squares = 0
+        self.score_min = None
+        self.score_max = None
+        self.longest_survival = 0
+        self.cascades = [0] * CHAIN_DEPTH_BUCKETS  # Cascades by clear steps; the last bucket is "or more"
+
+    def add(self, columns):
+        """Adds a chunk of per-game columns (as returned by a worker or read_results())."""
+        scores = columns['score']
+        if not scores:
+            return
+        self.games += len(scores)
+        self.actions += sum(columns['actions'])
+        self.pieces += sum(columns['pieces'])
+        self.topped_out += sum(columns['game_over'])
+        self.score_total += sum(scores)
+        self.score_squares += sum(score * score for score in scores)
+        low, high = min(scores), max(scores)
+        self.score_min = low if self.score_min is None else min(self.score_min, low)
+        self.score_max = high if self.score_max is None else max(self.score_max, high)
+        self.longest_survival = max(self.longest_survival, max(columns['pieces']))
+        for depth in range(CHAIN_DEPTH_BUCKETS):
+            self.cascades[depth] += sum(columns[f'cascades_{depth + 1}'])
+
+    def as_dict(self):
+        """Returns the aggregates as a JSON-ready dict."""
+        games = self.games or 1
+        mean_score = self.score_total / games
+        variance = max(0.0, self.score_squares / games - mean_score * mean_score)
+        return {
+            'games': self.games,
+            'mean_score': mean_score,
+            'score_stdev': math.sqrt(variance),
+            'min_score': self.score_min or 0,
+            'max_score': self.score_max or 0,
+            'mean_pieces': self.pieces / games,
+            'mean_actions': self.actions / games,
+            'longest_survival': self.longest_survival,
+            'topped_out_rate': self.topped_out / games,
+            'cascades_by_depth': {str(depth): count for depth, count in enumerate(self.cascades, 1)},
+            'chain_reactions_per_game': sum(count * depth for depth, count in enumerate(self.cascades)) / games,
+        }
+
+
+def _write_header(f, description):
+    encoded = json.dumps(description, sort_keys=True).encode('utf-8')
+    f.write(_FILE_HEADER.pack(RESULTS_MAGIC, RESULTS_FORMAT_VERSION, len(encoded)))
+    f.write(encoded)
+
+
+def _write_chunk(f, columns):
+    f.write(_CHUNK_HEADER.pack(len(columns['seed'])))
+    for name, _ in COLUMNS:
+        values = columns[name]
+        if sys.byteorder != 'little':
+            values = array(values.typecode, values)
+            values.byteswap()
+        f.write(values.tobytes())
+
+
+def read_results(path, columns=None):
+    """Reads a results file from run_selfplay().
+
+    Args:
+        columns: Names of the columns to load (default all); the others are skipped
+                 without being decoded
+
+    Returns:
+        Tuple of (run description dict, iterator of per-chunk dicts of column arrays)
+
+    Raises:
+        ValueError: If the file isn't a results file this version understands
+    """
+    wanted = set(columns or (name for name, _ in COLUMNS))
+    f = open(path, 'rb')
+    header = f.read(_FILE_HEADER.size)
+    if len(header) < _FILE_HEADER.size:
+        f.close()
+        raise ValueError(f"{path} is not a self-play results file")
+    magic, version, length = _FILE_HEADER.unpack(header)
+    if magic != RESULTS_MAGIC or version != RESULTS_FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"{path} is not a self-play results file this version understands")
+    description = json.loads(f.read(length))
+
+    def chunks():
+        with f:
+            while True:
+                header = f.read(_CHUNK_HEADER.size)
+                if len(header) < _CHUNK_HEADER.size:
+                    return
+                (num_games,) = _CHUNK_HEADER.unpack(header)
+                chunk = {}
+                for name, typecode in COLUMNS:
+                    values = array(typecode)
+                    size = num_games * values.itemsize
+                    if name not in wanted:
+                        f.seek(size, os.SEEK_CUR)
+                        continue
+                    data = f.read(size)
+                    if len(data) < size:
+                        raise ValueError(f"{path} ends in the middle of a chunk")
+                    values.frombytes(data)
+                    if sys.byteorder != 'little':
+                        values.byteswap()
+                    chunk[name] = values
+                yield chunk
+    return description, chunks()
+
+
+def run_selfplay(num_games, seed=0, config=None, policy='random', max_actions=DEFAULT_MAX_ACTIONS,
+                 output=None, processes=None, chunk_games=DEFAULT_CHUNK_GAMES):
+    """Plays num_games games (seeds seed, seed + 1, ...) on a process pool.
+
+    Games are handed out in chunks and at most two chunks per worker are in
+    flight; each finished chunk is written to the results file and folded into
+    the summary before it is dropped, so memory doesn't grow with num_games.
+    Chunks are written in seed order, so the file is the same for any number
+    of processes.
+
+    Args:
+        config: GameConfig to play (default: the standard game)
+        policy: 'random' (weighted random input) or 'ai' (AIPlayer)
+        output: Optional path of a results file to write (see read_results())
+        processes: Worker processes (default: one per CPU)
+        chunk_games: Games per task
+
+    Returns:
+        SelfPlaySummary of every game
+    """
+    config = config or DEFAULT_CONFIG
+    _make_policy(policy, seed)  # Fail here rather than in every worker
+    processes = max(1, processes or os.cpu_count() or 1)
+    tasks = ((first, min(chunk_games, seed + num_games - first), policy, max_actions)
+             for first in range(seed, seed + num_games, chunk_games))
+
+    summary = SelfPlaySummary()
+    f = None
+    if output:
+        f = open(output, 'wb')
+        _write_header(f, {'config': dataclasses.asdict(config), 'policy': policy, 'seed': seed, 'games': num_games,
+                          'max_actions': max_actions, 'columns': [list(column) for column in COLUMNS]})
+    try:
+        with multiprocessing.Pool(processes, _init_worker, (config,)) as pool:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_play_chunk, (task,)))
+                if len(pending) >= 2 * processes:
+                    _collect(pending.popleft().get(), summary, f)
+            while pending:
+                _collect(pending.popleft().get(), summary, f)
+    finally:
+        if f is not None:
+            f.close()
+    return summary
+
+
+def _collect(columns, summary, f):
+    summary.add(columns)
+    if f is not None:
+        _write_chunk(f, columns)
+    logger.debug("Self-play: %s games done", summary.games)
+
+
+def _parse_override(text):
+    name, separator, value = text.partition('=')
+    name = name.strip().lower()
+    if not separator or name not in TUNABLE:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE with NAME one of {', '.join(TUNABLE)}")
+    try:
+        return name, TUNABLE[name](value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad value for {name}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Colour Balls games on every core and aggregate the results")
+    parser.add_argument('--games', type=int, default=10000, help="Number of games to play")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game")
+    parser.add_argument('--variant', choices=VARIANTS, default='standard', help="Game variant to start from")
+    parser.add_argument('--set', dest='overrides', type=_parse_override, action='append', default=[],
+                        metavar='NAME=VALUE', help=f"Override a GameConfig field ({', '.join(TUNABLE)})")
+    parser.add_argument('--policy', choices=('random', 'ai'), default='random', help="Who plays")
+    parser.add_argument('--max-actions', type=int, default=DEFAULT_MAX_ACTIONS, help="Action limit per game")
+    parser.add_argument('--output', help="Write per-game results to this file")
+    parser.add_argument('--summarize', metavar='PATH', help="Aggregate an existing results file instead of playing")
+    parser.add_argument('--processes', type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--chunk-games', type=int, default=DEFAULT_CHUNK_GAMES, help="Games per worker task")
+    args = parser.parse_args(argv)
+
+    if args.summarize:
+        description, chunks = read_results(args.summarize)
+        summary = SelfPlaySummary()
+        for chunk in chunks:
+            summary.add(chunk)
+        print(json.dumps({'run': description, 'summary': summary.as_dict()}, indent=2))
+        return 0
+
+    try:
+        config = dataclasses.replace(VARIANTS[args.variant], **dict(args.overrides))
+    except ValueError as e:
+        parser.error(str(e))
+    summary = run_selfplay(args.games, args.seed, config, args.policy, args.max_actions,
+                           args.output, args.processes, max(1, args.chunk_games))
+    print(json.dumps(summary.as_dict(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Colour Balls Session Registry Module
+Keeps one GameState per player so concurrent games don't share a board
+"""
+
+import atexit
+import logging
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from game_logic import GameState
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the registry limits (can be overridden from app.py)
+DEFAULT_MAX_SESSIONS = 5000
+DEFAULT_IDLE_TIMEOUT = 30 * 60  # Seconds without a request before a session is dropped
+DEFAULT_FLUSH_INTERVAL = 1.0  # Seconds between write-behind flushes to the session store
+
+
+def shard_for(session_id, num_shards):
+    """Returns which of num_shards owns a session ID (stable across processes, unlike hash())."""
+    return zlib.crc32(session_id.encode('utf-8')) % num_shards
+
+
+class SessionRegistry:
+    """Maps session IDs to GameState instances.
+
+    Sessions are kept in an OrderedDict ordered by last access, so lookups are
+    O(1) and both idle eviction and the live-session cap only ever touch the
+    oldest entries.
+
+    With a store (see session_store.py) the registry becomes a write-behind
+    cache in front of it: actions only touch the in-memory GameState, and a
+    background thread saves every game whose version changed once per
+    flush_interval, in one batch. Sessions pushed out by the cap are saved
+    and reloaded from the store when the player comes back, so at most one
+    flush interval of progress is lost on a restart.
+    """
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 state_factory=GameState, store=None, flush_interval=DEFAULT_FLUSH_INTERVAL, shard=None):
+        """
+        Args:
+            store: Optional SessionStore to persist games to
+            flush_interval: Seconds between write-behind flushes (0 to only flush
+                            when flush() is called)
+            shard: Optional (index, count); new session IDs are picked so that
+                   shard_for(session_id, count) == index (see cluster.py)
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.state_factory = state_factory
+        self.store = store
+        self.flush_interval = flush_interval
+        self.shard = shard
+        self._sessions = OrderedDict()  # session_id -> [game_state, last_seen, version last saved]
+        self._lock = threading.Lock()
+        self._evicted = {}  # session_id -> snapshot of games pushed out by the cap, not saved yet
+        self._expired = set()  # Idle session IDs to delete from the store
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._stop = threading.Event()
+        self._flusher = None
+        if store is not None and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name='session-flush', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def create(self):
+        """Create a new session and return (session_id, game_state)."""
+        game_state = self.state_factory()
+        session_id = self._new_session_id()
+        with self._lock:
+            self._insert(session_id, game_state, None)
+        return session_id, game_state
+
+    def _new_session_id(self):
+        """Random session ID, owned by this registry's shard if it has one."""
+        session_id = secrets.token_urlsafe(16)
+        if self.shard is not None:
+            index, count = self.shard
+            while shard_for(session_id, count) != index:  # count tries on average
+                session_id = secrets.token_urlsafe(16)
+        return session_id
+
+    def _insert(self, session_id, game_state, saved_version):
+        """Adds a session, making room first (caller holds the lock)."""
+        now = time.monotonic()
+        self._evict_idle(now)
+        # Drop the least recently used sessions if we're at the cap
+        while len(self._sessions) >= self.max_sessions:
+            old_id, (old_state, _, _) = self._sessions.popitem(last=False)
+            if self.store is not None:
+                # Saved by the next flush (even if unchanged, in case the stored copy was
+                # pruned); get() finds it here until then
+                with old_state.lock:
+                    self._evicted[old_id] = old_state.snapshot(include_log=self.store.keeps_logs)
+        self._sessions[session_id] = [game_state, now, saved_version]
+
+    def get(self, session_id):
+        """Return the GameState for session_id, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                if now - entry[1] > self.idle_timeout:
+                    self._expire(session_id)
+                    return None
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+            if self.store is None or session_id in self._expired:
+                return None
+            data = self._evicted.pop(session_id, None)
+            if data is not None:
+                # Pushed out by the cap but not saved yet; no I/O needed, and it still needs a flush
+                return self._insert_restored(session_id, self._restore(session_id, data), None)
+        return self._load(session_id)
+
+    def _load(self, session_id):
+        """Brings a session back from the store.
+
+        The store is read without holding the registry lock, so a slow load
+        doesn't hold up requests for other sessions.
+        """
+        data = self.store.load(session_id)
+        game_state = self._restore(session_id, data) if data is not None else None
+        with self._lock:
+            # Another request may have loaded, removed or even evicted the session meanwhile
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+            if session_id in self._expired:
+                return None
+            evicted = self._evicted.pop(session_id, None)
+            if evicted is not None:
+                return self._insert_restored(session_id, self._restore(session_id, evicted), None)
+            if data is None:
+                return None
+            # A game that came from the store is already saved
+            return self._insert_restored(session_id, game_state, game_state and game_state.version)
+
+    def _restore(self, session_id, data):
+        """Returns a GameState restored from a snapshot, or None if it can't be read."""
+        game_state = self.state_factory()
+        try:
+            game_state.restore(data)
+        except ValueError as e:
+            logger.warning("Discarding unreadable stored session %s: %s", session_id, e)
+            return None
+        return game_state
+
+    def _insert_restored(self, session_id, game_state, saved_version):
+        """Adds a restored session, or marks an unreadable one expired (caller holds the lock)."""
+        if game_state is None:
+            self._expired.add(session_id)
+            return None
+        self._insert(session_id, game_state, saved_version)
+        return game_state
+
+    def get_or_create(self, session_id):
+        """Look up session_id, creating a fresh session if it doesn't exist.
+
+        Returns:
+            Tuple of (session_id, game_state, created)
+        """
+        game_state = self.get(session_id)
+        if game_state is not None:
+            return session_id, game_state, False
+        session_id, game_state = self.create()
+        return session_id, game_state, True
+
+    def remove(self, session_id):
+        """Forget a session. Returns True if it existed."""
+        with self._lock:
+            existed = self._sessions.pop(session_id, None) is not None
+            if self.store is not None:
+                existed = self._evicted.pop(session_id, None) is not None or existed
+                self._expired.add(session_id)
+            return existed
+
+    def _expire(self, session_id):
+        """Drops a session for good, including its stored copy (caller holds the lock)."""
+        del self._sessions[session_id]
+        if self.store is not None:
+            self._expired.add(session_id)
+
+    def flush(self):
+        """Saves every game changed since its last save, in one batch.
+
+        Returns:
+            Number of games saved
+        """
+        if self.store is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = self._evicted
+                self._evicted = {}
+                expired = self._expired
+                self._expired = set()
+                dirty = [(session_id, entry) for session_id, entry in self._sessions.items()
+                         if entry[0].version != entry[2]]
+            keeps_logs = self.store.keeps_logs
+            for session_id, entry in dirty:
+                with entry[0].lock:  # Never save a game halfway through an action
+                    version = entry[0].version
+                    batch[session_id] = entry[0].snapshot(include_log=keeps_logs)
+                entry[2] = version
+            try:
+                if expired:
+                    self.store.delete_many(expired)
+                if batch:
+                    self.store.save_many(batch)
+            except Exception:
+                logger.exception("Session flush failed; %s games will be retried", len(batch))
+                with self._lock:
+                    for session_id, entry in dirty:
+                        entry[2] = None
+                    for session_id, data in batch.items():
+                        if session_id not in self._sessions:
+                            self._evicted.setdefault(session_id, data)
+                    self._expired |= expired
+                return 0
+            return len(batch)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            # Stored games idle for longer than the timeout are gone for good
+            self.store.prune(time.time() - self.idle_timeout)
+
+    def close(self):
+        """Stops the write-behind thread, saves what is left and closes the store."""
+        if self.store is None or self._stop.is_set():
+            return
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self.store.close()
+
+    def evict_idle(self):
+        """Drop every session that has been idle longer than idle_timeout.
+
+        Returns:
+            Number of sessions evicted
+        """
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now):
+        # Entries are ordered by last access, so stop at the first fresh one
+        evicted = 0
+        cutoff = now - self.idle_timeout
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry[1] > cutoff:
+                break
+            self._expire(session_id)
+            evicted += 1
+        return evicted
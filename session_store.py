@@ -0,0 +1,281 @@
+"""
+Colour Balls Session Store Module
+Storage backends that keep GameState snapshots outside the session registry
+"""
+
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Entries kept by MemoryStore before the least recently saved are dropped
+DEFAULT_MEMORY_ENTRIES = 100000
+
+# MmapStore file layout defaults
+DEFAULT_MMAP_SLOTS = 10000
+DEFAULT_MMAP_SLOT_SIZE = 512  # Fits a snapshot without the replay log with room to spare
+
+
+class SessionStore:
+    """Interface for session storage backends.
+
+    Stores map session IDs to GameState.snapshot() bytes. They are written in
+    batches by the SessionRegistry's write-behind flush, so save_many() should
+    make a whole batch durable at once rather than one entry at a time.
+    """
+
+    keeps_logs = True  # Whether snapshots should include the replay log
+
+    def load(self, session_id):
+        """Returns the stored snapshot for session_id, or None."""
+        raise NotImplementedError
+
+    def save_many(self, snapshots):
+        """Stores a dict of session_id -> snapshot bytes."""
+        raise NotImplementedError
+
+    def delete_many(self, session_ids):
+        """Forgets every session in session_ids (unknown IDs are ignored)."""
+        raise NotImplementedError
+
+    def prune(self, saved_before):
+        """Forgets sessions last saved before the given time.time() value; returns how many."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases files or connections held by the store."""
+
+
+class MemoryStore(SessionStore):
+    """In-process LRU of snapshots.
+
+    Doesn't survive a restart, but holds far more sessions than live GameState
+    objects would in the same memory (about 130 bytes plus the log per game).
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # session_id -> (snapshot, saved_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry[0] if entry else None
+
+    def save_many(self, snapshots):
+        now = time.time()
+        with self._lock:
+            for session_id, data in snapshots.items():
+                self._entries[session_id] = (data, now)
+                self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, session_ids):
+        with self._lock:
+            for session_id in session_ids:
+                self._entries.pop(session_id, None)
+
+    def prune(self, saved_before):
+        with self._lock:
+            # Entries are ordered by save time, so stop at the first recent one
+            pruned = 0
+            while self._entries and next(iter(self._entries.values()))[1] < saved_before:
+                self._entries.popitem(last=False)
+                pruned += 1
+            return pruned
+
+
+class MmapStore(SessionStore):
+    """Fixed-size slots in a memory-mapped file.
+
+    Saving is a memory copy into the slot owned by the session; the OS writes
+    the pages back, and each batch ends with one flush. The slot index is kept
+    in memory and rebuilt by scanning the file when it is reopened. Slots have
+    a fixed size, so snapshots are stored without the replay log.
+    """
+
+    keeps_logs = False
+
+    _FILE_HEADER = struct.Struct('<4sBII')  # magic, format version, slot count, slot size
+    _SLOT_HEADER = struct.Struct('<BBHd')   # in use, session ID length, data length, saved_at
+    MAGIC = b'CBSS'
+    FORMAT_VERSION = 1
+    MAX_SESSION_ID = 64
+
+    def __init__(self, path, slots=DEFAULT_MMAP_SLOTS, slot_size=DEFAULT_MMAP_SLOT_SIZE):
+        """
+        Args:
+            path: File to use; created if missing. An existing file keeps its own
+                  slot count and size.
+            slots: Capacity of a new file, in sessions
+            slot_size: Bytes per session in a new file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}  # session_id -> slot number
+        self._free = []
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            header = self._file.read(self._FILE_HEADER.size)
+            if len(header) < self._FILE_HEADER.size:
+                raise ValueError(f"{path} is not a session store")
+            magic, version, slots, slot_size = self._FILE_HEADER.unpack(header)
+            if magic != self.MAGIC or version != self.FORMAT_VERSION:
+                raise ValueError(f"{path} is not a session store this version understands")
+        else:
+            self._file.write(self._FILE_HEADER.pack(self.MAGIC, self.FORMAT_VERSION, slots, slot_size))
+            self._file.truncate(self._FILE_HEADER.size + slots * slot_size)
+            self._file.flush()
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_data = slot_size - self._SLOT_HEADER.size - self.MAX_SESSION_ID
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        # Rebuild the index from the slots in use
+        for slot in range(slots - 1, -1, -1):
+            in_use, id_length, _, _ = self._SLOT_HEADER.unpack_from(self._map, self._offset(slot))
+            if in_use:
+                start = self._offset(slot) + self._SLOT_HEADER.size
+                self._index[self._map[start:start + id_length].decode('ascii')] = slot
+            else:
+                self._free.append(slot)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _offset(self, slot):
+        return self._FILE_HEADER.size + slot * self.slot_size
+
+    def load(self, session_id):
+        with self._lock:
+            slot = self._index.get(session_id)
+            if slot is None:
+                return None
+            offset = self._offset(slot)
+            _, _, length, _ = self._SLOT_HEADER.unpack_from(self._map, offset)
+            start = offset + self._SLOT_HEADER.size + self.MAX_SESSION_ID
+            return self._map[start:start + length]
+
+    def save_many(self, snapshots):
+        now = time.time()
+        with self._lock:
+            for session_id, data in snapshots.items():
+                encoded_id = session_id.encode('ascii')
+                if len(encoded_id) > self.MAX_SESSION_ID or len(data) > self.max_data:
+                    logger.warning("Session %s doesn't fit in a %s byte slot, not saved", session_id, self.slot_size)
+                    continue
+                slot = self._index.get(session_id)
+                if slot is None:
+                    if not self._free:
+                        logger.warning("Session store %s is full, session %s not saved", self.path, session_id)
+                        continue
+                    slot = self._free.pop()
+                    self._index[session_id] = slot
+                offset = self._offset(slot)
+                start = offset + self._SLOT_HEADER.size
+                self._map[start:start + len(encoded_id)] = encoded_id
+                start += self.MAX_SESSION_ID
+                self._map[start:start + len(data)] = data
+                # Header last, so a slot is never marked in use before its data is there
+                self._SLOT_HEADER.pack_into(self._map, offset, 1, len(encoded_id), len(data), now)
+            self._map.flush()
+
+    def delete_many(self, session_ids):
+        with self._lock:
+            for session_id in session_ids:
+                slot = self._index.pop(session_id, None)
+                if slot is not None:
+                    self._map[self._offset(slot)] = 0
+                    self._free.append(slot)
+
+    def prune(self, saved_before):
+        with self._lock:
+            stale = [session_id for session_id, slot in self._index.items()
+                     if self._SLOT_HEADER.unpack_from(self._map, self._offset(slot))[3] < saved_before]
+        self.delete_many(stale)
+        return len(stale)
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+class SQLiteStore(SessionStore):
+    """Local SQLite database (WAL mode) with one row per session."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')  # Durable across process crashes, fast commits
+        self._db.execute('CREATE TABLE IF NOT EXISTS sessions '
+                         '(id TEXT PRIMARY KEY, data BLOB NOT NULL, saved_at REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sessions_saved_at ON sessions (saved_at)')
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute('SELECT data FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def save_many(self, snapshots):
+        now = time.time()
+        with self._lock, self._db:  # One transaction per batch
+            self._db.executemany('INSERT OR REPLACE INTO sessions (id, data, saved_at) VALUES (?, ?, ?)',
+                                 [(session_id, data, now) for session_id, data in snapshots.items()])
+
+    def delete_many(self, session_ids):
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM sessions WHERE id = ?', [(session_id,) for session_id in session_ids])
+
+    def prune(self, saved_before):
+        with self._lock, self._db:
+            return self._db.execute('DELETE FROM sessions WHERE saved_at < ?', (saved_before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_store(spec, shard=None):
+    """Builds a store from a spec string: 'memory', 'mmap:<path>' or 'sqlite:<path>'.
+
+    Args:
+        shard: Optional (index, count) of the worker process opening the store;
+               each shard gets its own file (<path>.<index>)
+
+    Returns:
+        A SessionStore, or None for an empty spec (sessions only live in the registry)
+    """
+    if not spec:
+        return None
+    kind, _, path = spec.partition(':')
+    if path and shard is not None:
+        path = f"{path}.{shard[0]}"
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'mmap' and path:
+        return MmapStore(path)
+    if kind == 'sqlite' and path:
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown session store '{spec}' (expected memory, mmap:<path> or sqlite:<path>)")
@@ -0,0 +1,106 @@
+"""
+Colour Balls Headless Simulator Module
+Plays games through GameState.perform_action without the HTTP layer
+"""
+
+import random
+from game_logic import GameState
+
+# Actions a simulated player picks from, with relative weights
+DEFAULT_ACTION_WEIGHTS = {
+    'move_left': 3,
+    'move_right': 3,
+    'rotate': 2,
+    'move_down': 4,
+    'hard_drop': 1,
+}
+
+# Stop a game after this many actions even if it isn't over
+DEFAULT_MAX_ACTIONS = 5000
+
+
+def random_policy(seed, weights=None):
+    """Returns a policy that picks weighted random actions from a seeded RNG."""
+    weights = weights or DEFAULT_ACTION_WEIGHTS
+    rng = random.Random(seed)
+    actions = list(weights)
+    action_weights = [weights[action] for action in actions]
+
+    def choose(game_state):
+        return rng.choices(actions, action_weights)[0]
+    return choose
+
+
+def scripted_policy(script):
+    """Returns a policy that replays a fixed list of actions, cycling when it runs out."""
+    script = list(script)
+    if not script:
+        raise ValueError("script must contain at least one action")
+    position = [0]
+
+    def choose(game_state):
+        action = script[position[0] % len(script)]
+        position[0] += 1
+        return action
+    return choose
+
+
+def simulate_game(seed, policy=None, max_actions=DEFAULT_MAX_ACTIONS, state_factory=GameState):
+    """Plays one game to game over (or max_actions) and returns its stats.
+
+    Args:
+        seed: Seeds both the piece colors and the default random policy
+        policy: Callable taking the GameState and returning the next action type
+        max_actions: Upper bound on actions played
+        state_factory: GameState class (or factory taking seed) to play with
+
+    Returns:
+        Dict with 'seed', 'actions', 'locks', 'score', 'level' and 'game_over'
+    """
+    policy = policy or random_policy(seed)
+    game_state = state_factory(seed=seed)
+    game_state.start_game()
+
+    actions = 0
+    locks = 0
+    while not game_state.game_over and actions < max_actions:
+        piece = game_state.current_piece
+        game_state.perform_action(policy(game_state))
+        actions += 1
+        if game_state.current_piece is not piece:
+            locks += 1  # A new piece only appears after the previous one locked
+
+    return {
+        'seed': seed,
+        'actions': actions,
+        'locks': locks,
+        'score': game_state.score,
+        'level': game_state.level,
+        'game_over': game_state.game_over,
+    }
+
+
+def run_simulation(num_games, seed=0, policy_factory=random_policy, max_actions=DEFAULT_MAX_ACTIONS,
+                   state_factory=GameState):
+    """Plays num_games games with seeds seed, seed + 1, ... and returns their stats.
+
+    Args:
+        policy_factory: Called with each game's seed to build its policy
+    """
+    return [simulate_game(game_seed, policy_factory(game_seed), max_actions, state_factory)
+            for game_seed in range(seed, seed + num_games)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play Colour Balls games headlessly")
+    parser.add_argument('--games', type=int, default=100, help="Number of games to play")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game")
+    parser.add_argument('--max-actions', type=int, default=DEFAULT_MAX_ACTIONS, help="Action limit per game")
+    args = parser.parse_args()
+
+    results = run_simulation(args.games, args.seed, max_actions=args.max_actions)
+    total_actions = sum(result['actions'] for result in results)
+    average_score = sum(result['score'] for result in results) / len(results)
+    print(f"Played {len(results)} games, {total_actions} actions, average score {average_score:.1f}")
@@ -0,0 +1,79 @@
+"""
+Colour Balls State Token Module
+Signs game snapshots so clients can carry their own state between stateless server instances
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+from game_logic import GameState
+
+# Bumped if the token layout (not the snapshot inside it) changes
+TOKEN_VERSION = b'1'
+
+
+class InvalidStateToken(ValueError):
+    """Raised when a state token is malformed, tampered with or signed with another secret."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class StateSigner:
+    """Turns a GameState into a signed token and back.
+
+    A token is TOKEN_VERSION, the base64 GameState.snapshot() (without the
+    replay log) and a base64 HMAC-SHA256 of both, joined by dots. Anything
+    that doesn't verify is rejected before the snapshot is parsed, and the
+    signature is compared in constant time.
+    """
+
+    def __init__(self, secret):
+        """
+        Args:
+            secret: Key shared by every server instance (bytes or str)
+        """
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        if not secret:
+            raise ValueError("A state token secret is required")
+        self._secret = secret
+
+    def _signature(self, payload):
+        return hmac.new(self._secret, TOKEN_VERSION + b'.' + payload, hashlib.sha256).digest()
+
+    def sign(self, game_state):
+        """Returns a token string carrying the whole game."""
+        payload = game_state.snapshot(include_log=False)
+        return '.'.join((TOKEN_VERSION.decode('ascii'), _b64encode(payload), _b64encode(self._signature(payload))))
+
+    def load(self, token, state_factory=GameState):
+        """Verifies a token from sign() and returns the GameState it carries.
+
+        Raises:
+            InvalidStateToken: If the token doesn't verify or can't be decoded
+        """
+        try:
+            version, payload, signature = token.split('.')
+            payload = _b64decode(payload)
+            signature = _b64decode(signature)
+        except (ValueError, binascii.Error):
+            raise InvalidStateToken("Malformed state token")
+        if version.encode('ascii', 'replace') != TOKEN_VERSION:
+            raise InvalidStateToken("Unsupported state token version")
+        if not hmac.compare_digest(self._signature(payload), signature):
+            raise InvalidStateToken("State token signature mismatch")
+
+        game_state = state_factory()
+        try:
+            game_state.restore(payload)
+        except ValueError as e:
+            # Correctly signed but unreadable, e.g. from a server with another board size
+            raise InvalidStateToken(str(e))
+        return game_state
@@ -0,0 +1,225 @@
+"""
+Colour Balls Static Assets Module
+Fingerprinted, precompressed copies of public/ held in memory and served with strong ETags
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from flask import Response, abort, request
+
+try:
+    import brotli  # Optional: br variants are only built when it is installed
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Page that references the other assets; served under its own name so it is always revalidated
+INDEX_PAGE = 'index.html'
+
+# Cache-Control for fingerprinted URLs (the content behind them never changes) and for everything else
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+# Extensions worth compressing; images and fonts are already compressed
+COMPRESSIBLE = ('.html', '.css', '.js', '.json', '.svg', '.txt')
+
+# Compressed variants that don't save at least this many bytes aren't kept
+MIN_COMPRESSION_SAVING = 64
+
+# Hex digits of the content hash used in fingerprinted names
+HASH_LENGTH = 12
+
+# src="..." and href="..." attributes in the index page
+_ATTRIBUTE_URL = re.compile(r'\b(src|href)="([^"]+)"')
+
+
+def source_files(root):
+    """Returns the path of every file under root (e.g. for the dev server's reloader)."""
+    paths = []
+    for directory, _, names in os.walk(root):
+        paths.extend(os.path.join(directory, name) for name in sorted(names))
+    return sorted(paths)
+
+
+def _content_type(path):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/json', 'image/svg+xml'):
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def _fingerprint(path, digest):
+    """board.js -> board.<digest>.js"""
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{digest}{extension}'
+
+
+class Asset:
+    """One file's bytes, with its compressed variants and ETags."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        self.content_type = _content_type(path)
+        # Encoding -> (body, strong ETag); each encoding is a different representation, so its own tag
+        self.variants = {'identity': (data, f'"{self.digest}"')}
+        if path.endswith(COMPRESSIBLE):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)  # mtime=0 keeps builds identical
+            if len(compressed) + MIN_COMPRESSION_SAVING <= len(data):
+                self.variants['gzip'] = (compressed, f'"{self.digest}-gz"')
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) + MIN_COMPRESSION_SAVING <= len(data):
+                    self.variants['br'] = (compressed, f'"{self.digest}-br"')
+
+    def select(self, accept_encodings):
+        """Returns (encoding, body, etag) of the smallest variant the client accepts."""
+        best = 'identity'
+        for encoding in ('gzip', 'br'):  # br, where built, is the smaller of the two
+            if encoding in self.variants and accept_encodings[encoding] > 0:
+                best = encoding
+        return (best,) + self.variants[best]
+
+
+class AssetCache:
+    """Every file under a directory, loaded once and served from memory.
+
+    Building the cache is the asset pipeline: each file is hashed and gets a
+    fingerprinted URL (board.js -> board.<hash>.js) served with an immutable
+    Cache-Control, so browsers keep it until the content changes. The index
+    page is rewritten to reference the fingerprinted URLs, and an import map
+    sends the JS modules' relative imports ('./board.js') to theirs too, so
+    the modules themselves are served byte for byte. The index page and the
+    plain URLs stay revalidated (no-cache plus a strong ETag, answered with
+    304 when unchanged). Compressible files are gzip'd (and brotli'd, when
+    the brotli package is installed) up front, so requests never touch the
+    disk or compress anything.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Directory to serve (public/)
+
+        Raises:
+            OSError: If a file under root can't be read
+        """
+        self.root = root
+        self._routes = {}  # URL path (relative to root, '/'-separated) -> (Asset, Cache-Control)
+        self.manifest = {}  # Path -> fingerprinted path
+        sources = {}
+        for full_path in source_files(root):
+            path = os.path.relpath(full_path, root).replace(os.sep, '/')
+            with open(full_path, 'rb') as f:
+                sources[path] = f.read()
+
+        for path, data in sources.items():
+            if path == INDEX_PAGE:
+                continue
+            asset = Asset(path, data)
+            hashed = _fingerprint(path, asset.digest)
+            self._routes[path] = (asset, REVALIDATE_CACHE)
+            self._routes[hashed] = (asset, IMMUTABLE_CACHE)
+            self.manifest[path] = hashed
+        if INDEX_PAGE in sources:
+            self._routes[INDEX_PAGE] = (Asset(INDEX_PAGE, self._rewrite_index(sources[INDEX_PAGE])),
+                                        REVALIDATE_CACHE)
+        logger.info("Loaded %s static assets from %s (brotli %s)", len(self.manifest) + (INDEX_PAGE in sources),
+                    root, 'on' if brotli is not None else 'off')
+
+    def _rewrite_index(self, data):
+        """Points the index page at the fingerprinted URLs and adds the JS import map."""
+        html = data.decode('utf-8')
+        html = _ATTRIBUTE_URL.sub(lambda m: f'{m.group(1)}="{self.manifest.get(m.group(2), m.group(2))}"', html)
+        imports = {f'/{path}': f'/{hashed}' for path, hashed in self.manifest.items() if path.endswith('.js')}
+        if imports:
+            # Must come before the first module script
+            import_map = f'<script type="importmap">{json.dumps({"imports": imports})}</script>\n    '
+            position = html.find('<script')
+            position = position if position >= 0 else html.find('</head>')
+            html = html[:position] + import_map + html[position:]
+        return html.encode('utf-8')
+
+    def __contains__(self, path):
+        return path in self._routes
+
+    def _built(self):
+        """Yields (path, Asset) for each fingerprinted file and the index page."""
+        for path, (asset, cache_control) in sorted(self._routes.items()):
+            if cache_control == IMMUTABLE_CACHE or path == INDEX_PAGE:
+                yield path, asset
+
+    def response(self, path):
+        """Serves a cached file to the current request (404 if there is none).
+
+        Picks the best encoding from Accept-Encoding and answers 304 when the
+        client's If-None-Match already has that representation.
+        """
+        route = self._routes.get(path)
+        if route is None:
+            abort(404)
+        asset, cache_control = route
+        encoding, body, etag = asset.select(request.accept_encodings)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        if request.if_none_match.contains_weak(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        return Response(body, content_type=asset.content_type, headers=headers)
+
+    def write(self, output_dir):
+        """Writes the fingerprinted files, their .gz/.br variants and manifest.json to a directory.
+
+        For serving public/ from a CDN or static host instead of the app.
+
+        Returns:
+            Number of files written
+        """
+        written = 0
+        for path, asset in self._built():
+            for encoding, (body, _) in asset.variants.items():
+                suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+                target = os.path.join(output_dir, *(path + suffix).split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(body)
+                written += 1
+        with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        return written + 1
+
+    def sizes(self):
+        """Yields (path, identity bytes, gzip bytes, br bytes) for each fingerprinted file and the index page."""
+        for path, asset in self._built():
+            yield (path,) + tuple(len(asset.variants[encoding][0]) if encoding in asset.variants else None
+                                  for encoding in ('identity', 'gzip', 'br'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the fingerprinted, precompressed static assets")
+    parser.add_argument('--root', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public'),
+                        help="Directory to build (default: public/)")
+    parser.add_argument('--output', help="Write the built files and manifest.json to this directory")
+    args = parser.parse_args(argv)
+
+    cache = AssetCache(args.root)
+    print(f"{'asset':<36} {'bytes':>8} {'gzip':>8} {'br':>8}")
+    for path, identity, gzipped, brotlied in cache.sizes():
+        print(f"{path:<36} {identity:>8} {gzipped or '-':>8} {brotlied or '-':>8}")
+    if args.output:
+        print(f"Wrote {cache.write(args.output)} files to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Colour Balls AI Engine Tests
+Placement search with and without lookahead
+"""
+
+import unittest
+from ai_engine import AIPlayer
+from game_config import VARIANTS
+from game_logic import GameState
+
+
+class AIPlayerTest(unittest.TestCase):
+
+    def _started_game(self, config=None):
+        game_state = GameState(seed=7, config=config)
+        game_state.start_game()
+        return game_state
+
+    def test_best_placement_without_lookahead(self):
+        game_state = self._started_game()
+        best = AIPlayer().best_placement(game_state)
+        self.assertIsNotNone(best)
+        self.assertEqual(best.actions[-1], 'hard_drop')
+
+    def test_best_placement_with_lookahead(self):
+        for name, config in VARIANTS.items():
+            with self.subTest(variant=name):
+                game_state = self._started_game(config)
+                before = game_state.board
+                best = AIPlayer(lookahead=True).best_placement(game_state)
+                self.assertIsNotNone(best)
+                self.assertEqual(game_state.board, before)  # The search puts the board back
+
+    def test_lookahead_plays_a_game(self):
+        game_state = self._started_game()
+        player = AIPlayer(lookahead=True)
+        for _ in range(200):
+            if game_state.game_over:
+                break
+            game_state.perform_action(player.next_action(game_state))
+        self.assertGreater(player.evaluations, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
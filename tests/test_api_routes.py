@@ -0,0 +1,58 @@
+"""
+Colour Balls API Route Tests
+Request validation of the game endpoints
+"""
+
+import unittest
+from app import create_app
+
+
+class ResetEndpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_app().test_client()
+        self.client.get('/api/state')  # Creates the session
+
+    def test_reset_without_a_body_keeps_the_variant(self):
+        self.client.post('/api/reset', json={'variant': 'large'})
+        response = self.client.post('/api/reset')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['config']['width'], 16)
+
+    def test_reset_to_a_variant(self):
+        response = self.client.post('/api/reset', json={'variant': 'long'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['config']['pieceLength'], 5)
+        self.assertEqual(len(response.json['board']), 24)
+
+    def test_rejects_malformed_bodies(self):
+        for body in (['standard'], 'standard', 3, {'variant': ['standard']}, {'variant': {'name': 'large'}},
+                     {'variant': 7}, {'variant': 'nope'}):
+            with self.subTest(body=body):
+                response = self.client.post('/api/reset', json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json)
+
+
+class ActionsEndpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_app().test_client()
+        self.client.post('/api/action', json={'type': 'start_game'})
+
+    def test_applies_a_batch(self):
+        response = self.client.post('/api/actions', json={'actions': [{'type': 'move_left'}, {'type': 'rotate'}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['applied'], 2)
+
+    def test_rejects_malformed_bodies(self):
+        for body in ([{'type': 'move_left'}], 'move_left', {}, {'actions': []}, {'actions': 'move_left'},
+                     {'actions': ['move_left']}):
+            with self.subTest(body=body):
+                response = self.client.post('/api/actions', json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json)
+
+
+if __name__ == '__main__':
+    unittest.main()
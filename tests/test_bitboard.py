@@ -0,0 +1,144 @@
+"""
+Colour Balls Bitboard Tests
+Run detection, gravity and packing checked against plain cell-by-cell versions
+"""
+
+import random
+import unittest
+from bitboard import BitBoard
+
+# (row step, col step) of each match direction, in BitBoard's order
+_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def _random_board(rng, width, height, num_colors, density, min_run=3):
+    board = BitBoard(width, height, num_colors, min_run)
+    for row in range(height):
+        for col in range(width):
+            if rng.random() < density:
+                board.set(row, col, rng.randint(1, num_colors))
+    return board
+
+
+def _line_key(direction, row, col):
+    return (row, col, col - row, col + row)[direction]
+
+
+def _naive_matches(rows, min_run, changed_positions=None):
+    """Every maximal run of min_run or more, walking each line cell by cell."""
+    height, width = len(rows), len(rows[0])
+    matched = set()
+    matches_found = 0
+    for direction, (row_step, col_step) in enumerate(_DIRECTIONS):
+        lines = None
+        if changed_positions is not None:
+            lines = {_line_key(direction, row, col) for row, col in changed_positions}
+        for row in range(height):
+            for col in range(width):
+                color = rows[row][col]
+                previous = (row - row_step, col - col_step)
+                if not color or (0 <= previous[0] < height and 0 <= previous[1] < width
+                                 and rows[previous[0]][previous[1]] == color):
+                    continue  # Not the first cell of a run
+                if lines is not None and _line_key(direction, row, col) not in lines:
+                    continue
+                run = [(row, col)]
+                r, c = row + row_step, col + col_step
+                while 0 <= r < height and 0 <= c < width and rows[r][c] == color:
+                    run.append((r, c))
+                    r, c = r + row_step, c + col_step
+                if len(run) >= min_run:
+                    matched.update(run)
+                    matches_found += 1
+    return matched, matches_found
+
+
+def _naive_gravity(rows):
+    height = len(rows)
+    result = [[0] * len(rows[0]) for _ in range(height)]
+    for col in range(len(rows[0])):
+        balls = [rows[row][col] for row in range(height) if rows[row][col]]
+        for offset, color in enumerate(reversed(balls)):
+            result[height - 1 - offset][col] = color
+    return result
+
+
+class BitBoardTest(unittest.TestCase):
+
+    def test_find_matches_agrees_with_cell_walk(self):
+        rng = random.Random(1)
+        for min_run in (3, 4, 5):
+            for _ in range(60):
+                width, height = rng.randint(3, 12), rng.randint(3, 16)
+                board = _random_board(rng, width, height, rng.randint(2, 5), rng.random(), min_run)
+                rows = [list(row) for row in board.to_rows()]
+                with self.subTest(min_run=min_run, size=(width, height)):
+                    self.assertEqual(board.find_matches(), _naive_matches(rows, min_run))
+
+    def test_find_matches_near_changed_cells(self):
+        rng = random.Random(2)
+        for _ in range(200):
+            board = _random_board(rng, 8, 12, 3, 0.7)
+            rows = [list(row) for row in board.to_rows()]
+            changed = [(rng.randrange(12), rng.randrange(8)) for _ in range(rng.randint(1, 3))]
+            with self.subTest(changed=changed):
+                self.assertEqual(board.find_matches(changed), _naive_matches(rows, 3, changed))
+
+    def test_runs_dont_wrap_between_rows(self):
+        board = BitBoard(4, 3, 2)
+        # The end of row 0 and the start of row 1 are next to each other in the bitboard
+        for row, col in ((0, 2), (0, 3), (1, 0), (1, 1)):
+            board.set(row, col, 1)
+        self.assertEqual(board.find_matches(), (set(), 0))
+
+    def test_long_run_counts_once(self):
+        board = BitBoard(7, 2, 2)
+        for col in range(7):
+            board.set(1, col, 2)
+        matched, matches_found = board.find_matches()
+        self.assertEqual(matches_found, 1)
+        self.assertEqual(matched, {(1, col) for col in range(7)})
+
+    def test_apply_gravity_agrees_with_cell_walk(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            board = _random_board(rng, 6, 10, 4, 0.4)
+            before = [list(row) for row in board.to_rows()]
+            moves = board.apply_gravity()
+            self.assertEqual(board.to_rows(), _naive_gravity(before))
+            self.assertEqual(board.hanging_columns(), [])
+            for from_row, col, to_row in moves:
+                self.assertEqual(board.get(to_row, col), before[from_row][col])
+
+    def test_apply_gravity_only_touches_given_columns(self):
+        board = BitBoard(3, 4, 2)
+        board.set(0, 0, 1)
+        board.set(0, 2, 2)
+        self.assertEqual(board.apply_gravity([2]), [(0, 2, 3)])
+        self.assertEqual(board.get(0, 0), 1)
+        self.assertEqual(board.hanging_columns(), [0])
+
+    def test_pack_round_trip(self):
+        rng = random.Random(4)
+        for _ in range(20):
+            board = _random_board(rng, rng.randint(1, 20), rng.randint(1, 20), 7, 0.5)
+            unpacked = BitBoard(board.width, board.height, 7)
+            unpacked.unpack(board.pack())
+            self.assertEqual(unpacked.to_rows(), board.to_rows())
+            self.assertEqual(unpacked.occupied, board.occupied)
+        with self.assertRaises(ValueError):
+            BitBoard(4, 4, 3).unpack(b'\x00')
+
+    def test_diff_lists_changed_cells(self):
+        board = BitBoard(4, 4, 3)
+        board.set(3, 0, 1)
+        board.set(3, 1, 2)
+        snapshot = board.snapshot()
+        board.set(3, 0, 3)
+        board.set(3, 1, 0)
+        board.set(2, 0, 1)
+        self.assertEqual(sorted(board.diff(snapshot)), [[2, 0, 1], [3, 0, 3], [3, 1, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
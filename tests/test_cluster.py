@@ -0,0 +1,35 @@
+"""
+Colour Balls Cluster Tests
+Finding a request's session in its raw headers, as the dispatcher does
+"""
+
+import unittest
+from api_routes import SESSION_COOKIE
+from cluster import _session_id_from_headers
+
+
+def _request(*headers):
+    return b'\r\n'.join((b'GET /api/state HTTP/1.1', b'Host: localhost') + headers) + b'\r\n\r\n'
+
+
+class SessionIdFromHeadersTest(unittest.TestCase):
+
+    def test_cookie(self):
+        head = _request(f'Cookie: theme=dark; {SESSION_COOKIE}=abc123'.encode('latin-1'))
+        self.assertEqual(_session_id_from_headers(head), 'abc123')
+
+    def test_header(self):
+        self.assertEqual(_session_id_from_headers(_request(b'x-session-id:  xyz ')), 'xyz')
+
+    def test_cookie_wins_over_header(self):
+        head = _request(b'X-Session-ID: from-header', f'Cookie: {SESSION_COOKIE}=from-cookie'.encode('latin-1'))
+        self.assertEqual(_session_id_from_headers(head), 'from-cookie')
+
+    def test_no_session(self):
+        for head in (_request(), _request(b'Cookie: theme=dark'), _request(b'Cookie: "broken'), b''):
+            with self.subTest(head=head):
+                self.assertIsNone(_session_id_from_headers(head))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+Colour Balls Game Config Tests
+GameConfig validation, packing and variant lookup
+"""
+
+import unittest
+from game_config import DEFAULT_CONFIG, PACKED_SIZE, VARIANTS, GameConfig, get_variant
+
+
+class GameConfigTest(unittest.TestCase):
+
+    def test_pack_round_trip(self):
+        for config in VARIANTS.values():
+            packed = config.pack()
+            self.assertEqual(len(packed), PACKED_SIZE)
+            self.assertEqual(GameConfig.unpack(packed), config)
+
+    def test_unpack_truncated(self):
+        with self.assertRaises(ValueError):
+            GameConfig.unpack(DEFAULT_CONFIG.pack()[:-1])
+
+    def test_rejects_invalid_settings(self):
+        for settings in ({'width': 2}, {'height': 256}, {'num_colors': 8}, {'num_colors': 0},
+                         {'match_length': 1}, {'piece_length': 11}, {'level_points': 0},
+                         {'width': 10.5}, {'width': True}, {'gravity_speedup_factor': 1.5},
+                         {'gravity_min_interval': 2.0}):
+            with self.subTest(settings=settings), self.assertRaises(ValueError):
+                GameConfig(**settings)
+
+
+class GetVariantTest(unittest.TestCase):
+
+    def test_known_variants(self):
+        self.assertIs(get_variant('standard'), DEFAULT_CONFIG)
+        for name, config in VARIANTS.items():
+            self.assertIs(get_variant(name), config)
+
+    def test_unknown_or_malformed_names(self):
+        for name in ('nope', '', None, 3, ['standard'], {'standard': 1}):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                get_variant(name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Colour Balls Game Logic Tests
+Chain reactions, delayed clears and versioned state deltas
+"""
+
+import unittest
+from game_logic import GameState
+
+
+def _cascade_game(seed=1):
+    """A started game whose bottom row clears and then sets off one chain reaction.
+
+    Row H-1 is 1 1 1 2 2 and row H-2 has a 2 above the third ball: clearing the
+    1s drops that 2 into the gap, completing 2 2 2.
+    """
+    game_state = GameState(seed=seed)
+    game_state.start_game()
+    bottom = game_state.BOARD_HEIGHT - 1
+    for col, color in enumerate((1, 1, 1, 2, 2)):
+        game_state._board.set(bottom, col, color)
+    game_state._board.set(bottom - 1, 2, 2)
+    return game_state
+
+
+class CascadeTest(unittest.TestCase):
+
+    def test_chain_reaction(self):
+        game_state = _cascade_game()
+        bottom = game_state.BOARD_HEIGHT - 1
+        game_state.update_game_state()
+        self.assertEqual(game_state.score, game_state.MATCH_POINTS + game_state.CHAIN_BONUS)
+        self.assertFalse(any(any(row) for row in game_state.board))
+
+        timeline = game_state.get_state_dict()['chainEvents']
+        self.assertEqual([step['score'] for step in timeline], [game_state.MATCH_POINTS, game_state.CHAIN_BONUS])
+        self.assertEqual(timeline[0]['matched'], [[bottom, 0, 1], [bottom, 1, 1], [bottom, 2, 1]])
+        self.assertEqual([list(fall) for fall in timeline[0]['falls']], [[bottom - 1, 2, bottom]])
+        self.assertEqual(timeline[1]['matched'], [[bottom, 2, 2], [bottom, 3, 2], [bottom, 4, 2]])
+
+    def test_delayed_clear_resolves_the_same_cascade(self):
+        game_state = _cascade_game()
+        game_state.update_game_state(delay_clear=True)
+        self.assertEqual(len(game_state.matched_positions), 3)
+        self.assertIsNone(game_state.current_piece)
+        self.assertEqual(game_state.score, 0)
+
+        self.assertTrue(game_state.clear_delayed_matches())
+        self.assertEqual(game_state.score, game_state.MATCH_POINTS + game_state.CHAIN_BONUS)
+        self.assertIsNotNone(game_state.current_piece)
+        self.assertFalse(game_state.clear_delayed_matches())
+
+    def test_level_follows_score(self):
+        game_state = _cascade_game()
+        game_state.score = game_state.LEVEL_POINTS - game_state.MATCH_POINTS
+        game_state.update_game_state()
+        self.assertEqual(game_state.level, 2)
+
+
+class StateDeltaTest(unittest.TestCase):
+
+    def _apply(self, board, cells):
+        board = [list(row) for row in board]
+        for row, col, color in cells:
+            board[row][col] = color
+        return board
+
+    def test_first_request_gets_full_state(self):
+        game_state = GameState(seed=2)
+        game_state.start_game()
+        state = game_state.get_state_delta(None)
+        self.assertFalse(state['delta'])
+        self.assertEqual(state['board'], game_state.board)
+        self.assertEqual(state['config']['width'], game_state.BOARD_WIDTH)
+
+    def test_delta_applies_to_the_base_board(self):
+        game_state = GameState(seed=3)
+        game_state.start_game()
+        state = game_state.get_state_delta(None)
+        board = state['board']
+        for _ in range(30):
+            if game_state.game_over:
+                break
+            version = state['version']
+            game_state.perform_action('hard_drop')
+            state = game_state.get_state_delta(version)
+            self.assertTrue(state['delta'])
+            self.assertEqual(state['baseVersion'], version)
+            self.assertGreater(state['version'], version)
+            board = self._apply(board, state['cells'])
+            self.assertEqual(board, game_state.board)
+
+    def test_missed_update_gets_full_state(self):
+        game_state = GameState(seed=4)
+        game_state.start_game()
+        stale = game_state.get_state_delta(None)['version']
+        game_state.perform_action('hard_drop')
+        game_state.get_state_delta(stale)  # Lost on the way to the client
+        game_state.perform_action('hard_drop')
+        state = game_state.get_state_delta(stale)
+        self.assertFalse(state['delta'])
+        self.assertEqual(state['board'], game_state.board)
+
+    def test_restore_forces_full_state(self):
+        game_state = GameState(seed=5)
+        game_state.start_game()
+        version = game_state.get_state_delta(None)['version']
+        game_state.restore(game_state.snapshot())
+        self.assertGreater(game_state.version, version)
+        self.assertFalse(game_state.get_state_delta(version)['delta'])
+
+    def test_state_update_only_when_changed(self):
+        game_state = GameState(seed=6)
+        game_state.start_game()
+        self.assertFalse(game_state.get_state_update()['delta'])
+        self.assertIsNone(game_state.get_state_update())
+        game_state.perform_action('move_left')
+        self.assertTrue(game_state.get_state_update()['delta'])
+        self.assertIsNone(game_state.get_state_update())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Colour Balls Replay Tests
+Replay log encoding, old log versions and score verification
+"""
+
+import struct
+import unittest
+from game_config import PACKED_SIZE, VARIANTS
+from game_logic import GameState
+from replay import LOG_FORMAT_VERSION, LOG_MAGIC, decode_log, encode_log, replay, verify_score
+from simulator import random_policy
+
+
+def _played(seed, actions=300, config=None, legacy_rng=False):
+    """A game played with random actions, some of them delayed clears."""
+    game_state = GameState(seed=seed, config=config)
+    if legacy_rng:
+        game_state.use_legacy_rng()
+    policy = random_policy(seed)
+    game_state.start_game()
+    for i in range(actions):
+        if game_state.game_over:
+            break
+        if game_state.matched_positions:
+            game_state.clear_delayed_matches()
+        else:
+            game_state.perform_action(policy(game_state), delay_clear=i % 2 == 0)
+    return game_state
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_replay_reproduces_the_game(self):
+        for name, config in VARIANTS.items():
+            with self.subTest(variant=name):
+                game_state = _played(5, config=config)
+                seed, log, decoded_config, legacy_rng = decode_log(
+                    encode_log(game_state.seed, game_state.action_log, game_state.config))
+                self.assertFalse(legacy_rng)
+                self.assertEqual(decoded_config, config)
+                replayed = replay(seed, log, config=decoded_config)
+                self.assertEqual(replayed.board, game_state.board)
+                self.assertEqual(replayed.score, game_state.score)
+
+    def test_legacy_games_replay_on_the_legacy_sequence(self):
+        game_state = _played(6, legacy_rng=True)
+        data = encode_log(game_state.seed, game_state.action_log, game_state.config, legacy_rng=True)
+        self.assertEqual(data[4], 2)
+        seed, log, config, legacy_rng = decode_log(data)
+        self.assertTrue(legacy_rng)
+        self.assertEqual(replay(seed, log, config=config, legacy_rng=True).board, game_state.board)
+
+    def test_reads_version_1_logs(self):
+        game_state = _played(7, legacy_rng=True)
+        # Version 1 had no config between the header and the records
+        records = encode_log(game_state.seed, game_state.action_log)[struct.calcsize('<4sBQ') + PACKED_SIZE:]
+        data = struct.pack('<4sBQ', LOG_MAGIC, 1, game_state.seed) + records
+        seed, log, config, legacy_rng = decode_log(data)
+        self.assertTrue(legacy_rng)
+        self.assertTrue(verify_score(seed, log, game_state.score, config=config, legacy_rng=legacy_rng))
+
+    def test_verify_score(self):
+        game_state = _played(8)
+        self.assertGreater(len(game_state.action_log), 0)
+        self.assertTrue(verify_score(game_state.seed, game_state.action_log, game_state.score))
+        self.assertFalse(verify_score(game_state.seed, game_state.action_log, game_state.score + 10))
+
+    def test_rejects_bad_logs(self):
+        data = encode_log(1, _played(9, 20).action_log)
+        self.assertEqual(data[4], LOG_FORMAT_VERSION)
+        for bad in (b'', data[:8], b'XXXX' + data[4:], data[:4] + bytes([99]) + data[5:], data[:-3]):
+            with self.subTest(data=bad[:6]), self.assertRaises(ValueError):
+                decode_log(bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Colour Balls Session Store Tests
+Every store backend, and the registry's write-behind cache in front of them
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from game_logic import GameState
+from session_manager import SessionRegistry, shard_for
+from session_store import MemoryStore, MmapStore, SQLiteStore, open_store
+
+
+class StoreTestMixin:
+    """Behaviour every SessionStore shares; subclasses provide make_store()."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = self.make_store()
+        self.addCleanup(self.store.close)
+
+    def test_save_and_load(self):
+        self.assertIsNone(self.store.load('missing'))
+        self.store.save_many({'a': b'first', 'b': b'second'})
+        self.store.save_many({'a': b'replaced'})
+        self.assertEqual(bytes(self.store.load('a')), b'replaced')
+        self.assertEqual(bytes(self.store.load('b')), b'second')
+        self.assertEqual(len(self.store), 2)
+
+    def test_delete(self):
+        self.store.save_many({'a': b'1', 'b': b'2'})
+        self.store.delete_many(['a', 'unknown'])
+        self.assertIsNone(self.store.load('a'))
+        self.assertEqual(bytes(self.store.load('b')), b'2')
+
+    def test_prune(self):
+        self.store.save_many({'a': b'1'})
+        self.assertEqual(self.store.prune(time.time() - 60), 0)
+        self.assertEqual(self.store.prune(time.time() + 1), 1)
+        self.assertIsNone(self.store.load('a'))
+
+    def test_holds_a_game(self):
+        game_state = GameState(seed=9)
+        game_state.start_game()
+        game_state.perform_action('hard_drop')
+        self.store.save_many({'game': game_state.snapshot(include_log=self.store.keeps_logs)})
+        restored = GameState()
+        restored.restore(bytes(self.store.load('game')))
+        self.assertEqual(restored.board, game_state.board)
+        self.assertEqual(restored.current_piece, game_state.current_piece)
+
+
+class MemoryStoreTest(StoreTestMixin, unittest.TestCase):
+
+    def make_store(self):
+        return MemoryStore()
+
+    def test_keeps_the_most_recent_entries(self):
+        store = MemoryStore(max_entries=2)
+        store.save_many({'a': b'1', 'b': b'2'})
+        store.save_many({'c': b'3'})
+        self.assertIsNone(store.load('a'))
+        self.assertEqual(len(store), 2)
+
+
+class MmapStoreTest(StoreTestMixin, unittest.TestCase):
+
+    def make_store(self):
+        return MmapStore(os.path.join(self.directory, 'sessions'), slots=4, slot_size=256)
+
+    def test_survives_reopening(self):
+        path = os.path.join(self.directory, 'reopened')
+        store = MmapStore(path, slots=4, slot_size=256)
+        store.save_many({'a': b'1', 'b': b'2'})
+        store.delete_many(['a'])
+        store.close()
+        store = MmapStore(path)
+        self.addCleanup(store.close)
+        self.assertEqual((store.slots, store.slot_size), (4, 256))
+        self.assertIsNone(store.load('a'))
+        self.assertEqual(bytes(store.load('b')), b'2')
+        store.save_many({'c': b'3', 'd': b'4', 'e': b'5'})  # Reuses the freed slot
+        self.assertEqual(len(store), 4)
+
+
+class SQLiteStoreTest(StoreTestMixin, unittest.TestCase):
+
+    def make_store(self):
+        return SQLiteStore(os.path.join(self.directory, 'sessions.db'))
+
+
+class OpenStoreTest(unittest.TestCase):
+
+    def test_specs(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertIsNone(open_store(''))
+        self.assertIsInstance(open_store('memory'), MemoryStore)
+        store = open_store('sqlite:' + os.path.join(directory, 'db'), shard=(1, 2))
+        self.addCleanup(store.close)
+        self.assertEqual(store.path, os.path.join(directory, 'db.1'))
+        for spec in ('sqlite', 'mmap:', 'redis:host'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                open_store(spec)
+
+
+class SessionRegistryTest(unittest.TestCase):
+
+    def _registry(self, **kwargs):
+        registry = SessionRegistry(store=MemoryStore(), flush_interval=0, **kwargs)
+        self.addCleanup(registry.close)
+        return registry
+
+    def test_flush_saves_changed_games_once(self):
+        registry = self._registry()
+        session_id, game_state = registry.create()
+        game_state.start_game()
+        self.assertEqual(registry.flush(), 1)
+        self.assertEqual(registry.flush(), 0)
+        game_state.perform_action('move_left')
+        self.assertEqual(registry.flush(), 1)
+        self.assertIsNotNone(registry.store.load(session_id))
+
+    def test_evicted_session_comes_back(self):
+        registry = self._registry(max_sessions=2)
+        first_id, first = registry.create()
+        first.start_game()
+        first.perform_action('hard_drop')
+        registry.create()
+        registry.create()  # Pushes the first session out
+        self.assertNotIn(first_id, registry)
+
+        restored = registry.get(first_id)  # Not flushed yet
+        self.assertEqual(restored.board, first.board)
+        registry.create()
+        registry.create()
+        registry.flush()
+        restored = registry.get(first_id)  # From the store this time
+        self.assertEqual(restored.board, first.board)
+        self.assertEqual(restored.score, first.score)
+
+    def test_removed_session_stays_gone(self):
+        registry = self._registry()
+        session_id, _ = registry.create()
+        registry.flush()
+        self.assertTrue(registry.remove(session_id))
+        self.assertIsNone(registry.get(session_id))
+        registry.flush()
+        self.assertIsNone(registry.store.load(session_id))
+
+    def test_unreadable_stored_session_is_dropped(self):
+        registry = self._registry()
+        registry.store.save_many({'broken': b'not a snapshot'})
+        self.assertIsNone(registry.get('broken'))
+        _, _, created = registry.get_or_create('broken')
+        self.assertTrue(created)
+
+    def test_idle_sessions_expire(self):
+        registry = SessionRegistry(idle_timeout=0)
+        session_id, _ = registry.create()
+        time.sleep(0.01)
+        self.assertIsNone(registry.get(session_id))
+        self.assertEqual(len(registry), 0)
+
+    def test_shard_owns_new_sessions(self):
+        registry = SessionRegistry(shard=(2, 3))
+        for _ in range(20):
+            session_id, _ = registry.create()
+            self.assertEqual(shard_for(session_id, 3), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Colour Balls Snapshot Tests
+GameState.snapshot()/restore() round trips and piece sequence continuity
+"""
+
+import random
+import time
+import unittest
+from game_config import GameConfig
+from game_logic import _SNAPSHOT_FIELDS, _SNAPSHOT_FIELDS_V3, _SNAPSHOT_HEADER, GameState
+from simulator import random_policy
+
+
+def _play(game_state, actions, seed=0):
+    """Starts a game and plays random actions, stopping early at game over."""
+    policy = random_policy(seed)
+    game_state.start_game()
+    for _ in range(actions):
+        if game_state.game_over:
+            break
+        game_state.perform_action(policy(game_state))
+    return game_state
+
+
+def _as_old_format(data, format_version, clear_flags=0):
+    """Rewrites a snapshot in the narrower fixed-field layout of formats 1 to 3."""
+    start = _SNAPSHOT_HEADER.size
+    fields = list(_SNAPSHOT_FIELDS.unpack_from(data, start))
+    fields[5] &= ~clear_flags
+    return (data[:4] + bytes([format_version]) + data[5:start] + _SNAPSHOT_FIELDS_V3.pack(*fields)
+            + data[start + _SNAPSHOT_FIELDS.size:])
+
+
+def _public_state(game_state):
+    return (game_state.board, game_state.current_piece, game_state.next_piece_colors, game_state.score,
+            game_state.level, game_state.game_over, game_state.game_started, game_state.seed,
+            list(game_state.action_log))
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                game_state = _play(GameState(seed=seed), 300, seed)
+                restored = GameState()
+                restored.restore(game_state.snapshot())
+                self.assertEqual(_public_state(restored), _public_state(game_state))
+
+    def test_restored_game_plays_on_identically(self):
+        game_state = _play(GameState(seed=3), 200, 3)
+        restored = GameState()
+        restored.restore(game_state.snapshot(include_log=False))
+        policy = random_policy(99)
+        for _ in range(300):
+            if game_state.game_over:
+                break
+            action = policy(game_state)
+            game_state.perform_action(action)
+            restored.perform_action(action)
+        self.assertEqual(restored.board, game_state.board)
+        self.assertEqual(restored.score, game_state.score)
+
+    def test_rng_continuity(self):
+        game_state = GameState(seed=11)
+        for _ in range(1000):
+            game_state._generate_new_piece_colors()
+        restored = GameState()
+        restored.restore(game_state.snapshot(include_log=False))
+        self.assertFalse(restored.legacy_rng)
+        self.assertEqual([restored._generate_new_piece_colors() for _ in range(50)],
+                         [game_state._generate_new_piece_colors() for _ in range(50)])
+
+    def test_restore_doesnt_replay_draws(self):
+        game_state = GameState(seed=12)
+        game_state._rng_draws = 10 ** 9  # Replaying this many draws would take minutes
+        restored = GameState()
+        start = time.perf_counter()
+        restored.restore(game_state.snapshot(include_log=False))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(restored._generate_new_piece_colors(), game_state._generate_new_piece_colors())
+
+    def test_pieces_have_distinct_colors(self):
+        game_state = GameState(seed=13)
+        for _ in range(1000):
+            colors = game_state._generate_new_piece_colors()
+            self.assertEqual(len(set(colors)), game_state.NUM_BALL_COLORS)
+            self.assertTrue(set(colors) <= set(game_state.AVAILABLE_COLORS))
+
+    def test_format_2_snapshot_keeps_legacy_sequence(self):
+        game_state = GameState(seed=21)
+        game_state.use_legacy_rng()
+        game_state.start_game()
+        reference = random.Random(21)
+        self.assertEqual(game_state.current_piece['colors'], reference.sample(game_state.AVAILABLE_COLORS, 3))
+        data = _as_old_format(game_state.snapshot(), 2, clear_flags=128)  # Format 2 had no legacy flag
+
+        restored = GameState()
+        restored.restore(data)
+        self.assertTrue(restored.legacy_rng)
+        self.assertEqual(_public_state(restored), _public_state(game_state))
+        # ...and a format 3 snapshot of that game still does
+        again = GameState()
+        again.restore(restored.snapshot())
+        self.assertTrue(again.legacy_rng)
+        self.assertEqual([again._generate_new_piece_colors() for _ in range(20)],
+                         [game_state._generate_new_piece_colors() for _ in range(20)])
+
+    def test_round_trip_on_the_largest_board(self):
+        game_state = GameState(seed=5, config=GameConfig(width=255, height=255, num_colors=7))
+        game_state.start_game()
+        game_state.current_piece['x'] = 250
+        game_state.current_piece['y'] = 200
+        restored = GameState()
+        restored.restore(game_state.snapshot())
+        self.assertEqual(restored.config, game_state.config)
+        self.assertEqual(_public_state(restored), _public_state(game_state))
+
+    def test_round_trip_at_high_levels(self):
+        game_state = _play(GameState(seed=6, config=GameConfig(level_points=1)), 20)
+        game_state.score = 10 ** 9
+        game_state.level = game_state.score + 1
+        restored = GameState()
+        restored.restore(game_state.snapshot())
+        self.assertEqual((restored.score, restored.level), (game_state.score, game_state.level))
+
+    def test_reads_format_3(self):
+        game_state = _play(GameState(seed=8), 100, 8)
+        restored = GameState()
+        restored.restore(_as_old_format(game_state.snapshot(), 3))
+        self.assertEqual(_public_state(restored), _public_state(game_state))
+
+    def test_rejects_bad_data(self):
+        data = _play(GameState(seed=4), 50).snapshot()
+        for bad in (b'', data[:10], b'XXXX' + data[4:], data[:4] + bytes([99]) + data[5:], data[:-3]):
+            with self.assertRaises(ValueError):
+                GameState().restore(bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
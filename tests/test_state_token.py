@@ -0,0 +1,64 @@
+"""
+Colour Balls State Token Tests
+Signed snapshots carried by the client, and everything that must be rejected
+"""
+
+import unittest
+from game_config import GameConfig
+from game_logic import GameState
+from state_token import InvalidStateToken, StateSigner, _b64encode
+
+
+class StateSignerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.signer = StateSigner('secret')
+        self.game_state = GameState(seed=10)
+        self.game_state.start_game()
+        self.game_state.perform_action('hard_drop')
+
+    def test_round_trip(self):
+        loaded = self.signer.load(self.signer.sign(self.game_state))
+        self.assertEqual(loaded.board, self.game_state.board)
+        self.assertEqual(loaded.current_piece, self.game_state.current_piece)
+        self.assertEqual(loaded.score, self.game_state.score)
+        self.assertEqual(loaded._generate_new_piece_colors(), self.game_state._generate_new_piece_colors())
+
+    def test_rejects_tampering(self):
+        version, payload, signature = self.signer.sign(self.game_state).split('.')
+        flipped = payload[:10] + ('A' if payload[10] != 'A' else 'B') + payload[11:]
+        for token in ('.'.join((version, flipped, signature)), '.'.join(('2', payload, signature)),
+                      '.'.join((version, payload, signature[::-1]))):
+            with self.subTest(token=token), self.assertRaises(InvalidStateToken):
+                self.signer.load(token)
+
+    def test_rejects_other_secret(self):
+        with self.assertRaises(InvalidStateToken):
+            StateSigner(b'other').load(self.signer.sign(self.game_state))
+
+    def test_rejects_malformed_tokens(self):
+        for token in ('', 'abc', 'a.b', 'a.b.c.d', '1.!!!.???', 'é.a.b'):
+            with self.subTest(token=token), self.assertRaises(InvalidStateToken):
+                self.signer.load(token)
+
+    def test_carries_the_game_config(self):
+        wide = GameState(seed=1, config=GameConfig(width=12))
+        wide.start_game()
+        loaded = self.signer.load(self.signer.sign(wide))
+        self.assertEqual(loaded.config, wide.config)
+        self.assertEqual(loaded.board, wide.board)
+
+    def test_rejects_signed_but_unreadable_snapshot(self):
+        payload = self.game_state.snapshot(include_log=False)[:-5]
+        token = '.'.join(('1', _b64encode(payload), _b64encode(self.signer._signature(payload))))
+        with self.assertRaises(InvalidStateToken):
+            self.signer.load(token)
+
+    def test_requires_a_secret(self):
+        for secret in ('', b''):
+            with self.assertRaises(ValueError):
+                StateSigner(secret)
+
+
+if __name__ == '__main__':
+    unittest.main()
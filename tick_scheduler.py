@@ -0,0 +1,124 @@
+"""
+Colour Balls Tick Scheduler Module
+Runs gravity for every streaming session from a single asyncio event loop
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TickScheduler:
+    """Central gravity clock for all sessions with an open push stream.
+
+    Sessions sit in a heap ordered by when their next tick is due, so one
+    event loop thread sleeps until the earliest deadline, ticks every session
+    that is due and reschedules each at the interval for its current level
+    (GameState.tick_interval()). Streams just wait to be told a tick happened.
+    """
+
+    def __init__(self, tick):
+        """
+        Args:
+            tick: Callable taking a GameState; advances it by one gravity step
+        """
+        self.tick = tick
+        self.max_lag = 0.0  # Worst observed lateness of a tick, in seconds
+        self._heap = []  # (due_time, token, session_id)
+        self._tokens = itertools.count()  # Unique per heap entry; also breaks ties between due times
+        self._sessions = {}  # session_id -> [game_state, token of its live heap entry, set of subscriber Events]
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def subscribe(self, session_id, game_state):
+        """Starts ticking a session (if it isn't already) and returns an Event set after each tick."""
+        self._ensure_running()
+        ticked = threading.Event()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                token = next(self._tokens)
+                entry = [game_state, token, set()]
+                self._sessions[session_id] = entry
+                self._loop.call_soon_threadsafe(self._schedule, session_id, token)
+            entry[2].add(ticked)
+        return ticked
+
+    def unsubscribe(self, session_id, ticked):
+        """Removes a subscriber; the session stops ticking once nobody is listening."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            entry[2].discard(ticked)
+            if not entry[2]:
+                # Any queued heap entry is skipped because the session is gone
+                del self._sessions[session_id]
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                            name='tick-scheduler', daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        ready.set()
+        self._loop.run_until_complete(self._run())
+
+    def _schedule(self, session_id, token):
+        """Queues a session's next tick (runs on the event loop thread).
+
+        token must be the session's current one, so a session that was
+        unsubscribed (or already rescheduled) is never queued twice.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[1] != token:
+                return
+            entry[1] = next(self._tokens)
+            due = self._loop.time() + entry[0].tick_interval()
+            heapq.heappush(self._heap, (due, entry[1], session_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = self._loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, token, session_id = heapq.heappop(self._heap)
+                with self._lock:
+                    entry = self._sessions.get(session_id)
+                    if entry is None or entry[1] != token:
+                        continue  # Unsubscribed since this was queued
+                    game_state, subscribers = entry[0], list(entry[2])
+                self.max_lag = max(self.max_lag, now - due)
+                try:
+                    self.tick(game_state)
+                except Exception:
+                    # One broken game must not stop gravity for everyone else
+                    logger.exception("Gravity tick failed for session %s", session_id)
+                for ticked in subscribers:
+                    ticked.set()
+                self._schedule(session_id, token)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - self._loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass